@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+"""End-to-end benchmark of a detector response chain, guarded by a baseline.
+
+The chain, built from the nodes of the package:
+    - the nominal LSNL curve is refined within the graph (RefineCurve) and
+      converted to the pointwise distortion matrix (AxisDistortionMatrixPointwise)
+    - the energy resolution matrix for each detector (EnergyResolution.replicate)
+    - the spectra for each (detector, source) pair are distorted, smeared and
+      rebinned to the analysis binning (Rebin.replicate)
+
+The stages, timed:
+    - construction: building and closing the graph
+    - first_evaluation: the first evaluation of all the outputs, including the
+      JIT compilation (with an empty numba cache unless `--warm-cache`)
+    - reevaluation_eres: the re-evaluation after a change of the resolution
+    - reevaluation_lsnl: the re-evaluation after a change of the LSNL curve
+
+The timings are compared to the baseline (benchmarks/baseline/detector.json).
+The stages, slower than the baseline by more than `--threshold`, are reported
+as regressions and the script exits with code 1. A baseline without the
+timings of all the stages or with another configuration is an error.
+`--update-baseline` writes the current timings to the baseline instead of
+comparing. The baseline is meaningful only for the machine it was measured
+on, see its `meta` section.
+
+Usage (from the root of the repository):
+    python -m benchmarks.detector [--bins 2000] [--detectors 4] [--sources 8]
+        [--update-baseline] [--output detector.json]
+"""
+
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from json import dump, load
+from os import cpu_count
+from os.path import abspath, dirname, join
+from platform import machine, python_version
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from numpy import __version__ as numpy_version
+from numpy import exp, linspace
+
+from dgf_detector.warmup import set_cache_dir
+
+BaselinePath = join(dirname(abspath(__file__)), "baseline", "detector.json")
+Stages = ("construction", "first_evaluation", "reevaluation_eres", "reevaluation_lsnl")
+
+DefaultConfig = {
+    "bins": 2000,
+    "bins_analysis": 200,
+    "coarse_points": 60,
+    "refine_times": 4,
+    "detectors": 4,
+    "sources": 8,
+    "mode": "numba",
+    "rebin_method": "matrix",
+}
+
+# the parameters of the energy resolution
+_resolution_parameters = {"a_nonuniform": 0.016, "b_stat": 0.081, "c_noise": 0.026}
+
+
+def _lsnl_nominal(x, scale: float = 1.0):
+    return 1.0 - scale * 0.05 * exp(-x / 3.0)
+
+
+def build_chain(config: dict) -> dict:
+    """Build the graph, return the nodes and the outputs, needed by the benchmark"""
+    from dagflow.core.graph import Graph
+    from dagflow.core.storage import NodeStorage
+    from dagflow.lib.common import Array
+    from dagflow.lib.linalg import VectorMatrixProduct
+
+    from dgf_detector.AxisDistortionMatrixPointwise import AxisDistortionMatrixPointwise
+    from dgf_detector.EnergyResolution import EnergyResolution
+    from dgf_detector.Rebin import Rebin
+    from dgf_detector.RefineCurve import RefineCurve
+
+    nbins = config["bins"]
+    mode = config["mode"]
+    detectors = tuple(f"D{i}" for i in range(config["detectors"]))
+    sources = tuple(f"S{i}" for i in range(config["sources"]))
+    keys = tuple((detector, source) for detector in detectors for source in sources)
+
+    edges = linspace(0.0, 12.0, nbins + 1)
+    edges_analysis = edges[:: nbins // config["bins_analysis"]]
+    xcoarse = linspace(0.5, 12.0, config["coarse_points"])
+    centers = 0.5 * (edges[1:] + edges[:-1])
+
+    with Graph(close_on_exit=True) as graph, NodeStorage() as storage:
+        Edges = Array("edges", edges, mode="fill")
+        EdgesAnalysis = Array("edges_analysis", edges_analysis, mode="fill")
+
+        # LSNL
+        X = Array("lsnl.x", xcoarse, mode="store")
+        Nominal = Array("lsnl.nominal", _lsnl_nominal(xcoarse), mode="fill")
+        refine = RefineCurve(
+            "lsnl.refine", refine_times=config["refine_times"], newmin=0.0, newmax=13.0
+        )
+        X >> refine.inputs["x"]
+        Nominal >> refine.inputs["nominal"]
+
+        lsnl = AxisDistortionMatrixPointwise("lsnl.matrix", mode=mode)
+        Edges >> lsnl.inputs["EdgesOriginal"]
+        Edges >> lsnl.inputs["EdgesTarget"]
+        refine.outputs["xfine"] >> lsnl.inputs["DistortionOriginal"]
+        refine.outputs["nominal"] >> lsnl.inputs["DistortionTarget"]
+
+        # energy resolution, a MetaNode per detector: the MetaNode imports the inputs of a
+        # single matrix
+        parameters = {
+            name: Array(f"eres.{name}", [value], mark=name)
+            for name, value in _resolution_parameters.items()
+        }
+        eres_matrices = {}
+        for detector in detectors:
+            _, eres = EnergyResolution.replicate(path=f"detector.eres.{detector}", mode=mode)
+            eres_inputs = eres["inputs", "detector", "eres", detector]
+            for name, parameter in parameters.items():
+                parameter >> eres_inputs["sigma_rel", name]
+            Edges >> eres_inputs["e_edges"]
+            Edges >> eres_inputs["matrix", "e_edges"]
+            Edges >> eres_inputs["matrix", "e_edges_out"]
+            eres_matrices[detector] = eres["outputs", "detector", "eres", detector, "matrix"]
+
+        # rebinning
+        _, rebin = Rebin.replicate(
+            path="detector.rebin",
+            replicate_outputs=keys,
+            method=config["rebin_method"],
+            mode=mode,
+        )
+        Edges >> rebin["inputs", "detector", "rebin", "rebin_matrix", "edges_old"]
+        EdgesAnalysis >> rebin["inputs", "detector", "rebin", "rebin_matrix", "edges_new"]
+
+        # the spectra
+        results = []
+        for detector, source in keys:
+            spectrum = Array(
+                f"spectrum.{detector}.{source}",
+                exp(-((centers - 3.0 - 0.1 * len(results)) ** 2)),
+                mode="fill",
+            )
+            distorted = VectorMatrixProduct(f"distorted.{detector}.{source}", mode="column")
+            distorted()
+            lsnl.outputs[0] >> distorted.inputs["matrix"]
+            spectrum >> distorted.inputs["vector"]
+
+            smeared = VectorMatrixProduct(f"smeared.{detector}.{source}", mode="column")
+            smeared()
+            eres_matrices[detector] >> smeared.inputs["matrix"]
+            distorted.outputs["result"] >> smeared.inputs["vector"]
+
+            smeared.outputs["result"] >> rebin[
+                "inputs", "detector", "rebin", "vector_matrix_product", detector, source
+            ]
+            results.append(
+                rebin["outputs", "detector", "rebin", "vector_matrix_product", detector, source]
+            )
+
+    return {
+        "graph": graph,
+        "storage": storage,
+        "results": results,
+        "nominal": Nominal,
+        "parameters": parameters,
+        "xcoarse": xcoarse,
+    }
+
+
+def _evaluate(results) -> None:
+    for output in results:
+        output.data
+
+
+def run_benchmark(config: dict, repeat: int = 5) -> dict:
+    timings = {}
+
+    start = perf_counter()
+    chain = build_chain(config)
+    timings["construction"] = perf_counter() - start
+
+    results = chain["results"]
+    start = perf_counter()
+    _evaluate(results)
+    timings["first_evaluation"] = perf_counter() - start
+
+    b_stat = chain["parameters"]["b_stat"].outputs["array"]
+    nominal = chain["nominal"].outputs["array"]
+    times_eres, times_lsnl = [], []
+    for i in range(repeat):
+        scale = 1.0 + 0.01 * (i % 2 + 1)
+        b_stat.set([_resolution_parameters["b_stat"] * scale])
+        start = perf_counter()
+        _evaluate(results)
+        times_eres.append(perf_counter() - start)
+
+        nominal.set(_lsnl_nominal(chain["xcoarse"], scale))
+        start = perf_counter()
+        _evaluate(results)
+        times_lsnl.append(perf_counter() - start)
+    timings["reevaluation_eres"] = median(times_eres)
+    timings["reevaluation_lsnl"] = median(times_lsnl)
+
+    return timings
+
+
+def compare_to_baseline(timings: dict, baseline: dict, threshold: float) -> list[dict]:
+    comparison = []
+    for stage in Stages:
+        reference = (baseline.get("timings") or {}).get(stage)
+        if not reference:
+            raise ValueError(f"The baseline has no timing for the stage {stage}")
+        current = timings[stage]
+        ratio = current / reference
+        comparison.append(
+            {
+                "stage": stage,
+                "time": current,
+                "baseline": reference,
+                "ratio": ratio,
+                "regression": ratio > 1.0 + threshold,
+            }
+        )
+    return comparison
+
+
+def _meta() -> dict:
+    from numba import __version__ as numba_version
+    from numba import config as numba_config
+
+    return {
+        "python": python_version(),
+        "numpy": numpy_version,
+        "numba": numba_version,
+        "machine": machine(),
+        "cpu_count": cpu_count(),
+        "numba_threads": numba_config.NUMBA_NUM_THREADS,
+    }
+
+
+def main():
+    parser = ArgumentParser(description="End-to-end benchmark of the detector response chain")
+    for name, value in DefaultConfig.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument("--repeat", type=int, default=5, help="the number of re-evaluations")
+    parser.add_argument("--baseline", default=BaselinePath, help="the baseline JSON file")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="the allowed relative slowdown"
+    )
+    parser.add_argument("--update-baseline", action="store_true", help="overwrite the baseline")
+    parser.add_argument(
+        "--warm-cache", action="store_true", help="use the numba cache for the first evaluation"
+    )
+    parser.add_argument("-o", "--output", help="JSON file to write the results to")
+    opts = parser.parse_args()
+    config = {name: getattr(opts, name) for name in DefaultConfig}
+
+    with TemporaryDirectory() as cache_dir:
+        if not opts.warm_cache:
+            set_cache_dir(cache_dir)
+        timings = run_benchmark(config, opts.repeat)
+
+    report = {"meta": _meta(), "config": config, "timings": timings}
+    if opts.update_baseline:
+        for stage in Stages:
+            print(f"{stage:20s} {timings[stage]:10.4f}")
+        with open(opts.baseline, "w") as f:
+            dump(report, f, indent=2)
+            f.write("\n")
+        if opts.output:
+            with open(opts.output, "w") as f:
+                dump(report, f, indent=2)
+        return
+
+    with open(opts.baseline) as f:
+        baseline = load(f)
+    if baseline.get("config") != config:
+        raise SystemExit(
+            f"The configuration differs from the baseline one ({opts.baseline}), "
+            "measure the baseline with --update-baseline"
+        )
+    try:
+        comparison = compare_to_baseline(timings, baseline, opts.threshold)
+    except ValueError as error:
+        raise SystemExit(f"{error} ({opts.baseline}), measure it with --update-baseline")
+
+    print(f"{'stage':20s} {'time, s':>10s} {'baseline, s':>12s} {'ratio':>7s}")
+    for item in comparison:
+        flag = "  REGRESSION" if item["regression"] else ""
+        print(
+            f"{item['stage']:20s} {item['time']:10.4f} {item['baseline']:12.4f} "
+            f"{item['ratio']:7.2f}{flag}"
+        )
+
+    report["comparison"] = comparison
+    if opts.output:
+        with open(opts.output, "w") as f:
+            dump(report, f, indent=2)
+
+    if any(item["regression"] for item in comparison):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
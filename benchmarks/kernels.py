@@ -0,0 +1,514 @@
+#!/usr/bin/env python
+"""Micro-benchmarks of the dgf_detector kernels.
+
+Each kernel is timed for each engine ("python", "numba", "numpy"; the
+"python" engine of a kernel, defined only with numba, is its `py_func`, the
+batched kernels have no "python" engine), each
+dtype, each size N (the number of bins) and, for the parallel kernels, each
+number of numba threads.
+
+The throughput is the number of the processed elements per second: the number
+of the matrix elements for the kernels, filling a dense matrix, and N (times
+the number of the rows for the batched kernels) otherwise. The rebinning
+matrix is written only at the nonzero elements, thus its throughput is N per
+second. The scaling exponent is the slope of log(time) vs log(N) of each
+series.
+
+A series is stopped, when a call takes longer than `--max-time`. The sizes,
+for which a dense matrix would exceed `--max-matrix-memory`, are skipped.
+
+Usage (from the root of the repository):
+    python -m benchmarks.kernels [--sizes 100 1000 10000 100000] [--dtype d f]
+        [--engine python numba numpy] [--threads 1 4] [--kernel NAME ...]
+        [--output kernels.json]
+"""
+
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from json import dump
+from os import cpu_count
+from platform import machine, python_version
+from time import perf_counter
+from timeit import Timer
+from typing import TYPE_CHECKING
+
+from numba import __version__ as numba_version
+from numba import config, get_num_threads, set_num_threads
+from numpy import __version__ as numpy_version
+from numpy import array, empty, finfo, full, linspace, log, polyfit, sqrt, zeros
+from numpy import dtype as numpy_dtype
+
+from dgf_detector.AxisDistortionMatrix import (
+    _axisdistortion_backwards_numba,
+    _axisdistortion_backwards_numpy,
+    _axisdistortion_backwards_python,
+    _axisdistortion_numba,
+    _axisdistortion_numpy,
+    _axisdistortion_python,
+)
+from dgf_detector.AxisDistortionMatrixLinear import (
+    _axisdistortion_linear_numba,
+    _axisdistortion_linear_numpy,
+    _axisdistortion_linear_python,
+)
+from dgf_detector.AxisDistortionMatrixLinearLegacy import (
+    _axisdistortion_linear_numba as _axisdistortion_linear_legacy_numba,
+)
+from dgf_detector.AxisDistortionMatrixLinearLegacy import (
+    _axisdistortion_linear_python as _axisdistortion_linear_legacy_python,
+)
+from dgf_detector.AxisDistortionMatrixPointwise import (
+    _axisdistortion_pointwise_numba,
+    _axisdistortion_pointwise_numpy,
+    _axisdistortion_pointwise_python,
+)
+from dgf_detector.EnergyResolutionMatrixBC import _resolution, _resolution_numpy
+from dgf_detector.EnergyResolutionSigmaRelABC import _rel_sigma, _rel_sigma_numpy
+from dgf_detector.Monotonize import (
+    _monotonize_numpy,
+    _monotonize_rows_with_x,
+    _monotonize_rows_without_x,
+    _monotonize_with_x,
+    _monotonize_without_x,
+)
+from dgf_detector.RebinMatrix import (
+    _calc_rebin_matrix_numba,
+    _calc_rebin_matrix_numpy,
+    _calc_rebin_matrix_python,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Sequence
+
+    from numpy.typing import NDArray
+
+Sizes = (100, 1_000, 10_000, 100_000)
+Engines = ("python", "numba", "numpy")
+# the number of the new bins of the rebinning is N/RebinFactor
+RebinFactor = 4
+# the number of the rows of the batched monotonization
+MonotonizeRows = 16
+
+
+def _edges(n: int, dtype: str) -> tuple[NDArray, NDArray, NDArray]:
+    """The edges, the distorted edges and the edges, projected backwards"""
+    edges = linspace(0.0, 10.0, n + 1, dtype=dtype)
+    edges_modified = (1.1 * edges - 0.5).astype(dtype)
+    edges_backward = ((edges + 0.5) / 1.1).astype(dtype)
+    return edges, edges_modified, edges_backward
+
+
+def _setup_axisdistortion(n: int, dtype: str):
+    edges, edges_modified, edges_backward = _edges(n, dtype)
+    matrix = zeros((n, n), dtype=dtype)
+    return (edges, edges, edges_modified, edges_backward, matrix), matrix.size
+
+
+def _setup_axisdistortion_backwards(n: int, dtype: str):
+    edges, edges_modified, _ = _edges(n, dtype)
+    matrix = zeros((n, n), dtype=dtype)
+    return (edges, edges, edges_modified, empty(n + 1, dtype=dtype), matrix), matrix.size
+
+
+def _setup_axisdistortion_linear(n: int, dtype: str):
+    edges, edges_modified, _ = _edges(n, dtype)
+    matrix = zeros((n, n), dtype=dtype)
+    return (edges, edges, edges_modified, matrix), matrix.size
+
+
+def _setup_axisdistortion_linear_legacy(n: int, dtype: str):
+    edges, edges_modified, _ = _edges(n, dtype)
+    matrix = zeros((n, n), dtype=dtype)
+    return (edges, edges, edges_modified, matrix, -1.0e10), matrix.size
+
+
+def _setup_axisdistortion_pointwise(n: int, dtype: str):
+    edges, edges_modified, _ = _edges(n, dtype)
+    matrix = zeros((n, n), dtype=dtype)
+    return (edges, edges, edges, edges_modified, matrix), matrix.size
+
+
+def _setup_resolution(n: int, dtype: str):
+    edges = linspace(1.0, 12.0, n + 1, dtype=dtype)
+    rel_sigma = (0.03 / sqrt(0.5 * (edges[1:] + edges[:-1]))).astype(dtype)
+    matrix = empty((n, n), dtype=dtype)
+    return (rel_sigma, edges, matrix, 1.0e-10), matrix.size
+
+
+def _setup_rel_sigma(n: int, dtype: str):
+    energy = linspace(1.0, 12.0, n, dtype=dtype)
+    a, b, c = array((0.01, 0.03, 0.01), dtype=dtype)
+    return (a, b, c, energy, empty(n, dtype=dtype)), n
+
+
+def _setup_rebin_matrix(n: int, dtype: str):
+    edges_old = linspace(0.0, 10.0, n + 1, dtype=dtype)
+    edges_new = edges_old[::RebinFactor].copy()
+    matrix = zeros((edges_new.size - 1, n), dtype=dtype)
+    # the default tolerance of RebinMatrix
+    atol = float(finfo("d").resolution) * 10.0
+    return (edges_old, edges_new, matrix, atol, 0.0, None), n
+
+
+def _setup_rebin_segments(n: int, dtype: str):
+    (edges_old, edges_new, _, atol, rtol, _), _ = _setup_rebin_matrix(n, dtype)
+    segments = empty(edges_new.size, dtype="i")
+    return (edges_old, edges_new, None, atol, rtol, segments), n
+
+
+def _monotonize_data(n: int, dtype: str) -> tuple[NDArray, NDArray]:
+    x = linspace(0.1, 10.0, n, dtype=dtype)
+    y = log(x).astype(dtype)
+    # the non monotonous region at the beginning
+    mask = x < 1.0
+    y[mask] = (x[mask] - 1.0) ** 2
+    return x, y
+
+
+def _setup_monotonize_with_x(n: int, dtype: str):
+    x, y = _monotonize_data(n, dtype)
+    return (x, y, empty(n, dtype=dtype), 0.0, n // 2), n
+
+
+def _setup_monotonize_without_x(n: int, dtype: str):
+    _, y = _monotonize_data(n, dtype)
+    return (y, empty(n, dtype=dtype), 0.0, n // 2), n
+
+
+def _setup_monotonize_rows_with_x(n: int, dtype: str):
+    x, y = _monotonize_data(n, dtype)
+    rows = full((MonotonizeRows, n), y, dtype=dtype)
+    nmodified = empty(MonotonizeRows, dtype="i")
+    return (x, rows, empty(rows.shape, dtype=dtype), nmodified, 0.0, n // 2), rows.size
+
+
+def _setup_monotonize_rows_without_x(n: int, dtype: str):
+    (_, rows, result, nmodified, gradient, index), size = _setup_monotonize_rows_with_x(n, dtype)
+    return (rows, result, nmodified, gradient, index), size
+
+
+def _monotonize_numpy_without_x(y, result, gradient, index):
+    return _monotonize_numpy(None, y, result, gradient, index)
+
+
+def _monotonize_rows_numpy(x, y, result, nmodified, gradient, index):
+    for irow in range(y.shape[0]):
+        nmodified[irow] = _monotonize_numpy(x, y[irow], result[irow], gradient, index)
+
+
+def _monotonize_rows_numpy_without_x(y, result, nmodified, gradient, index):
+    _monotonize_rows_numpy(None, y, result, nmodified, gradient, index)
+
+
+# name: (setup, {engine: kernel}, is parallel, is dense)
+KernelCases: dict[str, tuple[Callable, dict[str, Callable], bool, bool]] = {
+    "_rel_sigma": (
+        _setup_rel_sigma,
+        {"python": _rel_sigma.py_func, "numba": _rel_sigma, "numpy": _rel_sigma_numpy},
+        False,
+        False,
+    ),
+    "_resolution": (
+        _setup_resolution,
+        {"python": _resolution.py_func, "numba": _resolution, "numpy": _resolution_numpy},
+        False,
+        True,
+    ),
+    "_axisdistortion": (
+        _setup_axisdistortion,
+        {
+            "python": _axisdistortion_python,
+            "numba": _axisdistortion_numba,
+            "numpy": _axisdistortion_numpy,
+        },
+        False,
+        True,
+    ),
+    "_axisdistortion_backwards": (
+        _setup_axisdistortion_backwards,
+        {
+            "python": _axisdistortion_backwards_python,
+            "numba": _axisdistortion_backwards_numba,
+            "numpy": _axisdistortion_backwards_numpy,
+        },
+        False,
+        True,
+    ),
+    "_axisdistortion_linear": (
+        _setup_axisdistortion_linear,
+        {
+            "python": _axisdistortion_linear_python,
+            "numba": _axisdistortion_linear_numba,
+            "numpy": _axisdistortion_linear_numpy,
+        },
+        False,
+        True,
+    ),
+    "_axisdistortion_linear_legacy": (
+        _setup_axisdistortion_linear_legacy,
+        {
+            "python": _axisdistortion_linear_legacy_python,
+            "numba": _axisdistortion_linear_legacy_numba,
+        },
+        False,
+        True,
+    ),
+    "_axisdistortion_pointwise": (
+        _setup_axisdistortion_pointwise,
+        {
+            "python": _axisdistortion_pointwise_python,
+            "numba": _axisdistortion_pointwise_numba,
+            "numpy": _axisdistortion_pointwise_numpy,
+        },
+        False,
+        True,
+    ),
+    "_calc_rebin_matrix": (
+        _setup_rebin_matrix,
+        {
+            "python": _calc_rebin_matrix_python,
+            "numba": _calc_rebin_matrix_numba,
+            "numpy": _calc_rebin_matrix_numpy,
+        },
+        False,
+        True,
+    ),
+    "_calc_rebin_matrix_segments": (
+        _setup_rebin_segments,
+        {
+            "python": _calc_rebin_matrix_python,
+            "numba": _calc_rebin_matrix_numba,
+            "numpy": _calc_rebin_matrix_numpy,
+        },
+        False,
+        False,
+    ),
+    "_monotonize_with_x": (
+        _setup_monotonize_with_x,
+        {
+            "python": _monotonize_with_x.py_func,
+            "numba": _monotonize_with_x,
+            "numpy": _monotonize_numpy,
+        },
+        False,
+        False,
+    ),
+    "_monotonize_without_x": (
+        _setup_monotonize_without_x,
+        {
+            "python": _monotonize_without_x.py_func,
+            "numba": _monotonize_without_x,
+            "numpy": _monotonize_numpy_without_x,
+        },
+        False,
+        False,
+    ),
+    "_monotonize_rows_with_x": (
+        _setup_monotonize_rows_with_x,
+        {
+            "numba": _monotonize_rows_with_x,
+            "numpy": _monotonize_rows_numpy,
+        },
+        True,
+        False,
+    ),
+    "_monotonize_rows_without_x": (
+        _setup_monotonize_rows_without_x,
+        {
+            "numba": _monotonize_rows_without_x,
+            "numpy": _monotonize_rows_numpy_without_x,
+        },
+        True,
+        False,
+    ),
+}
+
+
+def _time_kernel(kernel: Callable, args: tuple, repeat: int) -> tuple[float, float]:
+    """Return the time of the first call (including the compilation) and the
+    best time of a call"""
+    start = perf_counter()
+    kernel(*args)
+    first = perf_counter() - start
+
+    timer = Timer(lambda: kernel(*args))
+    number, _ = timer.autorange()
+    return first, min(timer.repeat(repeat, number)) / number
+
+
+def _scaling_exponents(results: list[dict]) -> list[dict]:
+    series = {}
+    for result in results:
+        key = (result["kernel"], result["engine"], result["dtype"], result["threads"])
+        series.setdefault(key, []).append(result)
+
+    exponents = []
+    for (kernel, engine, dtype, threads), points in series.items():
+        if len(points) < 2:
+            continue
+        sizes = array([point["n"] for point in points], dtype="d")
+        times = array([point["time"] for point in points], dtype="d")
+        exponent = polyfit(log(sizes), log(times), 1)[0]
+        exponents.append(
+            {
+                "kernel": kernel,
+                "engine": engine,
+                "dtype": dtype,
+                "threads": threads,
+                "exponent": float(exponent),
+            }
+        )
+    return exponents
+
+
+def run_benchmarks(
+    *,
+    sizes: Sequence[int] = Sizes,
+    dtypes: Sequence[str] = ("d", "f"),
+    engines: Sequence[str] = Engines,
+    threads: Sequence[int] = (1,),
+    kernels: Sequence[str] | None = None,
+    repeat: int = 3,
+    max_time: float = 1.0,
+    max_matrix_memory: float = 1024.0,
+    verbose: bool = False,
+) -> dict:
+    """Run the benchmarks, return the results as a dictionary, ready for JSON.
+
+    `max_time` is in seconds, `max_matrix_memory` is in megabytes.
+    """
+    results, skipped = [], []
+    nthreads_default = get_num_threads()
+    for name, (setup, functions, parallel, dense) in KernelCases.items():
+        if kernels is not None and name not in kernels:
+            continue
+        for engine, kernel in functions.items():
+            if engine not in engines:
+                continue
+            for dtype in dtypes:
+                itemsize = numpy_dtype(dtype).itemsize
+                for nthreads in threads if parallel and engine == "numba" else (1,):
+                    if nthreads > config.NUMBA_NUM_THREADS:
+                        skipped.append(
+                            {
+                                "kernel": name,
+                                "engine": engine,
+                                "dtype": dtype,
+                                "threads": nthreads,
+                                "reason": "threads",
+                            }
+                        )
+                        continue
+                    set_num_threads(nthreads)
+                    for n in sorted(sizes):
+                        case = {
+                            "kernel": name,
+                            "engine": engine,
+                            "dtype": dtype,
+                            "threads": nthreads,
+                            "n": n,
+                        }
+                        if dense and n * n * itemsize > max_matrix_memory * 2**20:
+                            skipped.append(dict(case, reason="matrix memory"))
+                            continue
+                        args, nelements = setup(n, dtype)
+                        first, time = _time_kernel(kernel, args, repeat)
+                        result = dict(
+                            case,
+                            elements=nelements,
+                            time=time,
+                            first_call=first,
+                            throughput=nelements / time,
+                        )
+                        results.append(result)
+                        if verbose:
+                            print(
+                                f"{name:30s} {engine:6s} {dtype} {nthreads:3d} {n:8d}: "
+                                f"{time*1e3:12.4f} ms {nelements/time:12.4g} el/s"
+                            )
+                        if time > max_time:
+                            skipped.extend(
+                                dict(case, n=nlarger, reason="time")
+                                for nlarger in sizes
+                                if nlarger > n
+                            )
+                            break
+    set_num_threads(nthreads_default)
+
+    return {
+        "meta": {
+            "python": python_version(),
+            "numpy": numpy_version,
+            "numba": numba_version,
+            "machine": machine(),
+            "cpu_count": cpu_count(),
+            "numba_threads": config.NUMBA_NUM_THREADS,
+            "sizes": sorted(sizes),
+            "dtypes": list(dtypes),
+            "repeat": repeat,
+        },
+        "results": results,
+        "scaling": _scaling_exponents(results),
+        "skipped": skipped,
+    }
+
+
+def main():
+    parser = ArgumentParser(description="Micro-benchmarks of the dgf_detector kernels")
+    parser.add_argument("--sizes", nargs="+", type=int, default=Sizes, help="the numbers of bins")
+    parser.add_argument("--dtype", nargs="+", default=["d", "f"], help="the dtypes")
+    parser.add_argument("--engine", nargs="+", default=Engines, choices=Engines, help="engines")
+    parser.add_argument(
+        "--threads",
+        nargs="+",
+        type=int,
+        default=sorted({1, config.NUMBA_NUM_THREADS}),
+        help="the numbers of numba threads for the parallel kernels",
+    )
+    parser.add_argument("--kernel", nargs="+", choices=tuple(KernelCases), help="the kernels")
+    parser.add_argument("--repeat", type=int, default=3, help="the number of repetitions")
+    parser.add_argument("--max-time", type=float, default=1.0, help="max time of a call, s")
+    parser.add_argument(
+        "--max-matrix-memory", type=float, default=1024.0, help="max size of a matrix, MB"
+    )
+    parser.add_argument("-o", "--output", help="JSON file to write the results to")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print each measurement")
+    opts = parser.parse_args()
+
+    report = run_benchmarks(
+        sizes=opts.sizes,
+        dtypes=opts.dtype,
+        engines=opts.engine,
+        threads=opts.threads,
+        kernels=opts.kernel,
+        repeat=opts.repeat,
+        max_time=opts.max_time,
+        max_matrix_memory=opts.max_matrix_memory,
+        verbose=opts.verbose,
+    )
+
+    # the throughput at the largest measured size, the slowest kernels first
+    largest = {}
+    for result in report["results"]:
+        key = (result["kernel"], result["engine"], result["dtype"], result["threads"])
+        largest[key] = result
+    print(f"{'kernel':30s} {'engine':6s} dtype threads {'N':>8s} {'el/s':>10s} exponent")
+    exponents = {
+        (item["kernel"], item["engine"], item["dtype"], item["threads"]): item["exponent"]
+        for item in report["scaling"]
+    }
+    for key, result in sorted(largest.items(), key=lambda item: item[1]["throughput"]):
+        exponent = exponents.get(key)
+        print(
+            f"{key[0]:30s} {key[1]:6s} {key[2]:>5s} {key[3]:7d} {result['n']:8d} "
+            f"{result['throughput']:10.3g} " + (f"{exponent:8.2f}" if exponent is not None else "")
+        )
+
+    if opts.output:
+        with open(opts.output, "w") as f:
+            dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Measure the startup cost of dgf_detector in fresh interpreters.
+
+The stages:
+    - import: `import dgf_detector`
+    - cold: warmup with an empty numba cache, all the kernels are compiled
+    - warm: warmup with the cache, filled by the previous stage
+    - installed: warmup after the cache is installed as prebuilt artifacts
+
+Usage:
+    python benchmarks/startup.py [--dtype d f] [--repeat 3] [--output startup.json]
+"""
+
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from json import dump, loads
+from os.path import abspath, dirname
+from subprocess import run
+from sys import executable
+from tempfile import TemporaryDirectory
+
+_root = dirname(dirname(abspath(__file__)))
+
+_import_script = """
+from json import dumps
+from time import perf_counter
+start = perf_counter()
+import dgf_detector
+print(dumps({"total": perf_counter() - start}))
+"""
+
+_warmup_script = """
+from json import dumps
+from sys import argv
+from time import perf_counter
+start = perf_counter()
+from dgf_detector.warmup import install_cache, warmup
+imported = perf_counter()
+if argv[3]:
+    install_cache(argv[3], argv[1])
+timings = warmup(argv[2].split(","), cache_dir=argv[1])
+print(dumps({"total": perf_counter() - start, "import": imported - start, "kernels": timings}))
+"""
+
+
+def _measure(script: str, *args: str) -> dict:
+    ret = run(
+        (executable, "-c", script, *args), cwd=_root, capture_output=True, text=True, check=True
+    )
+    return loads(ret.stdout.splitlines()[-1])
+
+
+def measure_startup(dtypes: list[str], repeat: int = 1) -> dict:
+    dtypes_arg = ",".join(dtypes)
+    results = {"dtypes": dtypes, "import": [], "cold": [], "warm": [], "installed": []}
+    for _ in range(repeat):
+        results["import"].append(_measure(_import_script)["total"])
+        with TemporaryDirectory() as artifacts, TemporaryDirectory() as cache_dir:
+            results["cold"].append(_measure(_warmup_script, artifacts, dtypes_arg, ""))
+            results["warm"].append(_measure(_warmup_script, artifacts, dtypes_arg, ""))
+            results["installed"].append(
+                _measure(_warmup_script, cache_dir, dtypes_arg, artifacts)
+            )
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="Measure the startup cost of dgf_detector")
+    parser.add_argument("--dtype", nargs="+", default=["d", "f"], help="the dtypes to warm up")
+    parser.add_argument("--repeat", type=int, default=1, help="the number of repetitions")
+    parser.add_argument("-o", "--output", help="JSON file to write the results to")
+    opts = parser.parse_args()
+
+    results = measure_startup(opts.dtype, opts.repeat)
+    print(f"{'import':>10s}: {min(results['import']):8.3f} s")
+    for stage in ("cold", "warm", "installed"):
+        print(f"{stage:>10s}: {min(res['total'] for res in results[stage]):8.3f} s")
+
+    if opts.output:
+        with open(opts.output, "w") as f:
+            dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,23 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Literal
 
-from numpy import allclose
+from numpy import (
+    argsort,
+    concatenate,
+    count_nonzero,
+    cumsum,
+    empty,
+    flatnonzero,
+    isnan,
+    maximum,
+    nan,
+    searchsorted,
+    where,
+)
 from numba import njit
 
+from dagflow.core.exception import InitializationError
 from dagflow.core.node import Node
 from dagflow.core.type_functions import (
     check_dimension_of_inputs,
@@ -15,6 +28,14 @@ from dagflow.core.type_functions import (
     evaluate_dtype_of_outputs,
 )
 
+from dgf_detector.edges import _check_edges_are_identical
+from dgf_detector.precision import (
+    InputConverter,
+    check_precision,
+    compute_dtype,
+    storage_dtype,
+)
+
 if TYPE_CHECKING:
     from collections.abc import Callable
 
@@ -23,85 +44,278 @@ if TYPE_CHECKING:
     from dagflow.core.input import Input
     from dagflow.core.output import Output
 
+    from dgf_detector.precision import PrecisionsType
+
+
+AxisDistortionModes = {"python", "numba", "numpy", "trace"}
+AxisDistortionModesType = Literal["python", "numba", "numpy", "trace"]
+
 
 class AxisDistortionMatrix(Node):
     """For a given histogram and distorted X axis compute the conversion
-    matrix."""
+    matrix.
+
+    The projection of the target edges backwards, `EdgesModifiedBackwards`, is
+    an input by default. With `compute_backwards=True` it is computed
+    internally by the inverse linear interpolation of `EdgesModified` against
+    `EdgesOriginal`.
+
+    The mode "trace" runs the compiled sweep, recording each step, see `trace`.
+    The mode "numpy" computes the matrix without JIT compilation.
+
+    `precision` selects the dtype of the matrix and of the computations, see
+    `dgf_detector.precision`.
+    """
 
     __slots__ = (
         "_edges_original",
         "_edges_target",
         "_edges_modified",
         "_edges_backward",
+        "_edges_backward_buffer",
+        "_compute_backwards",
+        "_mode",
+        "_precision",
+        "_convert",
+        "_trace_capacity",
+        "_trace_steps",
+        "_trace_weights",
+        "_edges_checked",
         "_result",
     )
 
     _edges_original: Input
     _edges_target: Input
     _edges_modified: Input
-    _edges_backward: Input
+    _edges_backward: Input | None
+    _edges_backward_buffer: NDArray | None
+    _compute_backwards: bool
+    _mode: str
+    _precision: str
+    _convert: InputConverter
+    _trace_capacity: int | None
+    _trace_steps: NDArray | None
+    _trace_weights: NDArray | None
+    _edges_checked: bool
     _result: Output
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        compute_backwards: bool = False,
+        mode: AxisDistortionModesType = "numba",
+        precision: PrecisionsType = "inputs",
+        trace_capacity: int | None = None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
         self.labels.setdefaults(
             {
                 "text": r"Bin edges distortion matrix",
             }
         )
+        if mode not in AxisDistortionModes:
+            raise InitializationError(
+                f"mode must be in {AxisDistortionModes}, but given {mode}!", node=self
+            )
+        check_precision(precision, node=self)
+        self._mode = mode
+        self._precision = precision
+        self._convert = InputConverter()
+        self._trace_capacity = trace_capacity
+        self._trace_steps = None
+        self._trace_weights = None
+        self._compute_backwards = compute_backwards
+        self._edges_backward_buffer = None
+        self._edges_checked = False
         self._edges_original = self._add_input("EdgesOriginal", positional=False)
         self._edges_target = self._add_input("EdgesTarget", positional=False)
         self._edges_modified = self._add_input("EdgesModified", positional=False)
-        self._edges_backward = self._add_input(
-            "EdgesModifiedBackwards", positional=False
-        )
+        if compute_backwards:
+            self._edges_backward = None
+        else:
+            self._edges_backward = self._add_input(
+                "EdgesModifiedBackwards", positional=False
+            )
         self._result = self._add_output("matrix")  # output: 0
 
-        self._functions_dict.update(
-            {
-                "python": self._function_python,
-                "numba": self._function_numba,
-            }
-        )
+        self._functions_dict["trace"] = self._function_trace
+        if compute_backwards:
+            self._functions_dict.update(
+                {
+                    "python": self._function_backwards_python,
+                    "numba": self._function_backwards_numba,
+                    "numpy": self._function_backwards_numpy,
+                }
+            )
+        else:
+            self._functions_dict.update(
+                {
+                    "python": self._function_python,
+                    "numba": self._function_numba,
+                    "numpy": self._function_numpy,
+                }
+            )
+
+    @property
+    def compute_backwards(self) -> bool:
+        return self._compute_backwards
+
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @property
+    def precision(self) -> str:
+        return self._precision
+
+    @property
+    def trace(self) -> tuple[NDArray, NDArray] | None:
+        """The steps of the last sweep, recorded in the "trace" mode.
+
+        Returns a pair of arrays:
+            - steps (Nx4): index of the backward projected edge, column, row,
+              edge crossed first (1: original, 2: target)
+            - weights (N): the matrix element, assigned at the step
+
+        The trace is truncated if the number of steps exceeds `trace_capacity`.
+        """
+        if self._trace_steps is None:
+            return None
+        nsteps = count_nonzero(~isnan(self._trace_weights))
+        return self._trace_steps[:nsteps], self._trace_weights[:nsteps]
+
+    @property
+    def edges_modified_backwards(self) -> NDArray:
+        if self._edges_backward is not None:
+            return self._edges_backward.data
+        return self._edges_backward_buffer
+
+    def _check_edges(self) -> None:
+        """Check the target edges against the original ones, only if they have changed since the last check"""
+        if self._edges_checked:
+            return
+        _check_edges_are_identical(self._edges_original, self._edges_target, self._mode)
+        self._edges_checked = True
+
+    def taint(self, *, caller: Input | None = None, **kwargs):
+        # the edges are checked again, unless the taint comes from the distortion
+        if caller is not self._edges_modified and caller is not self._edges_backward:
+            self._edges_checked = False
+        return super().taint(caller=caller, **kwargs)
 
     def _function_python(self):
+        self._check_edges()
         _axisdistortion_python(
-            self._edges_original.data,
-            self._edges_target.data,
-            self._edges_modified.data,
-            self._edges_backward.data,
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            self._convert(self._edges_modified),
+            self._convert(self._edges_backward),
             self._result._data,
         )
 
     def _function_numba(self):
+        self._check_edges()
         _axisdistortion_numba(
-            self._edges_original.data,
-            self._edges_target.data,
-            self._edges_modified.data,
-            self._edges_backward.data,
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            self._convert(self._edges_modified),
+            self._convert(self._edges_backward),
             self._result._data,
         )
 
+    def _function_numpy(self):
+        self._check_edges()
+        _axisdistortion_numpy(
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            self._convert(self._edges_modified),
+            self._convert(self._edges_backward),
+            self._result._data,
+        )
+
+    def _function_backwards_python(self):
+        self._check_edges()
+        _axisdistortion_backwards_python(
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            self._convert(self._edges_modified),
+            self._edges_backward_buffer,
+            self._result._data,
+        )
+
+    def _function_backwards_numba(self):
+        self._check_edges()
+        _axisdistortion_backwards_numba(
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            self._convert(self._edges_modified),
+            self._edges_backward_buffer,
+            self._result._data,
+        )
+
+    def _function_backwards_numpy(self):
+        self._check_edges()
+        _axisdistortion_backwards_numpy(
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            self._convert(self._edges_modified),
+            self._edges_backward_buffer,
+            self._result._data,
+        )
+
+    def _function_trace(self):
+        self._check_edges()
+        self._trace_weights[:] = nan
+        if self._compute_backwards:
+            _axisdistortion_backwards_numba(
+                self._convert(self._edges_original),
+                self._convert(self._edges_target),
+                self._convert(self._edges_modified),
+                self._edges_backward_buffer,
+                self._result._data,
+                self._trace_steps,
+                self._trace_weights,
+            )
+        else:
+            _axisdistortion_numba(
+                self._convert(self._edges_original),
+                self._convert(self._edges_target),
+                self._convert(self._edges_modified),
+                self._convert(self._edges_backward),
+                self._result._data,
+                self._trace_steps,
+                self._trace_weights,
+            )
+
     def _type_function(self) -> None:
         """A output takes this function to determine the dtype and shape."""
-        names_edges = (
-            "EdgesOriginal",
-            "EdgesTarget",
-            "EdgesModified",
-            "EdgesModifiedBackwards",
-        )
+        names_edges = ("EdgesOriginal", "EdgesTarget", "EdgesModified")
+        if not self._compute_backwards:
+            names_edges += ("EdgesModifiedBackwards",)
         check_dimension_of_inputs(self, names_edges, 1)
         check_inputs_have_same_dtype(self, names_edges)
         (nedges,) = check_inputs_have_same_shape(self, names_edges)
         check_size_of_inputs(self, "EdgesOriginal", min=1)
         copy_dtype_from_inputs_to_outputs(self, "EdgesOriginal", "matrix")
         evaluate_dtype_of_outputs(self, names_edges, "matrix")
+        dtype = self._edges_original.dd.dtype
+        self._result.dd.dtype = storage_dtype(self._precision, dtype)
+        dtype_compute = compute_dtype(self._precision, dtype)
+        self._convert.allocate((self.inputs[name] for name in names_edges), dtype_compute)
 
         self._result.dd.shape = (nedges - 1, nedges - 1)
         edges_original = self._edges_original.parent_output
         edges_target = self._edges_target.parent_output
         self._result.dd.axes_edges = (edges_target, edges_original)
-        self.function = self._functions_dict["numba"]
+        if self._compute_backwards:
+            self._edges_backward_buffer = empty(nedges, dtype=dtype_compute)
+        if self._mode == "trace":
+            capacity = self._trace_capacity or 4 * nedges
+            self._trace_steps = empty((capacity, 4), dtype="i")
+            self._trace_weights = empty(capacity, dtype="d")
+        self._edges_checked = False
+        self.function = self._functions_dict[self._mode]
 
 
 def _axisdistortion_python(
@@ -110,11 +324,11 @@ def _axisdistortion_python(
     edges_modified: NDArray,
     edges_backwards: NDArray,
     matrix: NDArray,
+    trace_steps: NDArray | None = None,
+    trace_weights: NDArray | None = None,
 ) -> None:
     # in general, target edges may be different (finer than original), the code should be able to handle it.
-    # but currently we just check that edges are the same.
-    assert edges_original is edges_target or allclose(edges_original, edges_target, atol=0.0, rtol=0.0)
-
+    # but currently the edges are expected to be the same, which is checked by the node.
     edges_target = edges_original
     min_original = edges_original[0]
     min_target = edges_target[0]
@@ -124,7 +338,6 @@ def _axisdistortion_python(
     matrix[:, :] = 0.0
 
     threshold = -1e10
-    # left_axis = 0
     right_axis = 0
     idxx0, idxx1, idxy = -1, -1, 0
     leftx_fine, lefty_fine = threshold, threshold
@@ -137,15 +350,16 @@ def _axisdistortion_python(
                 edges_original[idxx0 + 1],
                 edges_modified[idxx0 + 1],
             )
-            # left_axis = 0
             if (idxx0 := idxx0 + 1) >= nbinsx:
                 return
         else:
             leftx_fine, lefty_fine = edges_backwards[idxx1 + 1], edges_target[idxx1 + 1]
-            # left_axis = 1
             if (idxx1 := idxx1 + 1) >= nbinsx:
                 return
 
+    # number of the recorded trace steps, used only if `trace_steps` is provided
+    itrace = 0
+
     width_coarse = edges_original[idxx0 + 1] - edges_original[idxx0]
     while True:
         right_orig = edges_original[idxx0 + 1]
@@ -160,24 +374,21 @@ def _axisdistortion_python(
             righty_fine = edges_target[idxx1 + 1]
             right_axis = 1
 
+        # the rows do not decrease, the sweep ends when the left point leaves the target range
         while lefty_fine >= edges_target[idxy + 1]:
-            if (idxy := idxy + 1) > nbinsy:
-                break
+            if (idxy := idxy + 1) >= nbinsy:
+                return
 
-        ##
-        ## Uncomment the following lines to see the debug output
-        ## (you need to also uncomment all the `left_axis` lines)
-        ##
-        # width_fine = rightx_fine-leftx_fine
-        # factor = width_fine/width_coarse
-        # print(
-        #         f"x:{leftx_fine:8.4f}→{rightx_fine:8.4f}="
-        #         f"{width_fine:8.4f}/{width_coarse:8.4f}={factor:8.4g} "
-        #         f"ax:{left_axis}→{right_axis} idxx:{idxx0: 4d},{idxx1: 4d} idxy: {idxy: 4d} "
-        #         f"y:{lefty_fine:8.4f}→{righty_fine:8.4f}"
-        # )
-
-        matrix[idxy, idxx0] = (rightx_fine - leftx_fine) / width_coarse
+        element = (rightx_fine - leftx_fine) / width_coarse
+        matrix[idxy, idxx0] = element
+
+        if trace_steps is not None and itrace < trace_steps.shape[0]:
+            trace_steps[itrace, 0] = idxx1
+            trace_steps[itrace, 1] = idxx0
+            trace_steps[itrace, 2] = idxy
+            trace_steps[itrace, 3] = right_axis + 1
+            trace_weights[itrace] = element
+            itrace += 1
 
         if right_axis == 0:
             if (idxx0 := idxx0 + 1) >= nbinsx:
@@ -186,9 +397,156 @@ def _axisdistortion_python(
         elif (idxx1 := idxx1 + 1) >= nbinsx:
             break
         leftx_fine, lefty_fine = rightx_fine, righty_fine
-        # left_axis = right_axis
 
 
-_axisdistortion_numba: Callable[[NDArray, NDArray, NDArray, NDArray, NDArray], None] = (
-    njit(cache=True)(_axisdistortion_python)
+_axisdistortion_numba: Callable[
+    [NDArray, NDArray, NDArray, NDArray, NDArray, NDArray | None, NDArray | None], None
+] = njit(cache=True)(_axisdistortion_python)
+
+
+def _project_edges_backwards_python(
+    edges_original: NDArray,
+    edges_target: NDArray,
+    edges_modified: NDArray,
+    edges_backwards: NDArray,
+) -> None:
+    """Project the target edges backwards: find X, such that the modified
+    edge, interpolated linearly, is equal to the target edge.
+
+    `EdgesModified` is assumed to be monotonously increasing. The
+    interpolation is extended linearly beyond the first and the last segments.
+    """
+    nsegments = edges_original.size - 1
+    iseg = 0
+    for i in range(edges_target.size):
+        edge_target = edges_target[i]
+        while iseg < nsegments - 1 and edges_modified[iseg + 1] <= edge_target:
+            iseg += 1
+
+        x0, x1 = edges_original[iseg], edges_original[iseg + 1]
+        y0, y1 = edges_modified[iseg], edges_modified[iseg + 1]
+        edges_backwards[i] = x0 + (edge_target - y0) * (x1 - x0) / (y1 - y0)
+
+
+_project_edges_backwards_numba: Callable[[NDArray, NDArray, NDArray, NDArray], None] = (
+    njit(cache=True)(_project_edges_backwards_python)
 )
+
+
+def _axisdistortion_backwards_python(
+    edges_original: NDArray,
+    edges_target: NDArray,
+    edges_modified: NDArray,
+    edges_backwards: NDArray,
+    matrix: NDArray,
+    trace_steps: NDArray | None = None,
+    trace_weights: NDArray | None = None,
+) -> None:
+    _project_edges_backwards_python(
+        edges_original, edges_target, edges_modified, edges_backwards
+    )
+    _axisdistortion_python(
+        edges_original,
+        edges_target,
+        edges_modified,
+        edges_backwards,
+        matrix,
+        trace_steps,
+        trace_weights,
+    )
+
+
+@njit(cache=True)
+def _axisdistortion_backwards_numba(
+    edges_original: NDArray,
+    edges_target: NDArray,
+    edges_modified: NDArray,
+    edges_backwards: NDArray,
+    matrix: NDArray,
+    trace_steps: NDArray | None = None,
+    trace_weights: NDArray | None = None,
+) -> None:
+    _project_edges_backwards_numba(
+        edges_original, edges_target, edges_modified, edges_backwards
+    )
+    _axisdistortion_numba(
+        edges_original,
+        edges_target,
+        edges_modified,
+        edges_backwards,
+        matrix,
+        trace_steps,
+        trace_weights,
+    )
+
+
+def _axisdistortion_numpy(
+    edges_original: NDArray,
+    edges_target: NDArray,
+    edges_modified: NDArray,
+    edges_backwards: NDArray,
+    matrix: NDArray,
+) -> None:
+    """The same as `_axisdistortion_python`, vectorized.
+
+    The original and the backward projected edges are merged by a stable sort,
+    each pair of the consecutive points within the range defines an element.
+    """
+    edges_target = edges_original
+    nedges = edges_original.size
+
+    matrix[:, :] = 0.0
+
+    # on equal values the backward projected edge goes first, as in the sweep
+    points = concatenate((edges_backwards, edges_original))
+    order = argsort(points, kind="stable")
+    from_x = order >= nedges
+    index = where(from_x, order - nedges, order)
+    x = points[order]
+    y = where(from_x, edges_modified[index], edges_target[index])
+
+    starts = flatnonzero((x > -1e10) & (x >= edges_original[0]) & (y >= edges_target[0]))
+    ilast = flatnonzero(index == nedges - 1)[0]
+    if not starts.size or starts[0] >= ilast:
+        return
+    pieces = slice(starts[0], ilast)
+
+    # the row of the sweep does not decrease, even if the backward projected
+    # edges are not consistent with the modified ones, and the sweep ends, when
+    # it leaves the target range
+    rows = maximum.accumulate(searchsorted(edges_target, y[pieces], side="right") - 1)
+    nrows = searchsorted(rows, nedges - 1)
+    rows = rows[:nrows]
+    pieces = slice(pieces.start, pieces.start + nrows)
+
+    columns = (cumsum(from_x) - 1)[pieces]
+    widths = edges_original[columns + 1] - edges_original[columns]
+    elements = (x[pieces.start + 1 : pieces.stop + 1] - x[pieces]) / widths
+    # a zero length piece, which starts at the first edge, before the first column
+    inside = columns >= 0
+    matrix[rows[inside], columns[inside]] = elements[inside]
+
+
+def _project_edges_backwards_numpy(
+    edges_original: NDArray,
+    edges_target: NDArray,
+    edges_modified: NDArray,
+    edges_backwards: NDArray,
+) -> None:
+    """The same as `_project_edges_backwards_python`, vectorized"""
+    nsegments = edges_original.size - 1
+    iseg = searchsorted(edges_modified[1:nsegments], edges_target, side="right")
+    x0, x1 = edges_original[iseg], edges_original[iseg + 1]
+    y0, y1 = edges_modified[iseg], edges_modified[iseg + 1]
+    edges_backwards[:] = x0 + (edges_target - y0) * (x1 - x0) / (y1 - y0)
+
+
+def _axisdistortion_backwards_numpy(
+    edges_original: NDArray,
+    edges_target: NDArray,
+    edges_modified: NDArray,
+    edges_backwards: NDArray,
+    matrix: NDArray,
+) -> None:
+    _project_edges_backwards_numpy(edges_original, edges_target, edges_modified, edges_backwards)
+    _axisdistortion_numpy(edges_original, edges_target, edges_modified, edges_backwards, matrix)
@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from numba import njit
+from numpy import empty
+
+from dagflow.core.exception import InitializationError
+from dagflow.core.node import Node
+from dagflow.core.type_functions import (
+    check_dimension_of_inputs,
+    check_inputs_have_same_dtype,
+    check_inputs_have_same_shape,
+    check_size_of_inputs,
+    copy_dtype_from_inputs_to_outputs,
+    evaluate_dtype_of_outputs,
+)
+
+from dgf_detector.AxisDistortionMatrixPointwise import (
+    _axisdistortion_pointwise_numba,
+    _axisdistortion_pointwise_python,
+)
+from dgf_detector.edges import _check_edges_are_identical
+from dgf_detector.precision import (
+    InputConverter,
+    check_precision,
+    compute_dtype,
+    storage_dtype,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from numpy.typing import NDArray
+
+    from dagflow.core.input import Input
+    from dagflow.core.output import Output
+
+    from dgf_detector.precision import PrecisionsType
+
+
+class AxisDistortionMatrixComposite(Node):
+    """For a given histogram and a sequence of distortions of the X axis compute
+    the conversion matrix.
+
+    Each distortion is given pointwise as a pair of arrays (`DistortionOriginal_i`,
+    `DistortionTarget_i`), the modified edges are passed as the pair of the
+    original and the modified edges. The distortions are applied in the order of
+    their index. The curves are composed into a single piecewise linear curve on
+    the merged grid, which is then used to compute the matrix in a single sweep.
+
+    The dtype of the matrix is chosen by the `precision` policy, see
+    `dgf_detector.precision`, the curves are composed in the computation dtype.
+    """
+
+    __slots__ = (
+        "_edges_original",
+        "_edges_target",
+        "_distortions_original",
+        "_distortions_target",
+        "_buffers",
+        "_npoints",
+        "_edges_checked",
+        "_precision",
+        "_convert",
+        "_result",
+    )
+
+    _edges_original: Input
+    _edges_target: Input
+    _distortions_original: tuple[Input, ...]
+    _distortions_target: tuple[Input, ...]
+    _buffers: NDArray
+    _npoints: int
+    _edges_checked: bool
+    _precision: str
+    _convert: InputConverter
+    _result: Output
+
+    def __init__(
+        self, *args, ndistortions: int = 2, precision: PrecisionsType = "inputs", **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.labels.setdefaults(
+            {
+                "text": r"Bin edges distortion matrix (composite)",
+            }
+        )
+        if ndistortions < 1:
+            raise InitializationError(
+                f"`ndistortions` must be positive, but given {ndistortions}", node=self
+            )
+        check_precision(precision, node=self)
+        self._precision = precision
+        self._convert = InputConverter()
+        self._edges_checked = False
+        self._edges_original = self._add_input("EdgesOriginal", positional=False)
+        self._edges_target = self._add_input("EdgesTarget", positional=False)
+        self._distortions_original = tuple(
+            self._add_input(f"DistortionOriginal_{i}", positional=False)  # X
+            for i in range(ndistortions)
+        )
+        self._distortions_target = tuple(
+            self._add_input(f"DistortionTarget_{i}", positional=False)  # Y
+            for i in range(ndistortions)
+        )
+        self._result = self._add_output("matrix")  # output: 0
+        self._npoints = 0
+
+        self._functions_dict.update(
+            {
+                "python": self._function_python,
+                "numba": self._function_numba,
+            }
+        )
+
+    @property
+    def ndistortions(self) -> int:
+        return len(self._distortions_original)
+
+    @property
+    def precision(self) -> str:
+        return self._precision
+
+    @property
+    def composed_distortion(self) -> tuple[NDArray, NDArray]:
+        """The composed curve (X, Y), used for the last matrix computation"""
+        if self.ndistortions == 1:
+            return self._distortions_original[0].data, self._distortions_target[0].data
+        ibuffer = (self.ndistortions - 2) % 2
+        return (
+            self._buffers[ibuffer, 0, : self._npoints],
+            self._buffers[ibuffer, 1, : self._npoints],
+        )
+
+    def _compose(self, compose: Callable) -> tuple[NDArray, NDArray]:
+        x = self._convert(self._distortions_original[0])
+        y = self._convert(self._distortions_target[0])
+        npoints = x.size
+        for i, (input_x, input_y) in enumerate(
+            zip(self._distortions_original[1:], self._distortions_target[1:])
+        ):
+            buffer_x, buffer_y = self._buffers[i % 2]
+            npoints = compose(
+                x, y, self._convert(input_x), self._convert(input_y), buffer_x, buffer_y
+            )
+            if npoints < 0:
+                raise RuntimeError(
+                    f"Unable to compose distortion {i+1}: the number of points exceeds "
+                    f"the capacity ({buffer_x.size}), the distortions should be monotonous"
+                )
+            x, y = buffer_x[:npoints], buffer_y[:npoints]
+        self._npoints = npoints
+        return x, y
+
+    def _check_edges(self) -> None:
+        """Check the target edges against the original ones, only if they have changed since the last check"""
+        if self._edges_checked:
+            return
+        _check_edges_are_identical(self._edges_original, self._edges_target)
+        self._edges_checked = True
+
+    def taint(self, *, caller: Input | None = None, **kwargs):
+        # the edges are checked again, unless the taint comes from the distortions
+        distortions = self._distortions_original + self._distortions_target
+        if not any(caller is input for input in distortions):
+            self._edges_checked = False
+        return super().taint(caller=caller, **kwargs)
+
+    def _function_python(self):
+        self._check_edges()
+        x, y = self._compose(_compose_pointwise_python)
+        _axisdistortion_pointwise_python(
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            x,
+            y,
+            self._result._data,
+        )
+
+    def _function_numba(self):
+        self._check_edges()
+        x, y = self._compose(_compose_pointwise_numba)
+        _axisdistortion_pointwise_numba(
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            x,
+            y,
+            self._result._data,
+        )
+
+    def _type_function(self) -> None:
+        """A output takes this function to determine the dtype and shape."""
+        names_edges = ("EdgesOriginal", "EdgesTarget")
+        names_distortions = tuple(
+            input.name for input in self._distortions_original + self._distortions_target
+        )
+        check_dimension_of_inputs(self, names_edges + names_distortions, 1)
+        check_inputs_have_same_dtype(self, names_edges + names_distortions)
+        (nedges,) = check_inputs_have_same_shape(self, names_edges)
+        check_size_of_inputs(self, "EdgesOriginal", min=2)
+        capacity = 0
+        for input_x, input_y in zip(self._distortions_original, self._distortions_target):
+            (npoints,) = check_inputs_have_same_shape(self, (input_x.name, input_y.name))
+            check_size_of_inputs(self, input_x.name, min=2)
+            capacity += npoints
+        copy_dtype_from_inputs_to_outputs(self, "EdgesOriginal", "matrix")
+        evaluate_dtype_of_outputs(self, names_edges + names_distortions, "matrix")
+        dtype = self._edges_original.dd.dtype
+        self._result.dd.dtype = storage_dtype(self._precision, dtype)
+        dtype_compute = compute_dtype(self._precision, dtype)
+        self._convert.allocate(
+            (self.inputs[name] for name in names_edges + names_distortions), dtype_compute
+        )
+
+        self._result.dd.shape = (nedges - 1, nedges - 1)
+        edges_original = self._edges_original.parent_output
+        edges_target = self._edges_target.parent_output
+        self._result.dd.axes_edges = (edges_target, edges_original)
+
+        # two pairs of (X, Y) buffers, used in turn for the sequential composition
+        self._buffers = empty((2, 2, capacity), dtype=dtype_compute)
+        self._edges_checked = False
+        self.function = self._functions_dict["numba"]
+
+
+def _compose_pointwise_python(
+    x_first: NDArray,
+    y_first: NDArray,
+    x_second: NDArray,
+    y_second: NDArray,
+    x_result: NDArray,
+    y_result: NDArray,
+) -> int:
+    """Compose two piecewise linear functions: second(first(x)).
+
+    The resulting curve contains the points of the first curve and the
+    projections of the points of the second curve. The second curve is
+    extrapolated linearly. Returns the number of points or -1 if the capacity
+    of the result is not enough.
+    """
+    n_first = x_first.size
+    n_second = x_second.size
+    capacity = x_result.size
+
+    # number of points of the second curve, which are below or at the current value
+    u0 = y_first[0]
+    idx_second = 0
+    while idx_second < n_second and x_second[idx_second] <= u0:
+        idx_second += 1
+
+    n = 0
+    for idx_first in range(n_first):
+        u0 = y_first[idx_first]
+        if n >= capacity:
+            return -1
+        iseg = min(max(idx_second - 1, 0), n_second - 2)
+        x_result[n] = x_first[idx_first]
+        y_result[n] = y_second[iseg] + (u0 - x_second[iseg]) * (
+            y_second[iseg + 1] - y_second[iseg]
+        ) / (x_second[iseg + 1] - x_second[iseg])
+        n += 1
+
+        if idx_first == n_first - 1:
+            break
+
+        x0, x1 = x_first[idx_first], x_first[idx_first + 1]
+        u1 = y_first[idx_first + 1]
+        if u1 > u0:
+            while idx_second < n_second and x_second[idx_second] <= u1:
+                u = x_second[idx_second]
+                if u < u1:
+                    if n >= capacity:
+                        return -1
+                    x_result[n] = x0 + (u - u0) * (x1 - x0) / (u1 - u0)
+                    y_result[n] = y_second[idx_second]
+                    n += 1
+                idx_second += 1
+        elif u1 < u0:
+            while idx_second > 0 and x_second[idx_second - 1] > u1:
+                u = x_second[idx_second - 1]
+                if u < u0:
+                    if n >= capacity:
+                        return -1
+                    x_result[n] = x0 + (u - u0) * (x1 - x0) / (u1 - u0)
+                    y_result[n] = y_second[idx_second - 1]
+                    n += 1
+                idx_second -= 1
+
+    return n
+
+
+_compose_pointwise_numba: Callable[
+    [NDArray, NDArray, NDArray, NDArray, NDArray, NDArray], int
+] = njit(cache=True)(_compose_pointwise_python)
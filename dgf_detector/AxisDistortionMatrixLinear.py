@@ -2,9 +2,21 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-from numpy import allclose
+from numpy import (
+    argsort,
+    concatenate,
+    count_nonzero,
+    cumsum,
+    empty,
+    flatnonzero,
+    isnan,
+    nan,
+    searchsorted,
+    where,
+)
 from numba import njit
 
+from dagflow.core.exception import InitializationError
 from dagflow.core.node import Node
 from dagflow.core.type_functions import (
     check_dimension_of_inputs,
@@ -15,6 +27,15 @@ from dagflow.core.type_functions import (
     evaluate_dtype_of_outputs,
 )
 
+from dgf_detector.AxisDistortionMatrix import AxisDistortionModes
+from dgf_detector.edges import _check_edges_are_identical
+from dgf_detector.precision import (
+    InputConverter,
+    check_precision,
+    compute_dtype,
+    storage_dtype,
+)
+
 if TYPE_CHECKING:
     from collections.abc import Callable
 
@@ -23,32 +44,70 @@ if TYPE_CHECKING:
     from dagflow.core.input import Input
     from dagflow.core.output import Output
 
+    from dgf_detector.AxisDistortionMatrix import AxisDistortionModesType
+    from dgf_detector.precision import PrecisionsType
+
 
 class AxisDistortionMatrixLinear(Node):
     """For a given historam and distorted X axis compute the conversion matrix.
 
-    Distortion is assumed to be linear.
+    Distortion is assumed to be linear. The mode "trace" runs the compiled
+    sweep, recording each step, see `trace`. The mode "numpy" computes the
+    matrix without JIT compilation. For `precision` see `dgf_detector.precision`.
     """
 
     __slots__ = (
         "_edges_original",
         "_edges_target",
         "_edges_modified",
+        "_mode",
+        "_precision",
+        "_convert",
+        "_trace_capacity",
+        "_trace_steps",
+        "_trace_weights",
+        "_edges_checked",
         "_result",
     )
 
     _edges_original: Input
     _edges_target: Input
     _edges_modified: Input
+    _mode: str
+    _precision: str
+    _convert: InputConverter
+    _trace_capacity: int | None
+    _trace_steps: NDArray | None
+    _trace_weights: NDArray | None
+    _edges_checked: bool
     _result: Output
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        mode: AxisDistortionModesType = "numba",
+        precision: PrecisionsType = "inputs",
+        trace_capacity: int | None = None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
         self.labels.setdefaults(
             {
                 "text": r"Bin edges distortion matrix",
             }
         )
+        if mode not in AxisDistortionModes:
+            raise InitializationError(
+                f"mode must be in {AxisDistortionModes}, but given {mode}!", node=self
+            )
+        check_precision(precision, node=self)
+        self._mode = mode
+        self._precision = precision
+        self._convert = InputConverter()
+        self._trace_capacity = trace_capacity
+        self._trace_steps = None
+        self._trace_weights = None
+        self._edges_checked = False
         self._edges_original = self._add_input("EdgesOriginal", positional=False)
         self._edges_target = self._add_input("EdgesTarget", positional=False)
         self._edges_modified = self._add_input("EdgesModified", positional=False)
@@ -58,23 +117,85 @@ class AxisDistortionMatrixLinear(Node):
             {
                 "python": self._function_python,
                 "numba": self._function_numba,
+                "numpy": self._function_numpy,
+                "trace": self._function_trace,
             }
         )
 
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @property
+    def precision(self) -> str:
+        return self._precision
+
+    @property
+    def trace(self) -> tuple[NDArray, NDArray] | None:
+        """The steps of the last sweep, recorded in the "trace" mode.
+
+        Returns a pair of arrays:
+            - steps (Nx4): index of the target edge, column, row, edge crossed
+              first (1: modified, 2: target)
+            - weights (N): the matrix element, assigned at the step
+
+        The trace is truncated if the number of steps exceeds `trace_capacity`.
+        """
+        if self._trace_steps is None:
+            return None
+        nsteps = count_nonzero(~isnan(self._trace_weights))
+        return self._trace_steps[:nsteps], self._trace_weights[:nsteps]
+
+    def _check_edges(self) -> None:
+        """Check the target edges against the original ones, only if they have changed since the last check"""
+        if self._edges_checked:
+            return
+        _check_edges_are_identical(self._edges_original, self._edges_target, self._mode)
+        self._edges_checked = True
+
+    def taint(self, *, caller: Input | None = None, **kwargs):
+        # the edges are checked again, unless the taint comes from the distortion
+        if caller is not self._edges_modified:
+            self._edges_checked = False
+        return super().taint(caller=caller, **kwargs)
+
     def _function_python(self):
+        self._check_edges()
         _axisdistortion_linear_python(
-            self._edges_original.data,
-            self._edges_target.data,
-            self._edges_modified.data,
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            self._convert(self._edges_modified),
             self._result._data,
         )
 
     def _function_numba(self):
+        self._check_edges()
+        _axisdistortion_linear_numba(
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            self._convert(self._edges_modified),
+            self._result._data,
+        )
+
+    def _function_numpy(self):
+        self._check_edges()
+        _axisdistortion_linear_numpy(
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            self._convert(self._edges_modified),
+            self._result._data,
+        )
+
+    def _function_trace(self):
+        self._check_edges()
+        self._trace_weights[:] = nan
         _axisdistortion_linear_numba(
-            self._edges_original.data,
-            self._edges_target.data,
-            self._edges_modified.data,
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            self._convert(self._edges_modified),
             self._result._data,
+            self._trace_steps,
+            self._trace_weights,
         )
 
     def _type_function(self) -> None:
@@ -86,12 +207,22 @@ class AxisDistortionMatrixLinear(Node):
         check_size_of_inputs(self, "EdgesOriginal", min=1)
         copy_dtype_from_inputs_to_outputs(self, "EdgesOriginal", "matrix")
         evaluate_dtype_of_outputs(self, names_edges, "matrix")
+        dtype = self._edges_original.dd.dtype
+        self._result.dd.dtype = storage_dtype(self._precision, dtype)
+        self._convert.allocate(
+            (self.inputs[name] for name in names_edges), compute_dtype(self._precision, dtype)
+        )
 
         self._result.dd.shape = (nedges - 1, nedges - 1)
         edges_original = self._edges_original.parent_output
         edges_target = self._edges_target.parent_output
         self._result.dd.axes_edges = (edges_target, edges_original)
-        self.function = self._functions_dict["numba"]
+        if self._mode == "trace":
+            capacity = self._trace_capacity or 4 * nedges
+            self._trace_steps = empty((capacity, 4), dtype="i")
+            self._trace_weights = empty(capacity, dtype="d")
+        self._edges_checked = False
+        self.function = self._functions_dict[self._mode]
 
 
 def _axisdistortion_linear_python(
@@ -99,10 +230,11 @@ def _axisdistortion_linear_python(
     edges_target: NDArray,
     edges_modified: NDArray,
     matrix: NDArray,
+    trace_steps: NDArray | None = None,
+    trace_weights: NDArray | None = None,
 ):
     # in general, target edges may be different (finer than original), the code should be able to handle it.
-    # but currently we just check that edges are the same.
-    assert edges_original is edges_target or allclose(edges_original, edges_target, atol=0.0, rtol=0.0)
+    # but currently the edges are expected to be the same, which is checked by the node.
     min_target = edges_target[0]
     nbinsx = edges_original.size - 1
     nbinsy = edges_target.size - 1
@@ -110,26 +242,23 @@ def _axisdistortion_linear_python(
     matrix[:, :] = 0.0
 
     threshold = -1e10
-    # left_axis = 0
     right_axis = 0
     idxy0, idxy1, idxy = -1, -1, 0
-    # leftx_fine = threshold
     lefty_fine = threshold
     while idxy0 < 0 or lefty_fine <= threshold or lefty_fine < min_target:
         left_edge_from_x = edges_modified[idxy0 + 1] < edges_target[idxy1 + 1]
         if left_edge_from_x:
-            # leftx_fine = edges_original[idxy0 + 1]
             lefty_fine = edges_modified[idxy0 + 1]
-            # left_axis = 0
             if (idxy0 := idxy0 + 1) >= nbinsx:
                 return
         else:
-            # leftx_fine = -1
             lefty_fine = edges_target[idxy1 + 1]
-            # left_axis = 1
             if (idxy1 := idxy1 + 1) >= nbinsy:
                 return
 
+    # number of the recorded trace steps, used only if `trace_steps` is provided
+    itrace = 0
+
     width_coarse = edges_modified[idxy0 + 1] - edges_modified[idxy0]
     while True:
         right_modified = edges_modified[idxy0 + 1]
@@ -137,31 +266,25 @@ def _axisdistortion_linear_python(
 
         if right_modified < right_target:
             righty_fine = right_modified
-            # rightx_fine = edges_original[idxy0 + 1]
             right_axis = 0
         else:
             righty_fine = right_target
-            # rightx_fine = -1
             right_axis = 1
 
         while lefty_fine >= edges_target[idxy + 1]:
             if (idxy := idxy + 1) > nbinsy:
                 break
 
-        #
-        # Uncomment the following lines to see the debug output
-        # (you need to also uncomment all the `left_axis` lines)
-        #
-        # width_fine = righty_fine-lefty_fine
-        # factor = width_fine/width_coarse
-        # print(
-        #         f"x:{leftx_fine:8.4f}→{rightx_fine:8.4f} "
-        #         f"ax:{left_axis}→{right_axis} idxy:{idxy0: 4d},{idxy1: 4d} idxy: {idxy: 4d} "
-        #         f"y:{lefty_fine:8.4f}→{righty_fine:8.4f}/{edges_modified[idxy0]:8.4f}→{edges_modified[idxy0+1]:8.4f}="
-        #         f"{width_fine:8.4f}/{width_coarse:8.4f}={factor:8.4g} "
-        # )
-
-        matrix[idxy, idxy0] = (righty_fine - lefty_fine) / width_coarse
+        element = (righty_fine - lefty_fine) / width_coarse
+        matrix[idxy, idxy0] = element
+
+        if trace_steps is not None and itrace < trace_steps.shape[0]:
+            trace_steps[itrace, 0] = idxy1
+            trace_steps[itrace, 1] = idxy0
+            trace_steps[itrace, 2] = idxy
+            trace_steps[itrace, 3] = right_axis + 1
+            trace_weights[itrace] = element
+            itrace += 1
 
         if right_axis == 0:
             if (idxy0 := idxy0 + 1) >= nbinsx:
@@ -170,10 +293,43 @@ def _axisdistortion_linear_python(
         elif (idxy1 := idxy1 + 1) >= nbinsx:
             break
         lefty_fine = righty_fine
-        # leftx_fine = rightx_fine
-        # left_axis = right_axis
 
 
-_axisdistortion_linear_numba: Callable[[NDArray, NDArray, NDArray, NDArray], None] = njit(
-    cache=True
-)(_axisdistortion_linear_python)
+_axisdistortion_linear_numba: Callable[
+    [NDArray, NDArray, NDArray, NDArray, NDArray | None, NDArray | None], None
+] = njit(cache=True)(_axisdistortion_linear_python)
+
+
+def _axisdistortion_linear_numpy(
+    edges_original: NDArray,
+    edges_target: NDArray,
+    edges_modified: NDArray,
+    matrix: NDArray,
+) -> None:
+    """The same as `_axisdistortion_linear_python`, vectorized.
+
+    The modified and the target edges are merged by a stable sort, each pair of
+    the consecutive points within the range defines an element.
+    """
+    nedges = edges_target.size
+
+    matrix[:, :] = 0.0
+
+    # on equal values the target edge goes first, as in the sweep
+    points = concatenate((edges_target, edges_modified))
+    order = argsort(points, kind="stable")
+    from_modified = order >= nedges
+    index = where(from_modified, order - nedges, order)
+    y = points[order]
+    columns = cumsum(from_modified) - 1
+
+    starts = flatnonzero((columns >= 0) & (y > -1e10) & (y >= edges_target[0]))
+    ilast = flatnonzero(index == nedges - 1)[0]
+    if not starts.size or starts[0] >= ilast:
+        return
+    pieces = slice(starts[0], ilast)
+
+    columns = columns[pieces]
+    rows = searchsorted(edges_target, y[pieces], side="right") - 1
+    widths = edges_modified[columns + 1] - edges_modified[columns]
+    matrix[rows, columns] = (y[pieces.start + 1 : pieces.stop + 1] - y[pieces]) / widths
@@ -3,8 +3,26 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 from numba import njit
-from numpy import allclose, digitize, fabs
+from numpy import (
+    add,
+    arange,
+    concatenate,
+    count_nonzero,
+    cumsum,
+    digitize,
+    empty,
+    fabs,
+    interp,
+    isnan,
+    maximum,
+    minimum,
+    nan,
+    repeat,
+    searchsorted,
+    sort,
+)
 
+from dagflow.core.exception import InitializationError
 from dagflow.core.node import Node
 from dagflow.core.type_functions import (
     check_dimension_of_inputs,
@@ -15,6 +33,15 @@ from dagflow.core.type_functions import (
     evaluate_dtype_of_outputs,
 )
 
+from dgf_detector.AxisDistortionMatrix import AxisDistortionModes
+from dgf_detector.edges import _check_edges_are_identical
+from dgf_detector.precision import (
+    InputConverter,
+    check_precision,
+    compute_dtype,
+    storage_dtype,
+)
+
 if TYPE_CHECKING:
     from collections.abc import Callable
 
@@ -23,11 +50,16 @@ if TYPE_CHECKING:
     from dagflow.core.input import Input
     from dagflow.core.output import Output
 
+    from dgf_detector.AxisDistortionMatrix import AxisDistortionModesType
+    from dgf_detector.precision import PrecisionsType
+
 
 class AxisDistortionMatrixPointwise(Node):
     """For a given historam and distorted X axis compute the conversion matrix.
 
-    Distortion is assumed to be linear.
+    Distortion is assumed to be linear. The mode "trace" runs the compiled
+    sweep, recording each step, see `trace`. The mode "numpy" computes the
+    matrix without JIT compilation. For `precision` see `dgf_detector.precision`.
     """
 
     __slots__ = (
@@ -35,21 +67,54 @@ class AxisDistortionMatrixPointwise(Node):
         "_edges_target",
         "_distortion_original",
         "_distortion_target",
+        "_mode",
+        "_precision",
+        "_convert",
+        "_trace_capacity",
+        "_trace_steps",
+        "_trace_weights",
+        "_edges_checked",
         "_result",
     )
 
     _edges_original: Input
     _edges_target: Input
     _edges_modified: Input
+    _mode: str
+    _precision: str
+    _convert: InputConverter
+    _trace_capacity: int | None
+    _trace_steps: NDArray | None
+    _trace_weights: NDArray | None
+    _edges_checked: bool
     _result: Output
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        mode: AxisDistortionModesType = "numba",
+        precision: PrecisionsType = "inputs",
+        trace_capacity: int | None = None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
         self.labels.setdefaults(
             {
                 "text": r"Bin edges distortion matrix",
             }
         )
+        if mode not in AxisDistortionModes:
+            raise InitializationError(
+                f"mode must be in {AxisDistortionModes}, but given {mode}!", node=self
+            )
+        check_precision(precision, node=self)
+        self._mode = mode
+        self._precision = precision
+        self._convert = InputConverter()
+        self._trace_capacity = trace_capacity
+        self._trace_steps = None
+        self._trace_weights = None
+        self._edges_checked = False
         self._edges_original = self._add_input("EdgesOriginal", positional=False)
         self._edges_target = self._add_input("EdgesTarget", positional=False)
         self._distortion_original = self._add_input(
@@ -64,27 +129,91 @@ class AxisDistortionMatrixPointwise(Node):
             {
                 "python": self._function_python,
                 "numba": self._function_numba,
+                "numpy": self._function_numpy,
+                "trace": self._function_trace,
             }
         )
 
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @property
+    def precision(self) -> str:
+        return self._precision
+
+    @property
+    def trace(self) -> tuple[NDArray, NDArray] | None:
+        """The steps of the last sweep, recorded in the "trace" mode.
+
+        Returns a pair of arrays:
+            - steps (Nx4): segment of the curve, column, row, edges crossed
+              first (bits: 1: X, 2: top Y, 4: bottom Y, 0: none, next segment)
+            - weights (N): the matrix element, added at the step, or -1
+
+        The trace is truncated if the number of steps exceeds `trace_capacity`.
+        """
+        if self._trace_steps is None:
+            return None
+        nsteps = count_nonzero(~isnan(self._trace_weights))
+        return self._trace_steps[:nsteps], self._trace_weights[:nsteps]
+
+    def _check_edges(self) -> None:
+        """Check the target edges against the original ones, only if they have changed since the last check"""
+        if self._edges_checked:
+            return
+        _check_edges_are_identical(self._edges_original, self._edges_target, self._mode)
+        self._edges_checked = True
+
+    def taint(self, *, caller: Input | None = None, **kwargs):
+        # the edges are checked again, unless the taint comes from the distortion
+        if caller is not self._distortion_original and caller is not self._distortion_target:
+            self._edges_checked = False
+        return super().taint(caller=caller, **kwargs)
+
     def _function_python(self):
+        self._check_edges()
         _axisdistortion_pointwise_python(
-            self._edges_original.data,
-            self._edges_target.data,
-            self._distortion_original.data,
-            self._distortion_target.data,
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            self._convert(self._distortion_original),
+            self._convert(self._distortion_target),
             self._result._data,
         )
 
     def _function_numba(self):
+        self._check_edges()
         _axisdistortion_pointwise_numba(
-            self._edges_original.data,
-            self._edges_target.data,
-            self._distortion_original.data,
-            self._distortion_target.data,
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            self._convert(self._distortion_original),
+            self._convert(self._distortion_target),
             self._result._data,
         )
 
+    def _function_numpy(self):
+        self._check_edges()
+        _axisdistortion_pointwise_numpy(
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            self._convert(self._distortion_original),
+            self._convert(self._distortion_target),
+            self._result._data,
+        )
+
+    def _function_trace(self):
+        self._check_edges()
+        self._trace_weights[:] = nan
+        _axisdistortion_pointwise_numba(
+            self._convert(self._edges_original),
+            self._convert(self._edges_target),
+            self._convert(self._distortion_original),
+            self._convert(self._distortion_target),
+            self._result._data,
+            self._trace_steps,
+            self._trace_weights,
+        )
+
     def _type_function(self) -> None:
         """A output takes this function to determine the dtype and shape."""
         names_edges = (
@@ -96,17 +225,27 @@ class AxisDistortionMatrixPointwise(Node):
         check_dimension_of_inputs(self, names_edges, 1)
         check_inputs_have_same_dtype(self, names_edges)
         (nedges,) = check_inputs_have_same_shape(self, names_edges[:2])
-        check_inputs_have_same_shape(self, names_edges[2:])
+        (npoints,) = check_inputs_have_same_shape(self, names_edges[2:])
         check_size_of_inputs(self, "EdgesOriginal", min=2)
         check_size_of_inputs(self, "DistortionOriginal", min=2)
         copy_dtype_from_inputs_to_outputs(self, "EdgesOriginal", "matrix")
         evaluate_dtype_of_outputs(self, names_edges, "matrix")
+        dtype = self._edges_original.dd.dtype
+        self._result.dd.dtype = storage_dtype(self._precision, dtype)
+        self._convert.allocate(
+            (self.inputs[name] for name in names_edges), compute_dtype(self._precision, dtype)
+        )
 
         self._result.dd.shape = (nedges - 1, nedges - 1)
         edges_original = self._edges_original.parent_output
         edges_target = self._edges_target.parent_output
         self._result.dd.axes_edges = (edges_target, edges_original)
-        self.function = self._functions_dict["numba"]
+        if self._mode == "trace":
+            capacity = self._trace_capacity or 2 * (npoints + 2 * nedges)
+            self._trace_steps = empty((capacity, 4), dtype="i")
+            self._trace_weights = empty(capacity, dtype="d")
+        self._edges_checked = False
+        self.function = self._functions_dict[self._mode]
 
 
 @njit
@@ -124,12 +263,11 @@ def _axisdistortion_pointwise_python(
     distortion_original: NDArray,
     distortion_target: NDArray,
     matrix: NDArray,
+    trace_steps: NDArray | None = None,
+    trace_weights: NDArray | None = None,
 ):
     # in general, target edges may be different (finer than original), the code should be able to handle it.
-    # but currently we just check that edges are the same.
-    assert edges_original is edges_target or allclose(
-        edges_original, edges_target, atol=0.0, rtol=0.0
-    )
+    # but currently the edges are expected to be the same, which is checked by the node.
     matrix[:, :] = 0.0
 
     if (
@@ -145,13 +283,6 @@ def _axisdistortion_pointwise_python(
     idx_last_point = n_points - 1
     last_x = distortion_original[idx_last_point]
 
-    # fmt: off
-    # print(                                                                                             # debug
-    #     f"np {distortion_original.size} nex {edges_original.size} ney {edges_target.size}"             # debug
-    #     " "                                                                                            # debug
-    #     f"nbx {edges_original.size-1} nby {edges_target.size-1}"                                       # debug
-    # )                                                                                                  # debug
-    # fmt: on
     large_negative_number = -1e30
     large_positive_number = -large_negative_number
 
@@ -199,7 +330,8 @@ def _axisdistortion_pointwise_python(
         skip_incomplete_x = (x0 != left_x) & (y0 > bottom_y) & (y0 < top_y)
     width_x_full = right_x - left_x
 
-    # print(f"start ix {bin_idx_x} iy {bin_idx_y}")                                                      # debug
+    # number of the recorded trace steps, used only if `trace_steps` is provided
+    itrace = 0
 
     did_advance = True
     is_inside_limits = False
@@ -256,50 +388,17 @@ def _axisdistortion_pointwise_python(
                 right = right_x_from_bottom_y
                 passed_any = True
 
-        # fmt: off
-        ## Uncomment the following lines to see the debug output
-        # debug_is_inside_limits = (                                                                     # debug
-        #     (bin_idx_x >= 0)                                                                           # debug
-        #     & (bin_idx_y >= 0)                                                                         # debug
-        #     & (bin_idx_y < n_bins_y)                                                                   # debug
-        # )                                                                                              # debug
-        # if debug_is_inside_limits:                                                                     # debug
-        #     debug_dx_fine = right - left                                                               # debug
-        #     debug_dx_coarse = right_x - left_x                                                         # debug
-        #     debug_weight = debug_dx_fine / debug_dx_coarse                                             # debug
-        # else:                                                                                          # debug
-        #     debug_dx_fine = -1                                                                         # debug
-        #     debug_dx_coarse = -1                                                                       # debug
-        #     debug_weight = -1                                                                          # debug
-        # print(                                                                                         # debug
-        #     f"{debug_is_inside_limits and 'n' or 'i'} "                                                # debug
-        #     f"seg {idx: 4d}: x {x0:0.2g},{x1:0.2g} → y {y0:0.2g},{y1:0.2g}"                            # debug
-        #     " "                                                                                        # debug
-        #     f"ex {bin_idx_x: 2d}: {left_x:0.2g}→{right_x:0.2g}"                                        # debug
-        #     " "                                                                                        # debug
-        #     f"ey {bin_idx_y: 2d}: {bottom_y:0.2g}→{top_y:0.2g}"                                        # debug
-        #     " "                                                                                        # debug
-        #     f"p{passed_any:d} "                                                                        # debug
-        #     f"X{passed_x:d}{passed_x_first:d} "                                                        # debug
-        #     f"Y{passed_top_y:d}{passed_top_y_first:d} "                                                # debug
-        #     f"y{passed_bottom_y:d}{passed_bottom_y_first:d}"                                           # debug
-        #     " "                                                                                        # debug
-        #     f"fn {left:0.2g}→{right:0.2g}={debug_dx_fine:0.2g}"                                        # debug
-        #     " "                                                                                        # debug
-        #     f"cs {left_x:0.2g}→{right_x:0.2g}={debug_dx_coarse:0.2g}"                                  # debug
-        #     " "                                                                                        # debug
-        #     f"w {debug_weight}"                                                                        # debug
-        #     " "                                                                                        # debug
-        #     f"[{bin_idx_y}, {bin_idx_x}]"                                                              # debug
-        #     " "                                                                                        # debug
-        #     f"sk {skip_incomplete_x:d}"                                                                # debug
-        # )                                                                                              # debug
-        # fmt: on
-
         if not passed_any:
+            if trace_steps is not None and itrace < trace_steps.shape[0]:
+                trace_steps[itrace, 0] = idx
+                trace_steps[itrace, 1] = bin_idx_x
+                trace_steps[itrace, 2] = bin_idx_y
+                trace_steps[itrace, 3] = 0
+                trace_weights[itrace] = -1.0
+                itrace += 1
+
             idx += 1
             if idx >= idx_last_point:
-                # print("break idx")                                                                     # debug
                 break
 
             x0 = distortion_original[idx]
@@ -311,6 +410,7 @@ def _axisdistortion_pointwise_python(
 
             continue
 
+        element = -1.0
         is_inside_limits = (not skip_incomplete_x) & (
             (bin_idx_x >= 0) & (bin_idx_y >= 0) & (bin_idx_y < n_bins_y)
         )
@@ -322,6 +422,16 @@ def _axisdistortion_pointwise_python(
                 # += takes into acount possibility to return to current element bu up/down or down/up movement
                 matrix[bin_idx_y, bin_idx_x] += element
 
+        if trace_steps is not None and itrace < trace_steps.shape[0]:
+            trace_steps[itrace, 0] = idx
+            trace_steps[itrace, 1] = bin_idx_x
+            trace_steps[itrace, 2] = bin_idx_y
+            trace_steps[itrace, 3] = (
+                passed_x_first * 1 + passed_top_y_first * 2 + passed_bottom_y_first * 4
+            )
+            trace_weights[itrace] = element
+            itrace += 1
+
         skip_incomplete_x = False
         if left < right:
             left = right
@@ -329,13 +439,11 @@ def _axisdistortion_pointwise_python(
         if passed_x_first:
             bin_idx_x += 1
             if bin_idx_x >= n_bins_x:
-                # print("break idx x")                                                                   # debug
                 break
 
             left_x = edges_original[bin_idx_x]
             did_advance = True
             if left_x > last_x:
-                # print("break x")                                                                       # debug
                 break
 
             right_x = edges_original[bin_idx_x + 1]
@@ -364,10 +472,69 @@ def _axisdistortion_pointwise_python(
                 continue
             else:
                 bottom_y = large_negative_number
-    # else:                                                                                              # debug
-    #     print("break due to lack of advancement")                                                      # debug
 
 
 _axisdistortion_pointwise_numba: Callable[
-    [NDArray, NDArray, NDArray, NDArray, NDArray], None
+    [NDArray, NDArray, NDArray, NDArray, NDArray, NDArray | None, NDArray | None], None
 ] = njit(cache=True)(_axisdistortion_pointwise_python)
+
+
+def _axisdistortion_pointwise_numpy(
+    edges_original: NDArray,
+    edges_target: NDArray,
+    distortion_original: NDArray,
+    distortion_target: NDArray,
+    matrix: NDArray,
+) -> None:
+    """The same as `_axisdistortion_pointwise_python`, vectorized.
+
+    The curve is split at the crossings of the original edges (X) and of the
+    target edges (Y), the pieces between the consecutive crossings are assigned
+    to the bins by their midpoints. As in the sweep, the piece before the first
+    crossing is skipped if the curve starts within a bin and the piece after
+    the last crossing is skipped.
+    """
+    matrix[:, :] = 0.0
+
+    x, y = distortion_original, distortion_target
+    if x[0] >= edges_original[-1] or x[-1] < edges_original[0]:
+        return
+
+    n_bins_x = edges_original.size - 1
+    n_bins_y = edges_target.size - 1
+
+    # the crossings of the target edges `(y0, y1]` (rising) or `(y1, y0]` (falling) by each segment
+    y0, y1 = y[:-1], y[1:]
+    first = searchsorted(edges_target, minimum(y0, y1), side="right")
+    ncrossings = searchsorted(edges_target, maximum(y0, y1), side="right") - first
+    segments = repeat(arange(y0.size), ncrossings)
+    offsets = cumsum(ncrossings) - ncrossings
+    target = edges_target[first[segments] + arange(segments.size) - offsets[segments]]
+    x0, x1 = x[segments], x[segments + 1]
+    k = (y1[segments] - y0[segments]) / (x1 - x0)
+    x_from_y = (target - y0[segments]) / k + x0
+
+    x_from_x = edges_original[(edges_original > x[0]) & (edges_original <= x[-1])]
+    crossings = sort(concatenate((x_from_x, x_from_y)))
+    if not crossings.size:
+        return
+
+    # the first piece is skipped, unless the curve starts at an edge
+    ibin_x = searchsorted(edges_original, x[0], side="right") - 1
+    ibin_y = searchsorted(edges_target, y[0], side="right") - 1
+    starts_at_edge = (ibin_x >= 0 and edges_original[ibin_x] == x[0]) or (
+        ibin_y >= 0 and edges_target[ibin_y] == y[0]
+    )
+    if starts_at_edge:
+        crossings = concatenate(((x[0],), crossings))
+
+    left, right = crossings[:-1], crossings[1:]
+    middle = (left + right) * 0.5
+    columns = searchsorted(edges_original, middle, side="right") - 1
+    rows = searchsorted(edges_target, interp(middle, x, y), side="right") - 1
+    inside = (
+        (right > left) & (columns >= 0) & (columns < n_bins_x) & (rows >= 0) & (rows < n_bins_y)
+    )
+    columns = columns[inside]
+    widths = edges_original[columns + 1] - edges_original[columns]
+    add.at(matrix, (rows[inside], columns), (right - left)[inside] / widths)
@@ -16,20 +16,36 @@ if TYPE_CHECKING:
     from dagflow.core.node import Node
     from multikeydict.typing import KeyLike
 
+    from dgf_detector.EnergyResolutionMatrixBC import EnergyResolutionModesType
+    from dgf_detector.precision import PrecisionsType
+
 
 class EnergyResolution(MetaNode):
     __slots__ = (
         "_energy_resolution_matrix_bc_list",
         "_energy_resolution_sigma_rel_abc_list",
         "_bin_center_list",
+        "_mode",
+        "_precision",
     )
 
     _energy_resolution_matrix_bc_list: list[Node]
     _energy_resolution_sigma_rel_abc_list: list[Node]
     _bin_center_list: list[Node]
+    _mode: str
+    _precision: str
 
-    def __init__(self, *, bare: bool = False, labels: Mapping = {}):
+    def __init__(
+        self,
+        *,
+        bare: bool = False,
+        labels: Mapping = {},
+        mode: EnergyResolutionModesType = "numba",
+        precision: PrecisionsType = "inputs",
+    ):
         super().__init__()
+        self._mode = mode
+        self._precision = precision
         self._energy_resolution_matrix_bc_list = []
         self._energy_resolution_sigma_rel_abc_list = []
         self._bin_center_list = []
@@ -52,7 +68,7 @@ class EnergyResolution(MetaNode):
         label: Mapping = {},
     ) -> EnergyResolutionSigmaRelABC:
         _energy_resolution_sigma_rel_abc = EnergyResolutionSigmaRelABC(
-            name=name, label=label
+            name=name, label=label, mode=self._mode
         )
         self._energy_resolution_sigma_rel_abc_list.append(_energy_resolution_sigma_rel_abc)
         self._add_node(
@@ -82,7 +98,9 @@ class EnergyResolution(MetaNode):
         name: str = "EnergyResolution",
         label: Mapping = {},
     ) -> EnergyResolutionMatrixBC:
-        _energy_resolution_matrix_bc = EnergyResolutionMatrixBC(name, label=label)
+        _energy_resolution_matrix_bc = EnergyResolutionMatrixBC(
+            name, label=label, mode=self._mode, precision=self._precision
+        )
         self._energy_resolution_matrix_bc_list.append(_energy_resolution_matrix_bc)
         self._add_node(
             _energy_resolution_matrix_bc,
@@ -133,6 +151,8 @@ class EnergyResolution(MetaNode):
         path: str | None = None,
         labels: Mapping = {},
         replicate_outputs: tuple[KeyLike, ...] = ((),),
+        mode: EnergyResolutionModesType = "numba",
+        precision: PrecisionsType = "inputs",
         verbose: bool = False,
     ) -> tuple[EnergyResolution, NodeStorage]:
         storage = NodeStorage(default_containers=True)
@@ -140,7 +160,7 @@ class EnergyResolution(MetaNode):
         inputs = storage("inputs")
         outputs = storage("outputs")
 
-        instance = cls(bare=True)
+        instance = cls(bare=True, mode=mode, precision=precision)
         key_energy_resolution_matrix_bc = (
             names.get("EnergyResolutionMatrixBC", "EnergyResolutionMatrixBC"),
         )
@@ -1,11 +1,22 @@
 from __future__ import annotations
 
-from math import exp, sqrt
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Literal
 
 from numba import njit
-from numpy import allclose, pi
+from numpy import (
+    arange,
+    exp,
+    full,
+    log,
+    logical_or,
+    pi,
+    searchsorted,
+    sqrt,
+    zeros,
+    zeros_like,
+)
 
+from dagflow.core.exception import InitializationError
 from dagflow.core.node import Node
 from dagflow.core.type_functions import (
     AllPositionals,
@@ -15,6 +26,14 @@ from dagflow.core.type_functions import (
     find_max_size_of_inputs,
 )
 
+from dgf_detector.edges import _check_edges_are_identical
+from dgf_detector.precision import (
+    InputConverter,
+    check_precision,
+    compute_dtype,
+    storage_dtype,
+)
+
 if TYPE_CHECKING:
     from numpy import double
     from numpy.typing import NDArray
@@ -22,6 +41,12 @@ if TYPE_CHECKING:
     from dagflow.core.input import Input
     from dagflow.core.output import Output
 
+    from dgf_detector.precision import PrecisionsType
+
+
+EnergyResolutionModes = {"numba", "numpy"}
+EnergyResolutionModesType = Literal["numba", "numpy"]
+
 
 @njit(cache=True)
 def __resolution(e_true: double, e_rec: double, rel_sigma: double) -> double:
@@ -35,12 +60,9 @@ def __resolution(e_true: double, e_rec: double, rel_sigma: double) -> double:
 def _resolution(
     rel_sigma: NDArray[double],
     edges: NDArray[double],
-    edges_out: NDArray[double],
     result: NDArray[double],
     min_events: float,
 ) -> None:
-    assert edges is edges_out or allclose(edges, edges_out, atol=0.0, rtol=0.0)
-
     bincenter = lambda i: (edges[i] + edges[i + 1]) * 0.5
     nbins = len(rel_sigma)
     for itrue in range(nbins):
@@ -61,6 +83,52 @@ def _resolution(
             result[jrec, itrue] = r_events
 
 
+def _resolution_numpy(
+    rel_sigma: NDArray[double],
+    edges: NDArray[double],
+    result: NDArray[double],
+    min_events: float,
+) -> None:
+    """The same as `_resolution`, the Gaussian is broadcasted over a band around the diagonal.
+
+    Beyond `zmax` sigmas the number of events is below `min_events` even for the widest bin.
+    As in `_resolution`, a column is truncated at the first element below `min_events`
+    after the first element above it: on the irregular binning a wide bin far from the
+    peak may be above the threshold, but it is not kept.
+    """
+    centers = (edges[:-1] + edges[1:]) * 0.5
+    widths = edges[1:] - edges[:-1]
+    sigma = centers * rel_sigma
+    nbins = centers.size
+
+    result[:, :] = 0.0
+    if min_events > 0.0:
+        zmax = sqrt(
+            2.0 * log((widths.max() / (sqrt(2.0 * pi) * sigma * min_events)).clip(min=1.0))
+        )
+        first = searchsorted(centers, centers - zmax * sigma, side="left")
+        last = searchsorted(centers, centers + zmax * sigma, side="right")
+    else:
+        first = zeros(nbins, dtype="i")
+        last = full(nbins, nbins, dtype="i")
+    width = (last - first).max()
+    if width <= 0:
+        return
+
+    # the band: rows `first[i]:last[i]` of each column `i`
+    rows = first + arange(width)[:, None]
+    inside = rows < last
+    rows = rows.clip(max=nbins - 1)
+    columns = arange(nbins) + zeros_like(rows)
+    reldiff = (centers - centers[rows]) / sigma
+    r_events = widths[rows] * (exp(-0.5 * reldiff * reldiff) * (1.0 / sqrt(2.0 * pi)) / sigma)
+    above = inside & ~(r_events < min_events)
+    # the rows after the first row below the threshold, which follows a row above it
+    truncated = logical_or.accumulate(logical_or.accumulate(above, axis=0) & ~above, axis=0)
+    keep = above & ~truncated
+    result[rows[keep], columns[keep]] = r_events[keep]
+
+
 class EnergyResolutionMatrixBC(Node):
     """Energy resolution.
 
@@ -71,17 +139,44 @@ class EnergyResolutionMatrixBC(Node):
 
     outputs:
         `0` or `SmearMatrix`: SmearMatrixing weights (NxN)
+
+    The mode "numpy" computes the matrix without JIT compilation.
+
+    The dtype of the matrix is chosen by the `precision` policy from the dtype
+    of `RelSigma`, see `dgf_detector.precision`.
     """
 
-    __slots__ = ("_edges", "_edges_out", "_rel_sigma", "_smear_matrix", "_min_events")
+    __slots__ = (
+        "_edges",
+        "_edges_out",
+        "_rel_sigma",
+        "_smear_matrix",
+        "_min_events",
+        "_mode",
+        "_precision",
+        "_convert",
+        "_edges_checked",
+    )
 
     _edges: Input
     _edges_out: Input
     _rel_sigma: Input
     _smear_matrix: Output
     _min_events: float
+    _mode: str
+    _precision: str
+    _convert: InputConverter
+    _edges_checked: bool
 
-    def __init__(self, name, min_events: float = 1e-10, *args, **kwargs):
+    def __init__(
+        self,
+        name,
+        min_events: float = 1e-10,
+        *args,
+        mode: EnergyResolutionModesType = "numba",
+        precision: PrecisionsType = "inputs",
+        **kwargs,
+    ):
         super().__init__(name, *args, **kwargs)
         self.labels.setdefaults(
             {
@@ -91,21 +186,65 @@ class EnergyResolutionMatrixBC(Node):
                 "axis": r"$E_{res}$, MeV",
             }
         )
-        self._min_events = min_events
+        if mode not in EnergyResolutionModes:
+            raise InitializationError(
+                f"mode must be in {EnergyResolutionModes}, but given {mode}!", node=self
+            )
+        check_precision(precision, node=self)
+        self._min_events = float(min_events)
+        self._mode = mode
+        self._precision = precision
+        self._convert = InputConverter()
+        self._edges_checked = False
         self._rel_sigma = self._add_input("RelSigma")  # input: 0
         self._edges = self._add_input("Edges", positional=False)
         self._edges_out = self._add_input("EdgesOut", positional=False)
         self._smear_matrix = self._add_output("SmearMatrix")  # output: 0
+        self._functions_dict.update(
+            {
+                "numba": self._function_numba,
+                "numpy": self._function_numpy,
+            }
+        )
 
     @property
     def min_events(self) -> float:
         return self._min_events
 
-    def _function(self):
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @property
+    def precision(self) -> str:
+        return self._precision
+
+    def taint(self, *, caller: Input | None = None, **kwargs):
+        # the edges are checked again, unless the taint comes from the resolution
+        if caller is not self._rel_sigma:
+            self._edges_checked = False
+        return super().taint(caller=caller, **kwargs)
+
+    def _check_edges(self) -> None:
+        if self._edges_checked:
+            return
+        _check_edges_are_identical(self._edges, self._edges_out, self._mode)
+        self._edges_checked = True
+
+    def _function_numba(self):
+        self._check_edges()
         _resolution(
-            self._rel_sigma.data,
-            self._edges.data,
-            self._edges_out.data,
+            self._convert(self._rel_sigma),
+            self._convert(self._edges),
+            self._smear_matrix._data,
+            self._min_events,
+        )
+
+    def _function_numpy(self):
+        self._check_edges()
+        _resolution_numpy(
+            self._convert(self._rel_sigma),
+            self._convert(self._edges),
             self._smear_matrix._data,
             self._min_events,
         )
@@ -119,7 +258,12 @@ class EnergyResolutionMatrixBC(Node):
 
         rel_sigma_dd = self._rel_sigma.dd
         self._smear_matrix.dd.shape = (rel_sigma_dd.shape[0], rel_sigma_dd.shape[0])
-        self._smear_matrix.dd.dtype = rel_sigma_dd.dtype
+        self._smear_matrix.dd.dtype = storage_dtype(self._precision, rel_sigma_dd.dtype)
+        self._convert.allocate(
+            (self._rel_sigma, self._edges), compute_dtype(self._precision, rel_sigma_dd.dtype)
+        )
         edges = self._edges._parent_output
         edges_out = self._edges_out._parent_output
         self._smear_matrix.dd.axes_edges = (edges_out, edges)
+        self._edges_checked = False
+        self.function = self._functions_dict[self._mode]
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
-from math import sqrt
 from typing import TYPE_CHECKING
 
 from numba import njit
+from numpy import divide, sqrt
 
+from dagflow.core.exception import InitializationError
 from dagflow.core.node import Node
 from dagflow.core.type_functions import (
     AllPositionals,
@@ -14,6 +15,8 @@ from dagflow.core.type_functions import (
     copy_from_inputs_to_outputs,
 )
 
+from dgf_detector.EnergyResolutionMatrixBC import EnergyResolutionModes
+
 if TYPE_CHECKING:
     from numpy import double
     from numpy.typing import NDArray
@@ -21,6 +24,8 @@ if TYPE_CHECKING:
     from dagflow.core.input import Input
     from dagflow.core.output import Output
 
+    from dgf_detector.EnergyResolutionMatrixBC import EnergyResolutionModesType
+
 
 @njit(cache=True)
 def _rel_sigma(
@@ -38,6 +43,20 @@ def _rel_sigma(
         Sigma[i] = sqrt(a2 + b2 / e + c2 / (e * e))  # sqrt(a^2 + b^2/E + c^2/E^2)
 
 
+def _rel_sigma_numpy(
+    a: double,
+    b: double,
+    c: double,
+    Energy: NDArray[double],
+    Sigma: NDArray[double],
+):
+    divide(c * c, Energy, out=Sigma)
+    Sigma += b * b
+    divide(Sigma, Energy, out=Sigma)
+    Sigma += a * a
+    sqrt(Sigma, out=Sigma)
+
+
 class EnergyResolutionSigmaRelABC(Node):
     r"""
     Energy resolution $\sqrt(a^2 + b^2/E + c^2/E^2)$
@@ -50,17 +69,20 @@ class EnergyResolutionSigmaRelABC(Node):
 
     outputs:
         `0` or `RelSigma`: relative RelSigma for each bin (N elements)
+
+    The mode "numpy" computes the resolution without JIT compilation.
     """
 
-    __slots__ = ("_a_nonuniform", "_b_stat", "_c_noise", "_energy", "_rel_sigma")
+    __slots__ = ("_a_nonuniform", "_b_stat", "_c_noise", "_energy", "_rel_sigma", "_mode")
 
     _a_nonuniform: Input
     _b_stat: Input
     _c_noise: Input
     _energy: Input
     _rel_sigma: Output
+    _mode: str
 
-    def __init__(self, name, *args, **kwargs):
+    def __init__(self, name, *args, mode: EnergyResolutionModesType = "numba", **kwargs):
         super().__init__(name, *args, **kwargs)
         self.labels.setdefaults(
             {
@@ -69,6 +91,11 @@ class EnergyResolutionSigmaRelABC(Node):
                 "axis": r"$\sigma/E$",
             }
         )
+        if mode not in EnergyResolutionModes:
+            raise InitializationError(
+                f"mode must be in {EnergyResolutionModes}, but given {mode}!", node=self
+            )
+        self._mode = mode
         self._a_nonuniform, self._b_stat, self._c_noise = (
             self._add_inputs(  # pyright: ignore reportGeneralTypeIssues
                 ("a_nonuniform", "b_stat", "c_noise"), positional=False
@@ -76,8 +103,18 @@ class EnergyResolutionSigmaRelABC(Node):
         )
         self._energy = self._add_input("Energy")  # input: 0
         self._rel_sigma = self._add_output("RelSigma")  # output: 0
+        self._functions_dict.update(
+            {
+                "numba": self._function_numba,
+                "numpy": self._function_numpy,
+            }
+        )
 
-    def _function(self) -> None:
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    def _function_numba(self) -> None:
         _rel_sigma(
             self._a_nonuniform.data[0],
             self._b_stat.data[0],
@@ -86,9 +123,19 @@ class EnergyResolutionSigmaRelABC(Node):
             self._rel_sigma._data,
         )
 
+    def _function_numpy(self) -> None:
+        _rel_sigma_numpy(
+            self._a_nonuniform.data[0],
+            self._b_stat.data[0],
+            self._c_noise.data[0],
+            self._energy.data,
+            self._rel_sigma._data,
+        )
+
     def _type_function(self) -> None:
         """A output takes this function to determine the dtype and shape"""
         check_shape_of_inputs(self, ("a_nonuniform", "b_stat", "c_noise"), (1,))
         check_dimension_of_inputs(self, AllPositionals, 1)
         copy_from_inputs_to_outputs(self, "Energy", "RelSigma")
         assign_axes_from_inputs_to_outputs(self, "Energy", "RelSigma", assign_meshes=True)
+        self.function = self._functions_dict[self._mode]
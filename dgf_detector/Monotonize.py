@@ -1,10 +1,11 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Literal
 
-from numba import njit
+from numba import njit, prange
+from numpy import cumsum, diff, flatnonzero, full, greater, greater_equal, searchsorted
 
-from dagflow.core.exception import InitializationError
+from dagflow.core.exception import InitializationError, TypeFunctionError
 from dagflow.core.node import Node
 from dagflow.core.type_functions import (
     check_dimension_of_inputs,
@@ -20,6 +21,10 @@ if TYPE_CHECKING:
     from dagflow.core.output import Output
 
 
+MonotonizeModes = {"numba", "numpy"}
+MonotonizeModesType = Literal["numba", "numpy"]
+
+
 @njit(cache=True)
 def _monotonize_with_x(
     x: NDArray[double],
@@ -27,31 +32,34 @@ def _monotonize_with_x(
     result: NDArray[double],
     gradient: float,
     index: int,
-) -> None:
+) -> int:
+    # the result is a bulk copy of the input, only the modified points are written below
+    result[:] = y
+    nmodified = 0
+
     # forward loop
     i = index
-    result[i] = y[i]
     direction = 1 if y[i + 1] > y[i] else -1
     while i < len(y) - 1:
         direction_current = 1 if y[i + 1] > result[i] else -1
-        if direction == direction_current:
-            result[i + 1] = y[i + 1]
-        else:
+        if direction != direction_current:
             result[i + 1] = result[i] + direction * gradient * (x[i + 1] - x[i])  # fmt:skip
+            nmodified += 1
         i += 1
 
     # backward loop
     if index == 0:
-        return
+        return nmodified
     i = index + 1
     while i > 0:
         direction_current = 1 if result[i] > y[i - 1] else -1
-        if direction == direction_current:
-            result[i - 1] = y[i - 1]
-        else:
+        if direction != direction_current:
             result[i - 1] = result[i] - direction * gradient * (x[i] - x[i - 1])  # fmt:skip
+            nmodified += 1
         i -= 1
 
+    return nmodified
+
 
 @njit(cache=True)
 def _monotonize_without_x(
@@ -59,56 +67,174 @@ def _monotonize_without_x(
     result: NDArray[double],
     gradient: float,
     index: int,
-) -> None:
+) -> int:
+    # the result is a bulk copy of the input, only the modified points are written below
+    result[:] = y
+    nmodified = 0
+
     # forward loop
     i = index
-    result[i] = y[i]
     direction = 1 if y[i + 1] > y[i] else -1
     while i < len(y) - 1:
         direction_current = 1 if y[i + 1] > result[i] else -1
-        if direction == direction_current:
-            result[i + 1] = y[i + 1]
-        else:
+        if direction != direction_current:
             result[i + 1] = result[i] + direction * gradient
+            nmodified += 1
         i += 1
 
     # backward loop
     if index == 0:
-        return
+        return nmodified
     i = index + 1
     while i > 0:
         direction_current = 1 if result[i] > y[i - 1] else -1
-        if direction == direction_current:
-            result[i - 1] = y[i - 1]
-        else:
+        if direction != direction_current:
             result[i - 1] = result[i] - direction * gradient
+            nmodified += 1
         i -= 1
 
+    return nmodified
+
+
+@njit(cache=True, parallel=True)
+def _monotonize_rows_with_x(
+    x: NDArray[double],
+    y: NDArray[double],
+    result: NDArray[double],
+    nmodified: NDArray,
+    gradient: float,
+    index: int,
+) -> None:
+    for irow in prange(y.shape[0]):
+        nmodified[irow] = _monotonize_with_x(x, y[irow], result[irow], gradient, index)
+
+
+@njit(cache=True, parallel=True)
+def _monotonize_rows_without_x(
+    y: NDArray[double],
+    result: NDArray[double],
+    nmodified: NDArray,
+    gradient: float,
+    index: int,
+) -> None:
+    for irow in prange(y.shape[0]):
+        nmodified[irow] = _monotonize_without_x(y[irow], result[irow], gradient, index)
+
+
+def _monotonize_pass_numpy(
+    y: NDArray[double],
+    result: NDArray[double],
+    steps: NDArray[double],
+    direction: int,
+    strict: bool,
+) -> int:
+    """Monotonize `result[1:]` in the `direction`, starting from `result[0]`.
+
+    The point is kept if it continues the direction from the previous (resulting)
+    point, otherwise it is set to the previous one plus the `steps` (the gradient
+    times the distance). The kept points are skipped in bulk up to the next point,
+    which breaks the monotonicity, the modified region is filled by a single
+    cumulative sum.
+    """
+    compare = greater if strict else greater_equal
+    signed = direction * y
+    # the points, which break the monotonicity with respect to the input
+    breaks = flatnonzero(~compare(signed[1:], signed[:-1])) + 1
+    npoints = y.size
+    nmodified = 0
+    i = 1
+    while i < npoints:
+        reference = direction * result[i - 1]
+        if compare(signed[i], reference):
+            ibreak = searchsorted(breaks, i + 1)
+            i = breaks[ibreak] if ibreak < breaks.size else npoints
+            continue
+
+        # the line from the previous point, the additions are done in the same order as in the loop
+        line = steps[i - 1 :].copy()
+        line[0] = reference
+        line = cumsum(line)[1:]
+        ikept = flatnonzero(compare(signed[i + 1 :], line[:-1]))
+        iend = i + 1 + ikept[0] if ikept.size else npoints
+        result[i:iend] = direction * line[: iend - i]
+        nmodified += iend - i
+        i = iend + 1
+
+    return nmodified
+
+
+def _monotonize_numpy(
+    x: NDArray[double] | None,
+    y: NDArray[double],
+    result: NDArray[double],
+    gradient: float,
+    index: int,
+) -> int:
+    """The same as `_monotonize_with_x` and `_monotonize_without_x`, vectorized"""
+    result[:] = y
+    if x is None:
+        steps = full(y.size, gradient)
+    else:
+        steps = full(y.size, 0.0)
+        steps[1:] = gradient * diff(x)
+
+    direction = 1 if y[index + 1] > y[index] else -1
+    # the equal values continue the direction only for the decreasing functions
+    strict = direction > 0
+    nmodified = _monotonize_pass_numpy(y[index:], result[index:], steps[index:], direction, strict)
+    if index == 0:
+        return nmodified
+
+    # the backward pass, starting from the point after the `index`
+    backward = slice(index + 1, None, -1)
+    steps_backward = full(index + 2, 0.0)
+    steps_backward[1:] = steps[index + 1 : 0 : -1]
+    return nmodified + _monotonize_pass_numpy(
+        y[backward], result[backward], steps_backward, -direction, strict
+    )
+
 
 class Monotonize(Node):
     r"""
     Monotonizes a function.
 
     inputs:
-        `y`: f(x) array
-        `x` (**optional**): arguments array
+        `y`: f(x) array, 1D or 2D (each row is monotonized independently)
+        `x` (**optional**): arguments array (1D)
 
     outputs:
         `0` or `result`: the resulting array
+        `1` or `nmodified`: the number of modified points for each row (1 for 1D)
+
+    The input is copied to the result in bulk and only the points that break
+    the monotonicity are overwritten. The rows of a 2D input are processed in
+    parallel. The mode "numpy" does the same without JIT compilation.
 
     constructor arguments:
         `index_fraction`: fraction of array to monotonize (must be >=0 and <1)
         `gradient`: set gradient to monotonize (takes absolute value)
+        `mode`: "numba" or "numpy"
     """
 
-    __slots__ = ("_y", "_x", "_result", "_index_fraction", "_gradient", "_index")
+    __slots__ = (
+        "_y",
+        "_x",
+        "_result",
+        "_nmodified",
+        "_index_fraction",
+        "_gradient",
+        "_index",
+        "_mode",
+    )
 
     _y: Input
     _x: Input
     _result: Output
+    _nmodified: Output
     _index_fraction: float
     _gradient: float
     _index: int
+    _mode: str
 
     def __init__(
         self,
@@ -117,6 +243,7 @@ class Monotonize(Node):
         with_x: bool = False,
         index_fraction: float = 0,
         gradient: float = 0,
+        mode: MonotonizeModesType = "numba",
         **kwargs,
     ) -> None:
         super().__init__(name, *args, **kwargs, allowed_kw_inputs=("y", "x"))
@@ -132,13 +259,27 @@ class Monotonize(Node):
                 f"`index_fraction` must be 0 <= x < 1, but given {index_fraction}",
                 node=self,
             )
+        if mode not in MonotonizeModes:
+            raise InitializationError(
+                f"mode must be in {MonotonizeModes}, but given {mode}!", node=self
+            )
         self._index_fraction = index_fraction
-        self._gradient = abs(gradient)
+        self._gradient = float(abs(gradient))
+        self._mode = mode
         if with_x:
             self._x = self._add_input("x", positional=False)  # input: "x"
         self._y = self._add_input("y", positional=True)  # input: "y"
         self._result = self._add_output("result")  # output: 0
-        self._functions_dict.update({"with_x": self._function_with_x, "without_x": self._function_without_x})
+        self._nmodified = self._add_output("nmodified")  # output: 1
+        self._functions_dict.update(
+            {
+                "with_x": self._function_with_x,
+                "without_x": self._function_without_x,
+                "rows_with_x": self._function_rows_with_x,
+                "rows_without_x": self._function_rows_without_x,
+                "numpy": self._function_numpy,
+            }
+        )
 
     @property
     def gradient(self) -> float:
@@ -152,11 +293,49 @@ class Monotonize(Node):
     def index(self) -> int:
         return self._index
 
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @property
+    def nmodified(self) -> NDArray:
+        return self._nmodified.data
+
     def _function_with_x(self) -> None:
-        _monotonize_with_x(self._x.data, self._y.data, self._result._data, self.gradient, self.index)
+        self._nmodified._data[0] = _monotonize_with_x(
+            self._x.data, self._y.data, self._result._data, self.gradient, self.index
+        )
 
     def _function_without_x(self) -> None:
-        _monotonize_without_x(self._y.data, self._result._data, self.gradient, self.index)
+        self._nmodified._data[0] = _monotonize_without_x(
+            self._y.data, self._result._data, self.gradient, self.index
+        )
+
+    def _function_rows_with_x(self) -> None:
+        _monotonize_rows_with_x(
+            self._x.data,
+            self._y.data,
+            self._result._data,
+            self._nmodified._data,
+            self.gradient,
+            self.index,
+        )
+
+    def _function_rows_without_x(self) -> None:
+        _monotonize_rows_without_x(
+            self._y.data, self._result._data, self._nmodified._data, self.gradient, self.index
+        )
+
+    def _function_numpy(self) -> None:
+        x = self._x.data if self._x is not None else None
+        y = self._y.data
+        result = self._result._data
+        nmodified = self._nmodified._data
+        if y.ndim == 1:
+            nmodified[0] = _monotonize_numpy(x, y, result, self.gradient, self.index)
+            return
+        for irow in range(y.shape[0]):
+            nmodified[irow] = _monotonize_numpy(x, y[irow], result[irow], self.gradient, self.index)
 
     def _type_function(self) -> None:
         """A output takes this function to determine the dtype and shape"""
@@ -164,9 +343,26 @@ class Monotonize(Node):
         isGivenX = self._x is not None
         inputsToCheck = ("x", "y") if isGivenX else "y"
 
-        check_dimension_of_inputs(self, inputsToCheck, 1)
-        check_inputs_have_same_shape(self, inputsToCheck)
+        shape = self._y.dd.shape
+        if len(shape) == 2:
+            if isGivenX:
+                check_dimension_of_inputs(self, "x", 1)
+                if self._x.dd.shape[0] != shape[1]:
+                    raise TypeFunctionError(
+                        f"The size of x ({self._x.dd.shape[0]}) is inconsistent with y {shape}",
+                        node=self,
+                        input=self._x,
+                    )
+        else:
+            check_dimension_of_inputs(self, inputsToCheck, 1)
+            check_inputs_have_same_shape(self, inputsToCheck)
         copy_from_inputs_to_outputs(self, "y", "result")
+        self._nmodified.dd.shape = (shape[0] if len(shape) == 2 else 1,)
+        self._nmodified.dd.dtype = "i"
 
-        self._index = int((self.inputs["y"].dd.shape[0] - 1) * self.index_fraction)
-        self.function = self._functions_dict["with_x" if isGivenX else "without_x"]
+        self._index = int((shape[-1] - 1) * self.index_fraction)
+        if self._mode == "numpy":
+            self.function = self._functions_dict["numpy"]
+            return
+        function = "with_x" if isGivenX else "without_x"
+        self.function = self._functions_dict[f"rows_{function}" if len(shape) == 2 else function]
@@ -1,13 +1,15 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Literal
 
-from dagflow.core.exception import ConnectionError
+from dagflow.core.exception import ConnectionError, InitializationError
 from dagflow.core.meta_node import MetaNode
 from dagflow.core.storage import NodeStorage
 from dagflow.lib.linalg import VectorMatrixProduct
 
+from dgf_detector.RebinBatched import RebinBatched
 from dgf_detector.RebinMatrix import RebinMatrix
+from dgf_detector.RebinSegmentedSum import RebinSegmentedSum
 
 if TYPE_CHECKING:
     from collections.abc import Mapping
@@ -15,51 +17,207 @@ if TYPE_CHECKING:
     from dagflow.core.node import Node
     from multikeydict.typing import KeyLike
 
+    from dgf_detector.precision import PrecisionsType
     from dgf_detector.RebinMatrix import RebinModesType
 
 
+RebinMethods = {"matrix", "segments"}
+RebinMethodsType = Literal["matrix", "segments"]
+
+
 class Rebin(MetaNode):
-    __slots__ = ("_RebinMatrixList", "_VectorMatrixProductList")
+    """Rebin the vectors from `edges_old` to `edges_new`
+
+    The method "matrix" multiplies the vectors by the dense rebinning matrix.
+    The method "segments" sums the consecutive old bins by their indices,
+    the dense matrix is computed only if `with_matrix` is set.
+
+    With `fractional=True` the new edges may not coincide with the old ones,
+    see `RebinMatrix`.
+
+    The method "segments" also rebins 2D inputs (e.g. covariance matrices)
+    along the `axis` or along both axes if `axis=None`, see `RebinSegmentedSum`.
+    With `variances=True` it rebins the stacked values and variances (2xN) in a
+    single pass.
+
+    `precision` is the policy for the dtype of the rebinning matrix, see
+    `dgf_detector.precision`.
+    """
+
+    __slots__ = (
+        "_RebinMatrixList",
+        "_VectorMatrixProductList",
+        "_RebinSegmentedSumList",
+        "_RebinBatchedList",
+        "_method",
+        "_fractional",
+    )
 
     _RebinMatrixList: list[Node]
     _VectorMatrixProductList: list[Node]
+    _RebinSegmentedSumList: list[Node]
+    _RebinBatchedList: list[Node]
+    _method: str
+    _fractional: bool
 
     def __init__(
         self,
         *,
         bare: bool = False,
         mode: RebinModesType = "numba",
+        precision: PrecisionsType = "inputs",
+        method: RebinMethodsType = "matrix",
+        with_matrix: bool = False,
+        fractional: bool = False,
+        axis: int | None = None,
+        variances: bool = False,
         labels: Mapping = {},
         **kwargs,
     ):
         super().__init__()
+        if method not in RebinMethods:
+            raise InitializationError(f"method must be in {RebinMethods}, but given {method}!")
+        if variances and method != "segments":
+            raise InitializationError("The variances are supported only for the method 'segments'")
         self._RebinMatrixList = []
         self._VectorMatrixProductList = []
+        self._RebinSegmentedSumList = []
+        self._RebinBatchedList = []
+        self._method = method
+        self._fractional = fractional
         if bare:
             return
 
-        self.add_RebinMatrix(
-            name="RebinMatrix", mode=mode, label=labels.get("RebinMatrix", {}), **kwargs
-        )
-        self.add_VectorMatrixProduct(
-            "VectorMatrixProduct", labels.get("VectorMatrixProduct", {})
-        )
+        if method == "segments":
+            self.add_RebinMatrix(
+                name="RebinMatrix",
+                mode=mode,
+                precision=precision,
+                with_matrix=with_matrix,
+                with_segments=True,
+                fractional=fractional,
+                label=labels.get("RebinMatrix", {}),
+                **kwargs,
+            )
+            self.add_RebinSegmentedSum(
+                "RebinSegmentedSum",
+                labels.get("RebinSegmentedSum", {}),
+                mode=mode,
+                axis=axis,
+                variances=variances,
+            )
+        else:
+            self.add_RebinMatrix(
+                name="RebinMatrix",
+                mode=mode,
+                precision=precision,
+                fractional=fractional,
+                label=labels.get("RebinMatrix", {}),
+                **kwargs,
+            )
+            self.add_VectorMatrixProduct(
+                "VectorMatrixProduct", labels.get("VectorMatrixProduct", {})
+            )
         self._bind_outputs()
 
+    @property
+    def method(self) -> str:
+        return self._method
+
+    @property
+    def fractional(self) -> bool:
+        return self._fractional
+
     def add_RebinMatrix(
-        self, name: str = "RebinMatrix", mode: RebinModesType = "numba", **kwargs
+        self,
+        name: str = "RebinMatrix",
+        mode: RebinModesType = "numba",
+        precision: PrecisionsType = "inputs",
+        with_matrix: bool = True,
+        with_segments: bool = False,
+        fractional: bool = False,
+        **kwargs,
     ) -> RebinMatrix:
-        _RebinMatrix = RebinMatrix(name=name, mode=mode, **kwargs)
+        _RebinMatrix = RebinMatrix(
+            name=name,
+            mode=mode,
+            precision=precision,
+            with_matrix=with_matrix,
+            with_segments=with_segments,
+            fractional=fractional,
+            **kwargs,
+        )
         self._RebinMatrixList.append(_RebinMatrix)
+        kw_outputs = []
+        if with_matrix:
+            kw_outputs.append("matrix")
+        if with_segments or fractional:
+            kw_outputs.append("segments")
+        if fractional:
+            kw_outputs.append("fractions")
         self._add_node(
             _RebinMatrix,
             kw_inputs=["edges_old", "edges_new"],
-            kw_outputs=["matrix"],
+            kw_outputs=kw_outputs,
             missing_inputs=True,
             also_missing_outputs=True,
         )
         return _RebinMatrix
 
+    def add_RebinSegmentedSum(
+        self,
+        name: str = "RebinSegmentedSum",
+        label: Mapping = {},
+        mode: RebinModesType = "numba",
+        axis: int | None = None,
+        variances: bool = False,
+    ) -> RebinSegmentedSum:
+        _RebinSegmentedSum = RebinSegmentedSum(
+            name,
+            mode=mode,
+            fractional=self._fractional,
+            axis=axis,
+            variances=variances,
+            label=label,
+        )
+        self._RebinSegmentedSumList.append(_RebinSegmentedSum)
+        self._add_node(
+            _RebinSegmentedSum,
+            inputs_pos=True,
+            outputs_pos=True,
+            missing_inputs=True,
+            also_missing_outputs=True,
+        )
+        self._leading_node = _RebinSegmentedSum
+        return _RebinSegmentedSum
+
+    def add_RebinBatched(
+        self,
+        name: str = "RebinBatched",
+        label: Mapping = {},
+        *,
+        nvectors: int,
+        mode: RebinModesType = "numba",
+    ) -> RebinBatched:
+        _RebinBatched = RebinBatched(
+            name,
+            nvectors=nvectors,
+            method=self._method,
+            mode=mode,
+            fractional=self._fractional and self._method == "segments",
+            label=label,
+        )
+        self._RebinBatchedList.append(_RebinBatched)
+        self._add_node(
+            _RebinBatched,
+            inputs_pos=True,
+            outputs_pos=True,
+            missing_inputs=True,
+            also_missing_outputs=True,
+        )
+        self._leading_node = _RebinBatched
+        return _RebinBatched
+
     def add_VectorMatrixProduct(
         self, name: str = "VectorMatrixProduct", label: Mapping = {}
     ) -> VectorMatrixProduct:
@@ -76,6 +234,21 @@ class Rebin(MetaNode):
         return _VectorMatrixProduct
 
     def _bind_outputs(self) -> None:
+        if self._method == "segments":
+            if (l1 := len(self._RebinSegmentedSumList)) != (l2 := len(self._RebinMatrixList)):
+                raise ConnectionError(
+                    "Cannot bind outputs! Nodes must be pairs of (RebinSegmentedSum, RebinMatrix), "
+                    f"but current lengths are {l1}, {l2}!",
+                    node=self,
+                )
+            for _RebinSegmentedSum, _RebinMatrix in zip(
+                self._RebinSegmentedSumList, self._RebinMatrixList
+            ):
+                _RebinMatrix.outputs["segments"] >> _RebinSegmentedSum.inputs["segments"]
+                if self._fractional:
+                    _RebinMatrix.outputs["fractions"] >> _RebinSegmentedSum.inputs["fractions"]
+            return
+
         if (l1 := len(self._VectorMatrixProductList)) != (
             l2 := len(self._RebinMatrixList)
         ):
@@ -101,14 +274,27 @@ class Rebin(MetaNode):
         labels: Mapping = {},
         replicate_outputs: tuple[KeyLike, ...] = ((),),
         verbose: bool = False,
+        method: RebinMethodsType = "matrix",
+        with_matrix: bool = False,
+        batched: bool = False,
+        fractional: bool = False,
+        axis: int | None = None,
+        variances: bool = False,
         **kwargs,
     ) -> tuple[Rebin, NodeStorage]:
+        """Create a single RebinMatrix and a rebinning node for each key of `replicate_outputs`
+
+        If `batched`, a single `RebinBatched` node rebins all the vectors in one
+        pass, its inputs and outputs are stored under the keys.
+        """
         storage = NodeStorage(default_containers=True)
         nodes = storage("nodes")
         inputs = storage("inputs")
         outputs = storage("outputs")
 
-        instance = cls(bare=True)
+        if batched and variances:
+            raise InitializationError("The variances are not supported for the batched rebinning")
+        instance = cls(bare=True, method=method, fractional=fractional, variances=variances)
         key_VectorMatrixProduct = tuple(names.get("product", "product").split("."))
         key_RebinMatrix = tuple(names.get("matrix", "matrix").split("."))
         if path:
@@ -116,20 +302,59 @@ class Rebin(MetaNode):
             key_VectorMatrixProduct = tpath + key_VectorMatrixProduct
             key_RebinMatrix = tpath + key_RebinMatrix
 
+        segments = method == "segments"
         _RebinMatrix = instance.add_RebinMatrix(
-            names.get("matrix", "matrix"), label=labels.get("RebinMatrix", {}), **kwargs
+            names.get("matrix", "matrix"),
+            label=labels.get("RebinMatrix", {}),
+            with_matrix=with_matrix or not segments,
+            with_segments=segments,
+            fractional=fractional,
+            **kwargs,
         )
         nodes[key_RebinMatrix] = _RebinMatrix
         for iname, input in _RebinMatrix.inputs.iter_kw_items():
             inputs[key_RebinMatrix + (iname,)] = input
-        outputs[key_RebinMatrix] = _RebinMatrix.outputs["matrix"]
+        outputs[key_RebinMatrix] = _RebinMatrix.outputs["segments" if segments else "matrix"]
 
         label_int = labels.get("Rebin", {})
+        if batched:
+            keys = tuple((key,) if isinstance(key, str) else key for key in replicate_outputs)
+            _RebinBatched = instance.add_RebinBatched(
+                ".".join(key_VectorMatrixProduct),
+                label_int,
+                nvectors=len(keys),
+                mode=_RebinMatrix.mode,
+            )
+            _RebinMatrix.outputs[method] >> _RebinBatched.inputs[method]
+            if fractional and segments:
+                _RebinMatrix.outputs["fractions"] >> _RebinBatched.inputs["fractions"]
+            for i, key in enumerate(keys):
+                name = ".".join(key_VectorMatrixProduct + key)
+                nodes[name] = _RebinBatched
+                inputs[name] = _RebinBatched.inputs[f"vector_{i}"]
+                outputs[name] = _RebinBatched.outputs[f"result_{i}"]
+
+            NodeStorage.update_current(storage, strict=True, verbose=verbose)
+            return instance, storage
+
         for key in replicate_outputs:
             if isinstance(key, str):
                 key = (key,)
 
             name = ".".join(key_VectorMatrixProduct + key)
+            if segments:
+                _RebinSegmentedSum = instance.add_RebinSegmentedSum(
+                    name, label_int, mode=_RebinMatrix.mode, axis=axis, variances=variances
+                )
+                _RebinSegmentedSum()
+                nodes[name] = _RebinSegmentedSum
+                inputs[name] = _RebinSegmentedSum.inputs["vector"]
+                outputs[name] = _RebinSegmentedSum.outputs["result"]
+                _RebinMatrix.outputs["segments"] >> _RebinSegmentedSum.inputs["segments"]
+                if fractional:
+                    _RebinMatrix.outputs["fractions"] >> _RebinSegmentedSum.inputs["fractions"]
+                continue
+
             _VectorMatrixProduct = instance.add_VectorMatrixProduct(name, label_int)
             _VectorMatrixProduct()
             nodes[name] = _VectorMatrixProduct
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from dagflow.core.exception import InitializationError, TypeFunctionError
+from dagflow.core.node import Node
+from dagflow.core.type_functions import (
+    AllPositionals,
+    check_dimension_of_inputs,
+    check_inputs_have_same_dtype,
+    check_inputs_have_same_shape,
+)
+from numpy import empty, matmul
+
+from dgf_detector.RebinMatrix import RebinModes
+from dgf_detector.RebinSegmentedSum import (
+    _segmented_sum_numpy,
+    _segmented_sum_rows_numba,
+    _segmented_sum_rows_python,
+)
+
+if TYPE_CHECKING:
+    from dagflow.core.input import Input
+    from dagflow.core.output import Output
+    from numpy.typing import NDArray
+
+    from dgf_detector.Rebin import RebinMethodsType
+    from dgf_detector.RebinMatrix import RebinModesType
+
+
+class RebinBatched(Node):
+    """Rebin a batch of vectors, sharing the same rebinning, in a single pass
+
+    The input vectors are stacked into a contiguous 2D buffer and rebinned either
+    by a single matrix-matrix product with the `matrix` (method "matrix") or by a
+    single segmented sum pass over the `segments` (method "segments"). The
+    outputs are the views on the rows of the common result buffer.
+
+    With `fractional=True` (method "segments" only) the old bins, crossed by
+    the new edges, are split according to the `fractions` input.
+    """
+
+    __slots__ = (
+        "_method",
+        "_mode",
+        "_rebinning",
+        "_fractions",
+        "_vectors",
+        "_results",
+        "_stack",
+        "_result_buffer",
+    )
+
+    _method: str
+    _mode: str
+    _rebinning: Input
+    _fractions: Input | None
+    _vectors: tuple[Input, ...]
+    _results: tuple[Output, ...]
+    _stack: NDArray | None
+    _result_buffer: NDArray | None
+
+    def __init__(
+        self,
+        *args,
+        nvectors: int,
+        method: RebinMethodsType = "matrix",
+        mode: RebinModesType = "numba",
+        fractional: bool = False,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.labels.setdefaults(
+            {
+                "text": "Rebinned vectors (batch)",
+            }
+        )
+        if method not in ("matrix", "segments"):
+            raise InitializationError(
+                f"method must be 'matrix' or 'segments', but given {method}!", node=self
+            )
+        if mode not in RebinModes:
+            raise InitializationError(f"mode must be in {RebinModes}, but given {mode}!", node=self)
+        if fractional and method != "segments":
+            raise InitializationError(
+                "The fractional rebinning is supported only for the method 'segments'", node=self
+            )
+        if nvectors < 1:
+            raise InitializationError(f"`nvectors` must be positive, but given {nvectors}", node=self)
+        self._method = method
+        self._mode = mode
+        # the results are views on the rows of the buffer, bound after each allocation
+        self._fd.needs_post_allocate = True
+        self._stack = None
+        self._result_buffer = None
+        self._rebinning = self._add_input(method, positional=False)
+        self._fractions = (
+            self._add_input("fractions", positional=False) if fractional else None
+        )
+        self._vectors = tuple(self._add_input(f"vector_{i}") for i in range(nvectors))
+        self._results = tuple(
+            self._add_output(f"result_{i}", allocatable=False, forbid_reallocation=True)
+            for i in range(nvectors)
+        )
+        self._functions_dict.update(
+            {
+                "matrix": self._function_matrix,
+                "python": self._function_python,
+                "numba": self._function_numba,
+                "numpy": self._function_numpy,
+            }
+        )
+
+    @property
+    def method(self) -> str:
+        return self._method
+
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    def _fill_stack(self) -> NDArray:
+        stack = self._stack
+        for i, vector in enumerate(self._vectors):
+            stack[i] = vector.data
+        return stack
+
+    def _function_matrix(self):
+        matmul(self._fill_stack(), self._rebinning.data.T, out=self._result_buffer)
+
+    def _function_python(self):
+        _segmented_sum_rows_python(
+            self._rebinning.data,
+            self._fill_stack(),
+            self._result_buffer,
+            self._fractions.data if self._fractions is not None else None,
+        )
+
+    def _function_numba(self):
+        _segmented_sum_rows_numba(
+            self._rebinning.data,
+            self._fill_stack(),
+            self._result_buffer,
+            self._fractions.data if self._fractions is not None else None,
+        )
+
+    def _function_numpy(self):
+        _segmented_sum_numpy(
+            self._rebinning.data,
+            self._fill_stack(),
+            self._result_buffer,
+            self._fractions.data if self._fractions is not None else None,
+            axis=1,
+        )
+
+    def _type_function(self) -> None:
+        """A output takes this function to determine the dtype and shape"""
+        check_dimension_of_inputs(self, AllPositionals, 1)
+        check_inputs_have_same_dtype(self, AllPositionals)
+        (nold,) = check_inputs_have_same_shape(self, AllPositionals)
+        if self._method == "matrix":
+            check_dimension_of_inputs(self, ("matrix",), 2)
+            nnew, nold_matrix = self._rebinning.dd.shape
+            if nold_matrix != nold:
+                raise TypeFunctionError(
+                    f"The matrix {self._rebinning.dd.shape} is inconsistent with the vectors ({nold})",
+                    node=self,
+                    input=self._rebinning,
+                )
+        else:
+            names = ("segments",) if self._fractions is None else ("segments", "fractions")
+            check_dimension_of_inputs(self, names, 1)
+            check_inputs_have_same_shape(self, names)
+            nnew = self._rebinning.dd.size - 1
+
+        dtype = self._vectors[0].dd.dtype
+        for result in self._results:
+            result.dd.shape = (nnew,)
+            result.dd.dtype = dtype
+        self._stack = empty((len(self._vectors), nold), dtype=dtype)
+        self._result_buffer = empty((len(self._results), nnew), dtype=dtype)
+        self.function = self._functions_dict[
+            "matrix" if self._method == "matrix" else self._mode
+        ]
+
+    def _post_allocate(self) -> None:
+        super()._post_allocate()
+        # the buffer is reallocated by the type function, the views are rebound
+        for result, row in zip(self._results, self._result_buffer):
+            result._set_data(row, owns_buffer=False, override=True, forbid_reallocation=True)
@@ -13,7 +13,15 @@ from dagflow.core.type_functions import (
     check_inputs_equivalence,
 )
 from numba import njit
-from numpy import allclose, finfo, isclose
+from numpy import arange, finfo, flatnonzero, isclose, maximum, minimum, searchsorted, where
+
+from dgf_detector.edges import _edges_are_close
+from dgf_detector.precision import (
+    InputConverter,
+    check_precision,
+    compute_dtype,
+    storage_dtype,
+)
 
 if TYPE_CHECKING:
     from collections.abc import Callable
@@ -22,31 +30,68 @@ if TYPE_CHECKING:
     from dagflow.core.output import Output
     from numpy.typing import NDArray
 
+    from dgf_detector.precision import PrecisionsType
+
 
-RebinModes = {"python", "numba"}
+RebinModes = {"python", "numba", "numpy"}
 RebinModesType = Literal[RebinModes]
 
 
 class RebinMatrix(Node):
-    """For a given `edges_old` and `edges_new` computes the conversion matrix"""
+    """For a given `edges_old` and `edges_new` computes the conversion matrix
+
+    outputs:
+        `matrix`: the dense conversion matrix (Nnew x Nold), if `with_matrix`
+        `segments`: the indices of the old bins (Nnew+1), if `with_segments`:
+            the new bin `i` is the sum of the old bins `segments[i]:segments[i+1]`
+        `fractions`: (Nnew+1), if `fractional`, see below
+
+    By default each new edge should coincide with one of the old edges. With
+    `fractional=True` the new edges may be arbitrary (within the old range):
+    the density within each old bin is assumed to be uniform and the old bins,
+    crossed by the new edges, are split by the overlap fraction. In this case
+    the new edge `i` is within the old bin `segments[i]` and `fractions[i]` is
+    the fraction of this bin to the left of the edge. The new bin `i` is then
+
+        sum(C[segments[i]:segments[i+1]])
+        - fractions[i]*C[segments[i]]
+        + fractions[i+1]*C[segments[i+1]]
+
+    The `fractional` mode implies `with_segments`.
+
+    The dtype of the `matrix` is chosen by the `precision` policy, see
+    `dgf_detector.precision`, the `fractions` are float64.
+    """
 
     __slots__ = (
         "_edges_old",
         "_edges_old_clones",
+        "_clones_checked",
         "_edges_new",
         "_result",
+        "_segments",
+        "_fractions",
+        "_fractional",
         "_atol",
         "_rtol",
         "_mode",
+        "_precision",
+        "_convert",
     )
 
     _edges_old: Input
     _edges_old_clones: tuple[Input, ...]
+    _clones_checked: bool
     _edges_new: Input
-    _result: Output
+    _result: Output | None
+    _segments: Output | None
+    _fractions: Output | None
+    _fractional: bool
     _atol: float
     _rtol: float
     _mode: str
+    _precision: str
+    _convert: InputConverter
 
     def __init__(
         self,
@@ -54,6 +99,10 @@ class RebinMatrix(Node):
         atol: float = float(finfo("d").resolution) * 10.0,
         rtol: float = 0.0,
         mode: RebinModesType = "numba",
+        precision: PrecisionsType = "inputs",
+        with_matrix: bool = True,
+        with_segments: bool = False,
+        fractional: bool = False,
         **kwargs,
     ):
         super().__init__(
@@ -69,16 +118,32 @@ class RebinMatrix(Node):
         )
         if mode not in RebinModes:
             raise InitializationError(f"mode must be in {RebinModes}, but given {mode}!", node=self)
+        check_precision(precision, node=self)
+        with_segments = with_segments or fractional
+        if not (with_matrix or with_segments):
+            raise InitializationError(
+                "At least one of `with_matrix` and `with_segments` should be set", node=self
+            )
         self._mode = mode
+        self._precision = precision
+        self._convert = InputConverter()
+        self._fractional = fractional
+        self._clones_checked = False
         self._atol = atol
         self._rtol = rtol
         self._edges_old = self._add_input("edges_old")  # input: 0
         self._edges_new = self._add_input("edges_new", positional=False)  # input: 1
-        self._result = self._add_output("matrix")  # output: 0
+        self._result = self._add_output("matrix") if with_matrix else None  # output: 0
+        self._segments = self._add_output("segments") if with_segments else None
+        self._fractions = self._add_output("fractions") if fractional else None
         self._functions_dict.update(
             {
                 "python": self._function_python,
                 "numba": self._function_numba,
+                "numpy": self._function_numpy,
+                "fractional_python": self._function_fractional_python,
+                "fractional_numba": self._function_fractional_numba,
+                "fractional_numpy": self._function_fractional_numpy,
             }
         )
 
@@ -86,6 +151,14 @@ class RebinMatrix(Node):
     def mode(self) -> str:
         return self._mode
 
+    @property
+    def fractional(self) -> bool:
+        return self._fractional
+
+    @property
+    def precision(self) -> str:
+        return self._precision
+
     @property
     def atol(self) -> float:
         return self._atol
@@ -97,28 +170,84 @@ class RebinMatrix(Node):
     def _function_python(self):
         edges_old = self._edges_old.data
         ret = _calc_rebin_matrix_python(
-            edges_old, self._edges_new.data, self._result._data, self.atol, self.rtol
+            self._convert(self._edges_old),
+            self._convert(self._edges_new),
+            self._result._data if self._result is not None else None,
+            self.atol,
+            self.rtol,
+            self._segments._data if self._segments is not None else None,
         )
         if ret[0] > 0:
             self.__raise_exception_at_wrong_edges(*ret)
-        for i, input in enumerate(self._edges_old_clones):
-            if not allclose(edges_old, input.data, atol=self._atol, rtol=self._rtol):
-                raise RuntimeError(f"Clones of old edges are inconsistent (input {i})")
+        self._check_clones(edges_old)
 
     def _function_numba(self):
         edges_old = self._edges_old.data
         ret = _calc_rebin_matrix_numba(
-            self._edges_old.data,
-            self._edges_new.data,
-            self._result._data,
+            self._convert(self._edges_old),
+            self._convert(self._edges_new),
+            self._result._data if self._result is not None else None,
+            self.atol,
+            self.rtol,
+            self._segments._data if self._segments is not None else None,
+        )
+        if ret[0] > 0:
+            self.__raise_exception_at_wrong_edges(*ret)
+        self._check_clones(edges_old)
+
+    def _function_numpy(self):
+        edges_old = self._edges_old.data
+        ret = _calc_rebin_matrix_numpy(
+            self._convert(self._edges_old),
+            self._convert(self._edges_new),
+            self._result._data if self._result is not None else None,
             self.atol,
             self.rtol,
+            self._segments._data if self._segments is not None else None,
         )
         if ret[0] > 0:
             self.__raise_exception_at_wrong_edges(*ret)
+        self._check_clones(edges_old)
+
+    def _function_fractional_python(self):
+        self._calc_fractional(_calc_rebin_fractions_python)
+
+    def _function_fractional_numba(self):
+        self._calc_fractional(_calc_rebin_fractions_numba)
+
+    def _function_fractional_numpy(self):
+        self._calc_fractional(_calc_rebin_fractions_numpy)
+
+    def _calc_fractional(self, calc_rebin_fractions: Callable) -> None:
+        edges_old = self._edges_old.data
+        ret = calc_rebin_fractions(
+            self._convert(self._edges_old),
+            self._convert(self._edges_new),
+            self._segments._data,
+            self._fractions._data,
+            self._result._data if self._result is not None else None,
+            self.atol,
+            self.rtol,
+        )
+        if ret[0] > 0:
+            self.__raise_exception_at_wrong_edges(*ret)
+        self._check_clones(edges_old)
+
+    def _check_clones(self, edges_old: NDArray) -> None:
+        """Check the clones of the old edges, only if they have changed since the last check"""
+        if self._clones_checked:
+            return
+        edges_are_close = _edges_are_close[self.mode]
         for i, input in enumerate(self._edges_old_clones):
-            if not allclose(edges_old, input.data, atol=self._atol, rtol=self._rtol):
+            if edges_are_close(edges_old, input.data, self._atol, self._rtol) >= 0:
                 raise RuntimeError(f"Clones of old edges are inconsistent (input {i})")
+        self._clones_checked = True
+
+    def taint(self, *, caller: Input | None = None, **kwargs):
+        # the clones are checked again, unless the taint comes from the new edges
+        if caller is not self._edges_new:
+            self._clones_checked = False
+        return super().taint(caller=caller, **kwargs)
 
     def __raise_exception_at_wrong_edges(self, retcode, iold, edge_old, inew, edge_new) -> None:
         print("Old edges:", self._edges_old.dd.size, self._edges_old.data)
@@ -127,6 +256,7 @@ class RebinMatrix(Node):
             "first edge is before old first",
             "last edge is after the old last",
             "inconsistent new edge",
+            "new edges are not increasing",
             "old edges (clones) are not consistent",
         )[retcode - 1]
         raise RuntimeError(
@@ -137,29 +267,47 @@ class RebinMatrix(Node):
         """A output takes this function to determine the dtype and shape"""
         check_dimension_of_inputs(self, ("edges_old", "edges_new"), 1)
         check_inputs_equivalence(self, AllPositionals, check_dtype=True, check_shape=True)
-        self._result.dd.shape = (
-            self._edges_new.dd.size - 1,
-            self._edges_old.dd.size - 1,
+        if self._result is not None:
+            self._result.dd.shape = (
+                self._edges_new.dd.size - 1,
+                self._edges_old.dd.size - 1,
+            )
+            self._result.dd.dtype = storage_dtype(self._precision, self._edges_old.dd.dtype)
+            assign_edges_from_inputs_to_outputs((self._edges_new, self._edges_old), self._result)
+        if self._segments is not None:
+            self._segments.dd.shape = (self._edges_new.dd.size,)
+            self._segments.dd.dtype = "i"
+        if self._fractions is not None:
+            self._fractions.dd.shape = (self._edges_new.dd.size,)
+            self._fractions.dd.dtype = "d"
+        self._convert.allocate(
+            (self._edges_old, self._edges_new),
+            compute_dtype(self._precision, self._edges_old.dd.dtype),
         )
-        self._result.dd.dtype = "d"
-        self.function = self._functions_dict[self.mode]
-        assign_edges_from_inputs_to_outputs((self._edges_new, self._edges_old), self._result)
+        self.function = self._functions_dict[
+            f"fractional_{self.mode}" if self._fractional else self.mode
+        ]
 
         self._edges_old_clones = tuple(self.inputs[1:])
+        self._clones_checked = False
 
 
 def _calc_rebin_matrix_python(
     edges_old: NDArray,
     edges_new: NDArray,
-    rebin_matrix: NDArray,
+    rebin_matrix: NDArray | None,
     atol: float,
     rtol: float,
+    segments: NDArray | None = None,
 ) -> tuple[int, int, float, int, float]:
     """
     For a column C of size N: Cnew = M C
     Cnew = [Mx1]
     M = [MxN]
     C = [Nx1]
+
+    If `segments` is provided, fill the indices of the old edges, matching the
+    new ones: Cnew[i] = sum(C[segments[i]:segments[i+1]])
     """
 
     if edges_new[0] < edges_old[0] and not isclose(edges_new[0], edges_old[0], atol=atol, rtol=rtol):
@@ -167,17 +315,30 @@ def _calc_rebin_matrix_python(
     if edges_new[-1] > edges_old[-1] and not isclose(edges_new[-1], edges_old[-1], atol=atol, rtol=rtol):
         return 2, -1, edges_old[-1], -1, edges_new[-1]
 
+    if rebin_matrix is not None:
+        rebin_matrix[:, :] = 0.0
+
     inew = 0
     iold = 0
     edge_old = edges_old[0]
     edge_new_prev = edges_new[0]
     # nold = edges_old.size
 
+    if segments is not None:
+        iold_first = 0
+        while edges_old[iold_first] < edge_new_prev and not isclose(
+            edges_old[iold_first], edge_new_prev, atol=atol, rtol=rtol
+        ):
+            iold_first += 1
+        segments[0] = iold_first
+
     stepper_old = enumerate(edges_old)
     iold, edge_old = next(stepper_old)
     for inew, edge_new in enumerate(edges_new[1:], 1):
         while edge_old < edge_new and not isclose(edge_new, edge_old, atol=atol, rtol=rtol):
-            if edge_old >= edge_new_prev or isclose(edge_old, edge_new_prev, atol=atol, rtol=rtol):
+            if rebin_matrix is not None and (
+                edge_old >= edge_new_prev or isclose(edge_old, edge_new_prev, atol=atol, rtol=rtol)
+            ):
                 rebin_matrix[inew - 1, iold] = 1.0
 
             iold, edge_old = next(stepper_old)
@@ -185,9 +346,159 @@ def _calc_rebin_matrix_python(
         if not isclose(edge_new, edge_old, atol=atol, rtol=rtol):
             return 3, iold, edge_old, inew, edge_new_prev
 
+        if segments is not None:
+            segments[inew] = iold
+
     return 0, iold, edge_old, inew, edge_new_prev
 
 
 _calc_rebin_matrix_numba: Callable[
-    [NDArray, NDArray, NDArray, float, float], tuple[int, int, float, int, float]
+    [NDArray, NDArray, NDArray | None, float, float, NDArray | None],
+    tuple[int, int, float, int, float],
 ] = njit(cache=True)(_calc_rebin_matrix_python)
+
+
+def _calc_rebin_fractions_python(
+    edges_old: NDArray,
+    edges_new: NDArray,
+    segments: NDArray,
+    fractions: NDArray,
+    rebin_matrix: NDArray | None,
+    atol: float,
+    rtol: float,
+) -> tuple[int, int, float, int, float]:
+    """Find the old bin `segments[i]` of each new edge and the fraction of this
+    bin `fractions[i]` to the left of the edge. The new edges, close to the old
+    ones, are considered as coinciding with them: the fraction is 0.
+
+    If `rebin_matrix` is provided, it is filled with the overlap fractions.
+    """
+    if edges_new[0] < edges_old[0] and not isclose(edges_new[0], edges_old[0], atol=atol, rtol=rtol):
+        return 1, 0, edges_old[0], 0, edges_new[0]
+    if edges_new[-1] > edges_old[-1] and not isclose(edges_new[-1], edges_old[-1], atol=atol, rtol=rtol):
+        return 2, -1, edges_old[-1], -1, edges_new[-1]
+
+    nbins_old = edges_old.size - 1
+    iold = 0
+    for inew in range(edges_new.size):
+        edge_new = edges_new[inew]
+        while iold < nbins_old and (
+            edges_old[iold + 1] < edge_new
+            or isclose(edges_old[iold + 1], edge_new, atol=atol, rtol=rtol)
+        ):
+            iold += 1
+
+        edge_old = edges_old[iold]
+        if isclose(edge_old, edge_new, atol=atol, rtol=rtol):
+            fraction = 0.0
+        elif edge_new < edge_old:
+            return 4, iold, edge_old, inew, edge_new
+        else:
+            fraction = (edge_new - edge_old) / (edges_old[iold + 1] - edge_old)
+        segments[inew] = iold
+        fractions[inew] = fraction
+
+    if rebin_matrix is not None:
+        rebin_matrix[:, :] = 0.0
+        for inew in range(edges_new.size - 1):
+            iold_first, iold_last = segments[inew], segments[inew + 1]
+            for iold in range(iold_first, iold_last):
+                rebin_matrix[inew, iold] = 1.0
+            if fractions[inew] > 0.0:
+                rebin_matrix[inew, iold_first] -= fractions[inew]
+            if fractions[inew + 1] > 0.0:
+                rebin_matrix[inew, iold_last] += fractions[inew + 1]
+
+    return 0, iold, edges_old[iold], edges_new.size - 1, edges_new[-1]
+
+
+_calc_rebin_fractions_numba: Callable[
+    [NDArray, NDArray, NDArray, NDArray, NDArray | None, float, float],
+    tuple[int, int, float, int, float],
+] = njit(cache=True)(_calc_rebin_fractions_python)
+
+
+def _calc_rebin_matrix_numpy(
+    edges_old: NDArray,
+    edges_new: NDArray,
+    rebin_matrix: NDArray | None,
+    atol: float,
+    rtol: float,
+    segments: NDArray | None = None,
+) -> tuple[int, int, float, int, float]:
+    """The same as `_calc_rebin_matrix_python`, the old edges are found by `searchsorted`"""
+    if edges_new[0] < edges_old[0] and not isclose(edges_new[0], edges_old[0], atol=atol, rtol=rtol):
+        return 1, 0, edges_old[0], 0, edges_new[0]
+    if edges_new[-1] > edges_old[-1] and not isclose(edges_new[-1], edges_old[-1], atol=atol, rtol=rtol):
+        return 2, -1, edges_old[-1], -1, edges_new[-1]
+
+    # the first old edge, which is not below the new one: the previous one may be close to it
+    iold = minimum(searchsorted(edges_old, edges_new, side="left"), edges_old.size - 1)
+    iold_prev = maximum(iold - 1, 0)
+    iold = where(
+        (iold > 0) & isclose(edges_new, edges_old[iold_prev], atol=atol, rtol=rtol), iold_prev, iold
+    )
+
+    # the first new edge is not required to match the old one
+    inconsistent = flatnonzero(~isclose(edges_new[1:], edges_old[iold[1:]], atol=atol, rtol=rtol))
+    if inconsistent.size:
+        inew = inconsistent[0] + 1
+        return 3, iold[inew], edges_old[iold[inew]], inew, edges_new[inew]
+
+    if segments is not None:
+        segments[:] = iold
+    if rebin_matrix is not None:
+        rebin_matrix[:, :] = 0.0
+        columns = arange(iold[0], iold[-1])
+        rebin_matrix[searchsorted(iold, columns, side="right") - 1, columns] = 1.0
+
+    return 0, iold[-1], edges_old[iold[-1]], edges_new.size - 1, edges_new[-1]
+
+
+def _calc_rebin_fractions_numpy(
+    edges_old: NDArray,
+    edges_new: NDArray,
+    segments: NDArray,
+    fractions: NDArray,
+    rebin_matrix: NDArray | None,
+    atol: float,
+    rtol: float,
+) -> tuple[int, int, float, int, float]:
+    """The same as `_calc_rebin_fractions_python`, the old bins are found by `searchsorted`"""
+    if edges_new[0] < edges_old[0] and not isclose(edges_new[0], edges_old[0], atol=atol, rtol=rtol):
+        return 1, 0, edges_old[0], 0, edges_new[0]
+    if edges_new[-1] > edges_old[-1] and not isclose(edges_new[-1], edges_old[-1], atol=atol, rtol=rtol):
+        return 2, -1, edges_old[-1], -1, edges_new[-1]
+
+    nbins_old = edges_old.size - 1
+    # the last old edge, which is below or close to the new one
+    iold = searchsorted(edges_old[1:], edges_new, side="right")
+    iold_next = minimum(iold + 1, nbins_old)
+    iold += (iold < nbins_old) & isclose(edges_old[iold_next], edges_new, atol=atol, rtol=rtol)
+    # the old bins are never revisited
+    maximum.accumulate(iold, out=iold)
+
+    edge_old = edges_old[iold]
+    coincide = isclose(edge_old, edges_new, atol=atol, rtol=rtol)
+    decreasing = flatnonzero((edges_new < edge_old) & ~coincide)
+    if decreasing.size:
+        inew = decreasing[0]
+        return 4, iold[inew], edge_old[inew], inew, edges_new[inew]
+
+    iold_next = minimum(iold + 1, nbins_old)
+    width = where(iold_next > iold, edges_old[iold_next] - edge_old, 1.0)
+    segments[:] = iold
+    fractions[:] = where(coincide, 0.0, (edges_new - edge_old) / width)
+
+    if rebin_matrix is not None:
+        rebin_matrix[:, :] = 0.0
+        columns = arange(iold[0], iold[-1])
+        rebin_matrix[searchsorted(iold, columns, side="right") - 1, columns] = 1.0
+        rows = arange(edges_new.size - 1)
+        first = fractions[:-1] > 0.0
+        rebin_matrix[rows[first], iold[:-1][first]] -= fractions[:-1][first]
+        last = fractions[1:] > 0.0
+        rebin_matrix[rows[last], iold[1:][last]] += fractions[1:][last]
+
+    return 0, iold[-1], edges_old[iold[-1]], edges_new.size - 1, edges_new[-1]
+
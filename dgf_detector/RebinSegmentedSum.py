@@ -0,0 +1,397 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from dagflow.core.exception import InitializationError, TypeFunctionError
+from dagflow.core.input_strategy import AddNewInputAddNewOutput
+from dagflow.core.node import Node
+from dagflow.core.type_functions import check_dimension_of_inputs, check_inputs_have_same_shape
+from numba import njit
+from numpy import add, arange, empty, minimum, take, where
+
+from dgf_detector.RebinMatrix import RebinModes
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from dagflow.core.input import Input
+    from dagflow.core.output import Output
+    from numpy.typing import NDArray
+
+    from dgf_detector.RebinMatrix import RebinModesType
+
+
+class RebinSegmentedSum(Node):
+    """Rebin the vectors by the sums of the consecutive old bins
+
+    The `segments` (Nnew+1) are the indices of the old bins, provided by the
+    `RebinMatrix(with_segments=True)`: the new bin `i` is the sum of the old
+    bins `segments[i]:segments[i+1]`. The computation is O(Nold), compared to
+    O(Nnew x Nold) of the dense matrix product.
+
+    The 2D inputs (e.g. covariance matrices) are rebinned along the `axis` or
+    along both axes if `axis=None`. The blocks are summed directly, which is
+    O(Nold^2), compared to O(Nnew x Nold^2) of M V M^T, and requires no
+    intermediate matrices.
+
+    With `fractional=True` the old bins, crossed by the new edges, are split
+    according to the `fractions`, see `RebinMatrix(fractional=True)`.
+
+    With `variances=True` each input is a stacked 2xN array of the values and
+    their variances. Both are rebinned in a single pass, the variances are
+    summed with the squared weights. The `axis` is ignored in this case.
+    """
+
+    __slots__ = (
+        "_segments",
+        "_fractions",
+        "_vectors",
+        "_results",
+        "_identities",
+        "_axis",
+        "_variances",
+        "_mode",
+    )
+
+    _segments: Input
+    _fractions: Input | None
+    _vectors: tuple[Input, ...]
+    _results: tuple[Output, ...]
+    _identities: tuple[NDArray | None, ...]
+    _axis: int | None
+    _variances: bool
+    _mode: str
+
+    def __init__(
+        self,
+        *args,
+        mode: RebinModesType = "numba",
+        fractional: bool = False,
+        axis: int | None = None,
+        variances: bool = False,
+        **kwargs,
+    ):
+        super().__init__(
+            *args,
+            **kwargs,
+            input_strategy=AddNewInputAddNewOutput(input_fmt="vector", output_fmt="result"),
+            allowed_kw_inputs=("segments", "fractions") if fractional else ("segments",),
+        )
+        self.labels.setdefaults(
+            {
+                "text": "Rebinned vector",
+            }
+        )
+        if mode not in RebinModes:
+            raise InitializationError(f"mode must be in {RebinModes}, but given {mode}!", node=self)
+        if axis not in (None, 0, 1):
+            raise InitializationError(f"axis must be None, 0 or 1, but given {axis}!", node=self)
+        self._mode = mode
+        self._axis = axis
+        self._variances = variances
+        self._segments = self._add_input("segments", positional=False)
+        self._fractions = (
+            self._add_input("fractions", positional=False) if fractional else None
+        )
+        self._vectors = ()
+        self._results = ()
+        self._identities = ()
+        self._functions_dict.update(
+            {
+                "python": self._function_python,
+                "numba": self._function_numba,
+                "numpy": self._function_numpy,
+            }
+        )
+
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @property
+    def fractional(self) -> bool:
+        return self._fractions is not None
+
+    @property
+    def axis(self) -> int | None:
+        return self._axis
+
+    @property
+    def variances(self) -> bool:
+        return self._variances
+
+    def _function_python(self):
+        self._apply(_segmented_sum_python, _block_sum_python, _segmented_sum_variances_python)
+
+    def _function_numba(self):
+        self._apply(_segmented_sum_numba, _block_sum_numba, _segmented_sum_variances_numba)
+
+    def _function_numpy(self):
+        self._apply(_segmented_sum_numpy, _block_sum_numpy, _segmented_sum_variances_numpy)
+
+    def _apply(
+        self, segmented_sum: Callable, block_sum: Callable, segmented_sum_variances: Callable
+    ) -> None:
+        segments = self._segments.data
+        fractions = self._fractions.data if self._fractions is not None else None
+        for i, (vector, result, identity) in enumerate(
+            zip(self._vectors, self._results, self._identities)
+        ):
+            data = vector.data
+            if self._variances:
+                axes = (1,)
+            elif self._axis is None:
+                axes = range(data.ndim)
+            else:
+                axes = (self._axis,)
+            # the segments are monotonous, the last index is the largest one
+            for axis in axes:
+                if segments[-1] > data.shape[axis]:
+                    raise RuntimeError(
+                        f"Input {i} of shape {data.shape} is inconsistent with the segments "
+                        f"(axis {axis}), ending at {segments[-1]}"
+                    )
+            if self._variances:
+                segmented_sum_variances(segments, data, result._data, fractions)
+            elif data.ndim == 1:
+                segmented_sum(segments, data, result._data, fractions)
+            elif self._axis is None:
+                block_sum(segments, segments, data, result._data, fractions, fractions)
+            elif self._axis == 0:
+                block_sum(segments, identity, data, result._data, fractions, None)
+            else:
+                block_sum(identity, segments, data, result._data, None, fractions)
+
+    def _type_function(self) -> None:
+        """A output takes this function to determine the dtype and shape"""
+        names = ("segments", "fractions") if self.fractional else ("segments",)
+        check_dimension_of_inputs(self, names, 1)
+        check_inputs_have_same_shape(self, names)
+        self._vectors = tuple(self.inputs[:])
+        self._results = tuple(self.outputs[:])
+        nnew = self._segments.dd.size - 1
+        identities = []
+        for vector, result in zip(self._vectors, self._results):
+            shape = vector.dd.shape
+            if self._variances:
+                if len(shape) != 2 or shape[0] != 2:
+                    raise TypeFunctionError(
+                        f"The inputs should be stacked values and variances (2xN), but got {shape}",
+                        node=self,
+                        input=vector,
+                    )
+                result.dd.shape = (2, nnew)
+                identities.append(None)
+            elif len(shape) == 1:
+                result.dd.shape = (nnew,)
+                identities.append(None)
+            elif len(shape) == 2:
+                if self._axis is None:
+                    result.dd.shape = (nnew, nnew)
+                    identities.append(None)
+                else:
+                    naxis = shape[1 - self._axis]
+                    result.dd.shape = (nnew, naxis) if self._axis == 0 else (naxis, nnew)
+                    # the segments of the axis, which is not rebinned
+                    identities.append(arange(naxis + 1, dtype="i"))
+            else:
+                raise TypeFunctionError(
+                    f"The inputs should be 1D or 2D, but got {shape}", node=self, input=vector
+                )
+            result.dd.dtype = vector.dd.dtype
+        self._identities = tuple(identities)
+        self.function = self._functions_dict[self.mode]
+
+
+def _segmented_sum_python(
+    segments: NDArray,
+    vector: NDArray,
+    result: NDArray,
+    fractions: NDArray | None = None,
+) -> None:
+    for inew in range(result.size):
+        iold_first, iold_last = segments[inew], segments[inew + 1]
+        total = 0.0
+        for iold in range(iold_first, iold_last):
+            total += vector[iold]
+        if fractions is not None:
+            if fractions[inew] > 0.0:
+                total -= fractions[inew] * vector[iold_first]
+            if fractions[inew + 1] > 0.0:
+                total += fractions[inew + 1] * vector[iold_last]
+        result[inew] = total
+
+
+_segmented_sum_numba: Callable[[NDArray, NDArray, NDArray, NDArray | None], None] = njit(
+    cache=True
+)(_segmented_sum_python)
+
+
+def _segmented_sum_rows_python(
+    segments: NDArray,
+    matrix: NDArray,
+    result: NDArray,
+    fractions: NDArray | None = None,
+) -> None:
+    """Apply the segmented sum to each row of the `matrix`"""
+    for irow in range(result.shape[0]):
+        _segmented_sum_python(segments, matrix[irow], result[irow], fractions)
+
+
+@njit(cache=True)
+def _segmented_sum_rows_numba(
+    segments: NDArray,
+    matrix: NDArray,
+    result: NDArray,
+    fractions: NDArray | None = None,
+) -> None:
+    for irow in range(result.shape[0]):
+        _segmented_sum_numba(segments, matrix[irow], result[irow], fractions)
+
+
+def _segmented_sum_variances_python(
+    segments: NDArray,
+    values: NDArray,
+    result: NDArray,
+    fractions: NDArray | None = None,
+) -> None:
+    """Rebin the values (`values[0]`) and their variances (`values[1]`) in a single
+    pass. The variances are summed with the squared weights."""
+    for inew in range(result.shape[1]):
+        iold_first, iold_last = segments[inew], segments[inew + 1]
+        total = 0.0
+        total_variance = 0.0
+        for iold in range(iold_first, iold_last + 1):
+            weight = 1.0 if iold < iold_last else 0.0
+            if fractions is not None:
+                if iold == iold_first:
+                    weight -= fractions[inew]
+                if iold == iold_last:
+                    weight += fractions[inew + 1]
+            if weight == 0.0:
+                continue
+            total += weight * values[0, iold]
+            total_variance += weight * weight * values[1, iold]
+        result[0, inew] = total
+        result[1, inew] = total_variance
+
+
+_segmented_sum_variances_numba: Callable[[NDArray, NDArray, NDArray, NDArray | None], None] = (
+    njit(cache=True)(_segmented_sum_variances_python)
+)
+
+
+def _block_sum_python(
+    segments_rows: NDArray,
+    segments_columns: NDArray,
+    matrix: NDArray,
+    result: NDArray,
+    fractions_rows: NDArray | None = None,
+    fractions_columns: NDArray | None = None,
+) -> None:
+    """Sum the blocks of the `matrix`, defined by the segments of rows and columns.
+
+    The old bin `segments[i+1]` is included to the new bin `i` only with the
+    fraction `fractions[i+1]`, the weight of `segments[i]` is reduced by
+    `fractions[i]`. The bins with zero weight are skipped (not read).
+    """
+    for irow in range(result.shape[0]):
+        krow_first, krow_last = segments_rows[irow], segments_rows[irow + 1]
+        for icol in range(result.shape[1]):
+            kcol_first, kcol_last = segments_columns[icol], segments_columns[icol + 1]
+            total = 0.0
+            for krow in range(krow_first, krow_last + 1):
+                weight_row = 1.0 if krow < krow_last else 0.0
+                if fractions_rows is not None:
+                    if krow == krow_first:
+                        weight_row -= fractions_rows[irow]
+                    if krow == krow_last:
+                        weight_row += fractions_rows[irow + 1]
+                if weight_row == 0.0:
+                    continue
+
+                total_row = 0.0
+                for kcol in range(kcol_first, kcol_last + 1):
+                    weight_col = 1.0 if kcol < kcol_last else 0.0
+                    if fractions_columns is not None:
+                        if kcol == kcol_first:
+                            weight_col -= fractions_columns[icol]
+                        if kcol == kcol_last:
+                            weight_col += fractions_columns[icol + 1]
+                    if weight_col == 0.0:
+                        continue
+                    total_row += weight_col * matrix[krow, kcol]
+                total += weight_row * total_row
+            result[irow, icol] = total
+
+
+_block_sum_numba: Callable[
+    [NDArray, NDArray, NDArray, NDArray, NDArray | None, NDArray | None], None
+] = njit(cache=True)(_block_sum_python)
+
+
+def _segmented_sum_numpy(
+    segments: NDArray,
+    data: NDArray,
+    result: NDArray,
+    fractions: NDArray | None = None,
+    axis: int = -1,
+) -> None:
+    """The same as `_segmented_sum_python`, vectorized with `add.reduceat` along the `axis`"""
+    axis %= data.ndim
+    nold = data.shape[axis]
+    nnew = segments.size - 1
+    indices = minimum(segments, nold - 1)
+    # `reduceat` sums up to the next index, the last sum is up to the end
+    if segments[-1] == nold:
+        total = add.reduceat(data, indices[:-1], axis=axis)
+    else:
+        total = add.reduceat(data, indices, axis=axis)[(slice(None),) * axis + (slice(0, nnew),)]
+
+    shape = [1] * data.ndim
+    shape[axis] = nnew
+    # `reduceat` returns a single element for the empty segments
+    total *= (segments[1:] > segments[:-1]).reshape(shape)
+    if fractions is not None:
+        first = fractions[:-1].reshape(shape)
+        last = fractions[1:].reshape(shape)
+        total -= where(first > 0.0, first * take(data, indices[:-1], axis=axis), 0.0)
+        total += where(last > 0.0, last * take(data, indices[1:], axis=axis), 0.0)
+    result[...] = total
+
+
+def _segmented_sum_variances_numpy(
+    segments: NDArray,
+    values: NDArray,
+    result: NDArray,
+    fractions: NDArray | None = None,
+) -> None:
+    """The same as `_segmented_sum_variances_python`, vectorized"""
+    _segmented_sum_numpy(segments, values[0], result[0], fractions)
+    _segmented_sum_numpy(segments, values[1], result[1])
+    if fractions is None:
+        return
+
+    # the partial old bins are summed with the unit weights above, replace them by the squared ones
+    variances = values[1]
+    indices = minimum(segments, variances.size - 1)
+    first, last = fractions[:-1], fractions[1:]
+    nonempty = segments[1:] > segments[:-1]
+    weight_first = where(nonempty, 1.0 - first, last - first)
+    factor_first = weight_first * weight_first - nonempty
+    result[1] += where(factor_first != 0.0, factor_first * variances[indices[:-1]], 0.0)
+    result[1] += where(nonempty & (last > 0.0), last * last * variances[indices[1:]], 0.0)
+
+
+def _block_sum_numpy(
+    segments_rows: NDArray,
+    segments_columns: NDArray,
+    matrix: NDArray,
+    result: NDArray,
+    fractions_rows: NDArray | None = None,
+    fractions_columns: NDArray | None = None,
+) -> None:
+    """The same as `_block_sum_python`: the rows and the columns are summed in turn"""
+    rows = empty((segments_rows.size - 1, matrix.shape[1]), dtype=result.dtype)
+    _segmented_sum_numpy(segments_rows, matrix, rows, fractions_rows, axis=0)
+    _segmented_sum_numpy(segments_columns, rows, result, fractions_columns, axis=1)
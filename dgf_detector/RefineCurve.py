@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from dagflow.core.exception import InitializationError, TypeFunctionError, UnclosedGraphError
+from dagflow.core.input_strategy import AddNewInputAddNewOutput
+from dagflow.core.node import Node
+from dagflow.core.type_functions import (
+    AllPositionals,
+    check_dimension_of_inputs,
+    check_inputs_have_same_shape,
+)
+from numpy import array_equal, matmul
+
+from dgf_detector.bundles.refine_lsnl_data import RefineGraph
+
+if TYPE_CHECKING:
+    from dagflow.core.input import Input
+    from dagflow.core.output import Output
+    from numpy.typing import NDArray
+
+
+class RefineCurve(Node):
+    r"""
+    Refines the (LSNL) curves, defined on a coarse grid, within the graph.
+    The same as `refine_lsnl_data`, see `RefineGraph`.
+
+    inputs:
+        `x`: the coarse grid
+        `nominal`: the nominal relative curve
+        `0`, `1`, ...: the relative curves
+
+    outputs:
+        `xfine`: the fine extended grid
+        `nominal`: the refined nominal curve (absolute)
+        `0`, `1`, ...: the refined differences of the curves to the nominal one,
+            smoothed if `savgol_filter_smoothen` is set
+
+    The size of the fine grid depends on the values of `x`, so `x` should be
+    available (closed) before the graph is closed, e.g. `Array` with
+    `mode="store"`: the type function builds only the fine grid. The
+    refinement operators are built on the evaluation and rebuilt only when the
+    values of `x` change. The number of the fine points should not change.
+
+    The outputs take the dtype of the inputs, the operators are computed in
+    double precision.
+    """
+
+    __slots__ = (
+        "_x",
+        "_nominal",
+        "_xfine",
+        "_nominal_fine",
+        "_ys",
+        "_results",
+        "_refiner",
+        "_refine_times",
+        "_newmin",
+        "_newmax",
+        "_savgol_filter_smoothen",
+    )
+
+    _x: Input
+    _nominal: Input
+    _xfine: Output
+    _nominal_fine: Output
+    _ys: tuple[Input, ...]
+    _results: tuple[Output, ...]
+    _refiner: RefineGraph | None
+    _refine_times: int
+    _newmin: float
+    _newmax: float
+    _savgol_filter_smoothen: tuple[int, int] | None
+
+    def __init__(
+        self,
+        *args,
+        refine_times: int,
+        newmin: float,
+        newmax: float,
+        savgol_filter_smoothen: tuple[int, int] | None = None,
+        **kwargs,
+    ):
+        super().__init__(
+            *args,
+            **kwargs,
+            input_strategy=AddNewInputAddNewOutput(input_fmt="y", output_fmt="result"),
+            allowed_kw_inputs=("x", "nominal"),
+        )
+        self.labels.setdefaults(
+            {
+                "text": "Refined curve",
+            }
+        )
+        if refine_times % 1 != 0 or refine_times <= 0:
+            raise InitializationError(
+                f"`refine_times` must be a positive integer, but given {refine_times}", node=self
+            )
+        self._refine_times = refine_times
+        self._newmin = newmin
+        self._newmax = newmax
+        self._savgol_filter_smoothen = savgol_filter_smoothen
+        self._refiner = None
+        self._ys = ()
+        self._results = ()
+        self._x = self._add_input("x", positional=False)
+        self._nominal = self._add_input("nominal", positional=False)
+        self._xfine = self._add_output("xfine", positional=False)
+        self._nominal_fine = self._add_output("nominal", positional=False)
+
+    @property
+    def refiner(self) -> RefineGraph | None:
+        return self._refiner
+
+    def _make_refiner(self, x: NDArray, grid_only: bool = False) -> RefineGraph:
+        return RefineGraph(
+            x.copy(),
+            refine_times=self._refine_times,
+            newmin=self._newmin,
+            newmax=self._newmax,
+            savgol_filter_smoothen=self._savgol_filter_smoothen,
+            grid_only=grid_only,
+        )
+
+    def taint(self, *, caller: Input | None = None, **kwargs):
+        skip = self.frozen or (self.tainted and not kwargs.get("force_taint", False))
+        ret = super().taint(caller=caller, **kwargs)
+        if not skip:
+            # the children of the keyword outputs are not reached by `taint_children`
+            self._xfine.taint_children(caller=caller, **kwargs)
+            self._nominal_fine.taint_children(caller=caller, **kwargs)
+        return ret
+
+    def _function(self):
+        x = self._x.data
+        refiner = self._refiner
+        if refiner is None or not array_equal(refiner.xcoarse, x):
+            refiner = self._refiner = self._make_refiner(x)
+            if refiner.xfine_extended.size != self._xfine.dd.size:
+                raise RuntimeError(
+                    f"The number of the fine points has changed: {refiner.xfine_extended.size}, "
+                    f"expected {self._xfine.dd.size}"
+                )
+            self._xfine._data[:] = refiner.xfine_extended
+
+        nominal = self._nominal.data
+        matmul(refiner.operator, nominal, out=self._nominal_fine._data)
+        if not self._results:
+            return
+
+        nominal_diff = refiner.operator_diff @ nominal
+        for y, result in zip(self._ys, self._results):
+            buffer = result._data
+            matmul(refiner.operator_diff, y.data, out=buffer)
+            buffer -= nominal_diff
+
+    def _type_function(self) -> None:
+        """A output takes this function to determine the dtype and shape"""
+        check_dimension_of_inputs(self, ("x", "nominal"), 1)
+        (ncoarse,) = check_inputs_have_same_shape(self, ("x", "nominal"))
+        self._ys = tuple(self.inputs[:])
+        self._results = tuple(self.outputs[:])
+        if self._ys:
+            check_dimension_of_inputs(self, AllPositionals, 1)
+            (ny,) = check_inputs_have_same_shape(self, AllPositionals)
+            if ny != ncoarse:
+                raise TypeFunctionError(
+                    f"The curves ({ny}) are inconsistent with x ({ncoarse})", node=self
+                )
+
+        # the size of the fine grid depends on the values of x, the operators are built later
+        try:
+            x = self._x.data
+        except UnclosedGraphError:
+            raise TypeFunctionError(
+                "`x` should be available (closed) before the graph is closed",
+                node=self,
+                input=self._x,
+            )
+        nfine = self._make_refiner(x, grid_only=True).xfine_extended.size
+        self._refiner = None
+        self._xfine.dd.shape = (nfine,)
+        self._xfine.dd.dtype = self._x.dd.dtype
+        for output in (self._nominal_fine,) + self._results:
+            output.dd.shape = (nfine,)
+            output.dd.dtype = self._nominal.dd.dtype
@@ -1,9 +1,63 @@
-from .AxisDistortionMatrix import AxisDistortionMatrix
-from .AxisDistortionMatrixLinear import AxisDistortionMatrixLinear
-from .AxisDistortionMatrixPointwise import AxisDistortionMatrixPointwise
-from .EnergyResolution import EnergyResolution
-from .EnergyResolutionMatrixBC import EnergyResolutionMatrixBC
-from .EnergyResolutionSigmaRelABC import EnergyResolutionSigmaRelABC
-from .Monotonize import Monotonize
-from .Rebin import Rebin
-from .RebinMatrix import RebinMatrix
+from __future__ import annotations
+
+from importlib import import_module
+from sys import modules
+from types import ModuleType
+from typing import TYPE_CHECKING
+
+# The nodes are imported on the first access, so `import dgf_detector` does not
+# import numba, scipy and the dagflow library nodes. Each node is defined in the
+# submodule of the same name.
+__all__ = (
+    "AxisDistortionMatrix",
+    "AxisDistortionMatrixComposite",
+    "AxisDistortionMatrixLinear",
+    "AxisDistortionMatrixPointwise",
+    "EnergyResolution",
+    "EnergyResolutionMatrixBC",
+    "EnergyResolutionSigmaRelABC",
+    "Monotonize",
+    "Rebin",
+    "RebinBatched",
+    "RebinMatrix",
+    "RebinSegmentedSum",
+    "RefineCurve",
+)
+
+if TYPE_CHECKING:
+    from .AxisDistortionMatrix import AxisDistortionMatrix
+    from .AxisDistortionMatrixComposite import AxisDistortionMatrixComposite
+    from .AxisDistortionMatrixLinear import AxisDistortionMatrixLinear
+    from .AxisDistortionMatrixPointwise import AxisDistortionMatrixPointwise
+    from .EnergyResolution import EnergyResolution
+    from .EnergyResolutionMatrixBC import EnergyResolutionMatrixBC
+    from .EnergyResolutionSigmaRelABC import EnergyResolutionSigmaRelABC
+    from .Monotonize import Monotonize
+    from .Rebin import Rebin
+    from .RebinBatched import RebinBatched
+    from .RebinMatrix import RebinMatrix
+    from .RebinSegmentedSum import RebinSegmentedSum
+    from .RefineCurve import RefineCurve
+
+
+class _LazyModule(ModuleType):
+    def __setattr__(self, name: str, value) -> None:
+        # the import of a submodule sets it as an attribute of the package,
+        # the node of the same name is exposed instead (as the eager import did)
+        if name in __all__ and isinstance(value, ModuleType):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+def __getattr__(name: str):
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import_module(f".{name}", __name__)
+    return globals()[name]
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+modules[__name__].__class__ = _LazyModule
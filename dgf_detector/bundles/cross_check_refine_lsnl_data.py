@@ -1,6 +1,5 @@
-from numpy import arange
+from numpy import arange, searchsorted, stack
 from numpy.typing import NDArray
-from scipy.interpolate import interp1d
 
 from multikeydict.nestedmkdict import NestedMKDict
 
@@ -9,30 +8,56 @@ def cross_check_refine_lsnl_data(
     storage: NestedMKDict, *, xname: str, nominalname: str, **kwargs
 ) -> None:
     xcoarse = storage[xname]
+    nominal = storage[nominalname]
 
     refiner = RefineGraph(xcoarse, **kwargs)
 
+    keys, curves = [], []
     for key, ycoarse in storage.walkitems():
         if ycoarse is xcoarse:
             continue
+        if ycoarse is nominal:
+            storage[key] = refiner.process(nominal, nominal)
+            continue
+
+        keys.append(key)
+        curves.append(ycoarse)
 
-        nominal = storage[nominalname]
-        storage[key] = refiner.process(ycoarse, nominal)
+    # all the curves are interpolated at once
+    if curves:
+        for key, yfine in zip(keys, refiner.process_stack(stack(curves), nominal)):
+            storage[key] = yfine
 
     storage[xname] = refiner.xfine
 
 
 class RefineGraph:
+    """Interpolate the curves linearly from `xcoarse` to `xfine`.
+
+    The fine grid is either given explicitly (`xfine`) or defined by the
+    `step` and the `xrange` (both ends included). The bracketing indices and
+    the weights of the linear interpolation (extrapolation) are computed once
+    and shared by all the curves.
+    """
+
     __slots__ = (
         "xcoarse",
         "xfine",
         "newmin",
         "newmax",
+        "step",
+        "xrange",
+        "indices",
+        "weights",
     )
     xcoarse: NDArray
     xfine: NDArray
     newmin: float
     newmax: float
+    step: float
+    xrange: tuple[float, float]
+    indices: NDArray
+    weights: NDArray
 
     def __init__(
         self,
@@ -40,18 +65,36 @@ class RefineGraph:
         *,
         newmin: float,
         newmax: float,
+        step: float = 0.05,
+        xrange: tuple[float, float] = (0.0, 12.0),
+        xfine: NDArray | None = None,
     ):
         self.xcoarse = xcoarse
         self.newmin = newmin
         self.newmax = newmax
+        self.step = step
+        self.xrange = xrange
+        self.xfine = xfine
 
         self._process_x()
 
     def make_x(self) -> None:
-        self.xfine = arange(0.0, 12.0000001, 0.05)
+        if self.xfine is not None:
+            return
+        xmin, xmax = self.xrange
+        self.xfine = arange(xmin, xmax + self.step * 1.0e-6, self.step)
+
+    def make_weights(self) -> None:
+        # the index of the left point of the coarse segment, the edge segments are extrapolated
+        self.indices = searchsorted(self.xcoarse, self.xfine, side="right") - 1
+        self.indices.clip(0, self.xcoarse.size - 2, out=self.indices)
+        x0 = self.xcoarse[self.indices]
+        x1 = self.xcoarse[self.indices + 1]
+        self.weights = (self.xfine - x0) / (x1 - x0)
 
     def _process_x(self) -> None:
         self.make_x()
+        self.make_weights()
 
     def process(self, y: NDArray, nominal: NDArray) -> NDArray:
         skip_diff = y is nominal
@@ -60,18 +103,22 @@ class RefineGraph:
 
         return yabs if skip_diff else self._method_diff(nominal, yabs)
 
+    def process_stack(self, ys: NDArray, nominal: NDArray) -> NDArray:
+        """Interpolate the relative curves (rows of `ys`) and return their
+        absolute differences to the interpolated `nominal`"""
+        nominal_fine = self.process(nominal, nominal)
+        yabs = self._method_reltoabs(self._method_interpolate(ys))
+        yabs -= nominal_fine
+        return yabs
+
     def _method_reltoabs(self, yrel: NDArray) -> NDArray:
         return yrel * self.xfine
 
-    def _method_interpolate(self, ycoarse) -> NDArray:
-        fcn = interp1d(
-            self.xcoarse,
-            ycoarse,
-            kind="linear",
-            bounds_error=False,
-            fill_value="extrapolate",
-        )
-        return fcn(self.xfine)
+    def _method_interpolate(self, ycoarse: NDArray) -> NDArray:
+        """Interpolate the curve or the curves (along the last axis)"""
+        yleft = ycoarse[..., self.indices]
+        yright = ycoarse[..., self.indices + 1]
+        return yleft + (yright - yleft) * self.weights
 
     def _method_diff(self, nominal: NDArray, y: NDArray) -> NDArray:
         return nominal if nominal is y else y - nominal
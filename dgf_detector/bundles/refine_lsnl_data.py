@@ -1,28 +1,298 @@
-from numpy import arange, concatenate, linspace
+from __future__ import annotations
+
+from hashlib import sha256
+from json import dumps, loads
+from os import replace
+from pathlib import Path
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+from numpy import (
+    arange,
+    ascontiguousarray,
+    atleast_2d,
+    ceil,
+    concatenate,
+    diag,
+    diff,
+    fabs,
+    linspace,
+    load,
+    maximum,
+    ndarray,
+    save,
+    sqrt,
+    stack,
+)
 from numpy.typing import NDArray
-from scipy.interpolate import interp1d
 
 from multikeydict.nestedmkdict import NestedMKDict
 
+# the version of the cache format, increment to invalidate the existing caches
+_CACHE_VERSION = 2
+
 
 def refine_lsnl_data(
-    storage: NestedMKDict, *, xname: str, nominalname: str, **kwargs
+    storage: NestedMKDict,
+    *,
+    xname: str,
+    nominalname: str,
+    cache_dir: str | Path | None = None,
+    lazy: bool = False,
+    **kwargs,
 ) -> None:
+    """Refine the LSNL curves in the `storage` in place, see `RefineGraph`.
+
+    If `cache_dir` is given, the results are cached on disk, keyed by the hash
+    of the input arrays and the settings. The cached arrays are memory mapped
+    (read only). The entries, which can not be read or do not match their
+    checksums, are removed and computed again. The cache is not limited in
+    size, see `clean_refine_cache`.
+
+    If `lazy`, the curves are replaced by `LazyRefinedCurve` objects, which are
+    refined on the first access. The lazy results skip the cache: they are not
+    computed at the time of the call and are not written, an existing entry is
+    still loaded.
+
+    If `refine_tolerance` is set, the fine grid is adaptive and is defined by
+    all the curves of the storage, see `RefineGraph`.
+    """
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = Path(cache_dir) / _cache_key(storage, xname, nominalname, kwargs)
+        if _cache_load(storage, cache_path):
+            return
+
     xcoarse = storage[xname]
+    nominal = storage[nominalname]
 
+    if kwargs.get("refine_tolerance") is not None and kwargs.get("yreference") is None:
+        kwargs["yreference"] = stack(
+            [ycoarse for _, ycoarse in storage.walkitems() if ycoarse is not xcoarse]
+        )
     refiner = RefineGraph(xcoarse, **kwargs)
 
+    keys, curves = [], []
     for key, ycoarse in storage.walkitems():
         if ycoarse is xcoarse:
             continue
+        if lazy:
+            storage[key] = LazyRefinedCurve(refiner, ycoarse, nominal)
+            continue
+        if ycoarse is nominal:
+            storage[key] = refiner.refine(nominal)
+            continue
+
+        keys.append(key)
+        curves.append(ycoarse)
 
-        nominal = storage[nominalname]
-        storage[key] = refiner.process(ycoarse, nominal)
+    # all the curves are refined at once by a single matrix product
+    if curves:
+        for key, yfine in zip(keys, refiner.process_stack(stack(curves), nominal)):
+            storage[key] = yfine
 
     storage[xname] = refiner.xfine_extended
 
+    if cache_path is not None and not lazy:
+        _cache_save(storage, cache_path)
+
+
+class LazyRefinedCurve:
+    """The curve, refined on the first access and memoized.
+
+    Supports the conversion to numpy array (`numpy.asarray`), `value` returns
+    the refined array. The curve is not written to the cache of
+    `refine_lsnl_data`.
+    """
+
+    __slots__ = ("_refiner", "_y", "_nominal", "_value")
+
+    _refiner: RefineGraph | None
+    _y: NDArray | None
+    _nominal: NDArray | None
+    _value: NDArray | None
+
+    def __init__(self, refiner: RefineGraph, y: NDArray, nominal: NDArray):
+        self._refiner = refiner
+        self._y = y
+        self._nominal = nominal
+        self._value = None
+
+    @property
+    def value(self) -> NDArray:
+        if self._value is None:
+            if self._y is self._nominal:
+                self._value = self._refiner.refine(self._y)
+            else:
+                self._value = self._refiner.process_stack(self._y, self._nominal)
+            # release the coarse data
+            self._refiner = self._y = self._nominal = None
+        return self._value
+
+    @property
+    def refined(self) -> bool:
+        return self._value is not None
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        if self._value is not None:
+            return self._value.shape
+        return self._refiner.xfine_extended.shape
+
+    @property
+    def dtype(self):
+        return self.value.dtype
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None) -> NDArray:
+        value = self.value
+        if dtype is not None and dtype != value.dtype:
+            return value.astype(dtype)
+        return value.copy() if copy else value
+
+
+def _cache_key(storage: NestedMKDict, xname: str, nominalname: str, settings: dict) -> str:
+    from scipy import __version__ as scipy_version
+
+    hasher = sha256()
+    header = {
+        "version": _CACHE_VERSION,
+        "scipy": scipy_version,
+        "xname": xname,
+        "nominalname": nominalname,
+        "settings": {
+            name: repr(value) for name, value in settings.items() if not isinstance(value, ndarray)
+        },
+    }
+    hasher.update(dumps(header, sort_keys=True).encode())
+
+    # repr() of a large array is truncated, the array settings are hashed by content
+    for name, value in sorted(settings.items()):
+        if isinstance(value, ndarray):
+            value = ascontiguousarray(value)
+            hasher.update(dumps([name, value.dtype.str, value.shape]).encode())
+            hasher.update(value.data)
+
+    nominal = storage[nominalname]
+    for key, array in storage.walkitems():
+        is_nominal = array is nominal
+        array = ascontiguousarray(array)
+        hasher.update(dumps([list(key), array.dtype.str, array.shape, is_nominal]).encode())
+        hasher.update(array.data)
+    return hasher.hexdigest()
+
+
+def _cache_load(storage: NestedMKDict, path: Path) -> bool:
+    index_path = path / "index.json"
+    if not index_path.is_file():
+        return False
+
+    try:
+        index = loads(index_path.read_text())
+        if index["version"] != _CACHE_VERSION:
+            raise ValueError("Inconsistent cache version")
+        entries = []
+        for key, filename, shape, dtype, checksum in index["entries"]:
+            array = load(path / filename, mmap_mode="r")
+            if array.shape != tuple(shape) or array.dtype.str != dtype:
+                raise ValueError(f"Inconsistent cache entry {filename}")
+            if _checksum(array) != checksum:
+                raise ValueError(f"Corrupt cache entry {filename}")
+            entries.append((tuple(key), array))
+    except (OSError, ValueError, KeyError, TypeError):
+        # corrupt entry: remove and recompute
+        rmtree(path, ignore_errors=True)
+        return False
+
+    for key, array in entries:
+        storage[key] = array
+    return True
+
+
+def _cache_save(storage: NestedMKDict, path: Path) -> None:
+    """Write the entry to a temporary directory and move it in place atomically.
+    Failing to write the cache is not an error."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmppath = Path(mkdtemp(dir=path.parent, prefix=f".{path.name}-"))
+    except OSError:
+        return
+
+    try:
+        entries = []
+        for i, (key, array) in enumerate(storage.walkitems()):
+            filename = f"{i}.npy"
+            save(tmppath / filename, array)
+            entries.append(
+                [list(key), filename, list(array.shape), array.dtype.str, _checksum(array)]
+            )
+        (tmppath / "index.json").write_text(
+            dumps({"version": _CACHE_VERSION, "entries": entries})
+        )
+        replace(tmppath, path)
+    except OSError:
+        # e.g. the entry has been written by another process
+        rmtree(tmppath, ignore_errors=True)
+
+
+def _checksum(array: NDArray) -> str:
+    return sha256(ascontiguousarray(array).data).hexdigest()
+
+
+def clean_refine_cache(cache_dir: str | Path, *, max_age: float | None = None) -> int:
+    """Remove the stale entries of the cache of `refine_lsnl_data`.
+
+    The entries of the other cache versions, the unreadable entries and the
+    leftovers of the interrupted writes are removed. If `max_age` (seconds) is
+    given, the entries, written earlier, are removed as well. Returns the
+    number of the removed entries.
+    """
+    cache_dir = Path(cache_dir)
+    if not cache_dir.is_dir():
+        return 0
+
+    removed = 0
+    for path in cache_dir.iterdir():
+        if not path.is_dir():
+            continue
+        index_path = path / "index.json"
+        try:
+            stale = loads(index_path.read_text())["version"] != _CACHE_VERSION
+            if not stale and max_age is not None:
+                stale = time() - index_path.stat().st_mtime > max_age
+        except (OSError, ValueError, KeyError, TypeError):
+            stale = True
+        if stale:
+            rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
 
 class RefineGraph:
+    """Refine the curves, defined on `xcoarse`, onto the finer extended grid.
+
+    The refinement (relative to absolute, cubic interpolation, linear
+    extrapolation, optional Savitzky-Golay filter) is linear, so it is computed
+    once as a pair of operators, applied to all the curves by `process_stack`:
+        - `operator`: coarse relative curve -> fine absolute curve
+        - `operator_diff`: coarse relative difference -> fine smoothed difference
+    The cubic interpolation is global, so the operators are dense.
+
+    By default each coarse interval is split into `refine_times` intervals. If
+    `refine_tolerance` is set, the number of the fine intervals is adaptive:
+    it is the minimal number, for which the linear interpolation between the
+    fine points deviates from the cubic interpolant by less than the tolerance,
+    but not more than `refine_times`. The deviation is estimated as h^2*M/8,
+    where h is the fine step and M is the maximal absolute second derivative
+    of the cubic interpolant of the (absolute) `yreference` curves on the
+    interval. The adaptive grid is not compatible with the Savitzky-Golay filter.
+
+    If `grid_only`, only the fine grid is built, the operators are not computed.
+    """
+
     __slots__ = (
         "xcoarse",
         "xfine_bound",
@@ -32,6 +302,10 @@ class RefineGraph:
         "newmin",
         "newmax",
         "savgol_filter_smoothen",
+        "refine_tolerance",
+        "yreference",
+        "operator",
+        "operator_diff",
     )
     xcoarse: NDArray
     xfine_bound: NDArray
@@ -41,6 +315,10 @@ class RefineGraph:
     newmin: float
     newmax: float
     savgol_filter_smoothen: tuple[int, int] | None
+    refine_tolerance: float | None
+    yreference: NDArray | None
+    operator: NDArray
+    operator_diff: NDArray
 
     def __init__(
         self,
@@ -50,18 +328,39 @@ class RefineGraph:
         newmin: float,
         newmax: float,
         savgol_filter_smoothen: tuple[int, int] | None = None,
+        refine_tolerance: float | None = None,
+        yreference: NDArray | None = None,
+        grid_only: bool = False,
     ):
         self.xcoarse = xcoarse
         self.refine_times = refine_times
         self.newmin = newmin
         self.newmax = newmax
         self.savgol_filter_smoothen = savgol_filter_smoothen
-
-        self._process_x()
+        self.refine_tolerance = refine_tolerance
+        self.yreference = yreference
+
+        if refine_tolerance is not None:
+            if refine_tolerance <= 0:
+                raise ValueError(
+                    f"`refine_tolerance` must be positive, but given {refine_tolerance}"
+                )
+            if yreference is None:
+                raise ValueError("The adaptive refinement requires `yreference`")
+            if savgol_filter_smoothen is not None:
+                raise ValueError(
+                    "The adaptive refinement is not compatible with `savgol_filter_smoothen`"
+                )
+
+        self._process_x(grid_only)
 
     def make_finer_x(self) -> None:
         assert self.refine_times % 1 == 0 and self.refine_times > 0
 
+        if self.refine_tolerance is not None:
+            self.make_adaptive_x()
+            return
+
         if self.refine_times == 1:
             self.xfine_bound = self.xcoarse.copy()
             return
@@ -69,6 +368,26 @@ class RefineGraph:
         shape_fine = (self.xcoarse.size - 1) * self.refine_times + 1
         self.xfine_bound = linspace(self.xcoarse[0], self.xcoarse[-1], shape_fine)
 
+    def make_adaptive_x(self) -> None:
+        from scipy.interpolate import make_interp_spline
+
+        yabs = atleast_2d(self.yreference) * self.xcoarse
+        spline = make_interp_spline(self.xcoarse, yabs, k=3, axis=1)
+        # the second derivative of the cubic spline is linear on each interval
+        curvature = fabs(spline.derivative(2)(self.xcoarse)).max(axis=0)
+        curvature = maximum(curvature[:-1], curvature[1:])
+
+        widths = diff(self.xcoarse)
+        nintervals = ceil(widths * sqrt(curvature / (8.0 * self.refine_tolerance)))
+        nintervals = nintervals.clip(1, self.refine_times).astype("i")
+
+        xstack = [
+            linspace(x0, x1, n, endpoint=False)
+            for x0, x1, n in zip(self.xcoarse[:-1], self.xcoarse[1:], nintervals)
+        ]
+        xstack.append(self.xcoarse[-1:])
+        self.xfine_bound = concatenate(xstack)
+
     def make_extended_x(self):
         if self.newmin is None and self.newmax is None:
             return
@@ -90,9 +409,65 @@ class RefineGraph:
         self.xfine_extended = concatenate(xstack)
         self.xfine_extended_stack = tuple(xstack)
 
-    def _process_x(self):
+    def _process_x(self, grid_only: bool = False):
         self.make_finer_x()
         self.make_extended_x()
+        if not grid_only:
+            self.make_operators()
+
+    def make_operators(self) -> None:
+        from scipy.interpolate import interp1d
+
+        # the columns of the basis are the unit curves after the conversion to absolute
+        basis = diag(self.xcoarse)
+        if self.refine_times == 1:
+            fine = basis
+        else:
+            fine = interp1d(
+                self.xcoarse,
+                basis,
+                kind="cubic",
+                axis=0,
+                bounds_error=False,
+                fill_value="extrapolate",
+            )(self.xfine_bound)
+
+        fcn = interp1d(
+            self.xfine_bound,
+            fine,
+            kind="linear",
+            axis=0,
+            bounds_error=False,
+            fill_value="extrapolate",
+        )
+        xleft, _, xright = self.xfine_extended_stack
+        operator_stack = [None, fine, None]
+        if xleft is not None:
+            operator_stack[0] = fcn(xleft)
+        if xright is not None:
+            operator_stack[-1] = fcn(xright)
+        self.operator = concatenate(operator_stack, axis=0)
+
+        if self.savgol_filter_smoothen is None:
+            self.operator_diff = self.operator
+            return
+
+        from scipy.signal import savgol_filter
+
+        npoints_coarse, deg = self.savgol_filter_smoothen
+        self.operator_diff = savgol_filter(
+            self.operator, npoints_coarse * self.refine_times, deg, axis=0
+        )
+
+    def refine(self, y: NDArray) -> NDArray:
+        """Refine the relative curve `y`, equivalent to `process(y, y)`"""
+        return self.operator @ y
+
+    def process_stack(self, ys: NDArray, nominal: NDArray) -> NDArray:
+        """Refine the relative curves (rows of `ys`) and return their differences
+        to the refined `nominal`, smoothed if needed. Equivalent to `process`,
+        applied to each row with refined nominal."""
+        return (ys - nominal) @ self.operator_diff.T
 
     def process(
         self,
@@ -121,6 +496,8 @@ class RefineGraph:
         if self.refine_times == 1:
             return ycoarse.copy()
 
+        from scipy.interpolate import interp1d
+
         fcn = interp1d(
             self.xcoarse,
             ycoarse,
@@ -131,6 +508,8 @@ class RefineGraph:
         return fcn(self.xfine_bound)
 
     def _method_extrapolate(self, ybound: NDArray) -> NDArray:
+        from scipy.interpolate import interp1d
+
         fcn = interp1d(
             self.xfine_bound,
             ybound,
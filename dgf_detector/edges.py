@@ -0,0 +1,63 @@
+"""The comparison of the bin edges, shared by the detector nodes.
+
+`RebinMatrix` checks the clones of `edges_old` with `_edges_are_close_*`. The
+nodes, which take two inputs of the same edges (`AxisDistortionMatrix*`,
+`EnergyResolutionMatrixBC`), check them with `_check_edges_are_identical`.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from numba import njit
+from numpy import flatnonzero
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from dagflow.core.input import Input
+    from numpy.typing import NDArray
+
+
+def _edges_are_close_python(edges: NDArray, other: NDArray, atol: float, rtol: float) -> int:
+    """Return the index of the first inconsistent edge or -1 if the edges are close"""
+    for i in range(edges.size):
+        if not abs(edges[i] - other[i]) <= atol + rtol * abs(other[i]):
+            return i
+    return -1
+
+
+_edges_are_close_numba: Callable[[NDArray, NDArray, float, float], int] = njit(cache=True)(
+    _edges_are_close_python
+)
+
+
+def _edges_are_close_numpy(edges: NDArray, other: NDArray, atol: float, rtol: float) -> int:
+    """The same as `_edges_are_close_python`, vectorized"""
+    inconsistent = flatnonzero(~(abs(edges - other) <= atol + rtol * abs(other)))
+    return inconsistent[0] if inconsistent.size else -1
+
+
+_edges_are_close = {
+    "python": _edges_are_close_python,
+    "numba": _edges_are_close_numba,
+    "numpy": _edges_are_close_numpy,
+    "trace": _edges_are_close_numba,
+}
+
+
+def _check_edges_are_identical(edges: Input, other: Input, mode: str = "numba") -> None:
+    """Check that the two inputs of edges hold the same values.
+
+    The check is skipped if both inputs are connected to the same output. The
+    comparison is done by the engine of the node (`mode`), so the numpy mode
+    does not compile the numba kernel.
+    """
+    if edges.parent_output is other.parent_output:
+        return
+    i = _edges_are_close[mode](edges.data, other.data, 0.0, 0.0)
+    if i >= 0:
+        raise RuntimeError(
+            f"Edges {edges.name} and {other.name} are inconsistent: "
+            f"edge {i}, {edges.data[i]} and {other.data[i]}"
+        )
@@ -0,0 +1,195 @@
+"""Memory accounting of the outputs of the dgf_detector nodes.
+
+`memory_report` walks the nodes of nodes, MetaNodes, graphs or storages (e.g.
+the one, returned by `replicate`), see `dgf_detector.profiling`, and reports
+the bytes, allocated for each output. The outputs, which are views on the same
+buffer (e.g. the results of `RebinBatched`), are marked as shared, the buffer
+is counted once in the total.
+
+For each output the memory is estimated for the alternative representations:
+    - float32: the float64 data stored as float32
+    - banded: a 2D matrix in the banded (LAPACK) storage, `(kl+ku+1)×ncols`,
+      with the bandwidth of its nonzero elements
+    - sparse: a 2D matrix in the CSR storage with int32 indices
+The 1D outputs are not changed by the banded and sparse representations. The
+estimates depend on the content of the matrices, so the report is produced for
+the evaluated graph.
+
+Usage:
+    report = memory_report(storage)
+    print(report.format())
+    report.summary(metanode)
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from numpy import float64, ndarray, nonzero
+
+from dgf_detector.profiling import _collect_nodes
+
+if TYPE_CHECKING:
+    from dagflow.core.node import Node
+    from dagflow.core.output import Output
+    from numpy.typing import NDArray
+
+Representations = ("float32", "banded", "sparse")
+
+
+def _buffer(data: NDArray) -> NDArray:
+    while isinstance(data.base, ndarray):
+        data = data.base
+    return data
+
+
+def _estimate_float32(data: NDArray) -> int:
+    return data.nbytes // 2 if data.dtype == float64 else data.nbytes
+
+
+def _estimate_banded(data: NDArray) -> int:
+    if data.ndim != 2:
+        return data.nbytes
+    rows, columns = nonzero(data)
+    if not rows.size:
+        return 0
+    lower = max(int((rows - columns).max()), 0)
+    upper = max(int((columns - rows).max()), 0)
+    return (lower + upper + 1) * data.shape[1] * data.itemsize
+
+
+def _estimate_sparse(data: NDArray) -> int:
+    if data.ndim != 2:
+        return data.nbytes
+    nnz = int((data != 0).sum())
+    return nnz * (data.itemsize + 4) + (data.shape[0] + 1) * 4
+
+
+def _estimates(data: NDArray) -> dict[str, int]:
+    return {
+        "float32": _estimate_float32(data),
+        "banded": _estimate_banded(data),
+        "sparse": _estimate_sparse(data),
+    }
+
+
+class OutputMemory:
+    """The memory of a node output, in bytes, and the estimates for the other representations"""
+
+    __slots__ = ("node", "name", "shape", "dtype", "nbytes", "buffer", "shared", "estimates")
+
+    node: Node
+    name: str
+    shape: tuple[int, ...]
+    dtype: str
+    nbytes: int
+    buffer: int
+    shared: bool
+    estimates: dict[str, int]
+
+    def __init__(self, node: Node, output: Output, data: NDArray):
+        self.node = node
+        self.name = f"{node.name}.{output.name}"
+        self.shape = data.shape
+        self.dtype = data.dtype.str
+        self.nbytes = data.nbytes
+        self.buffer = id(_buffer(data))
+        self.shared = False
+        self.estimates = _estimates(data)
+
+    def __repr__(self) -> str:
+        return (
+            f"OutputMemory({self.name!r}, shape={self.shape}, dtype={self.dtype!r}, "
+            f"nbytes={self.nbytes}, shared={self.shared})"
+        )
+
+
+class MemoryReport:
+    """The memory of the outputs of the nodes, see `memory_report`"""
+
+    __slots__ = ("entries", "_buffers")
+
+    entries: list[OutputMemory]
+    _buffers: dict[int, NDArray]
+
+    def __init__(self):
+        self.entries = []
+        self._buffers = {}
+
+    def _add(self, node: Node, output: Output) -> None:
+        data = output._data
+        if data is None:
+            return
+        entry = OutputMemory(node, output, data)
+        for other in self.entries:
+            if other.buffer == entry.buffer:
+                other.shared = entry.shared = True
+        self._buffers[entry.buffer] = _buffer(data)
+        self.entries.append(entry)
+
+    def _select(self, obj=None) -> list[OutputMemory]:
+        if obj is None:
+            return self.entries
+        nodes = {id(node) for node in _collect_nodes(obj, all_nodes=True)}
+        return [entry for entry in self.entries if id(entry.node) in nodes]
+
+    def summary(self, obj=None) -> dict[str, int]:
+        """The bytes of the outputs of the object (of all the outputs by default)
+
+        The shared buffers are counted once. The estimates are computed for
+        the buffers, a representation is assumed to be used only for the
+        buffers it makes smaller.
+        """
+        buffers = [self._buffers[key] for key in {entry.buffer for entry in self._select(obj)}]
+        ret = {"nbytes": sum(buffer.nbytes for buffer in buffers)}
+        for representation in Representations:
+            ret[representation] = 0
+        for buffer in buffers:
+            for representation, nbytes in _estimates(buffer).items():
+                ret[representation] += min(nbytes, buffer.nbytes)
+        return ret
+
+    def format(self, obj=None, *, sort: bool = True) -> str:
+        """A table of the outputs, the largest first, and the total"""
+        entries = self._select(obj)
+        if sort:
+            entries = sorted(entries, key=lambda entry: entry.nbytes, reverse=True)
+        width = max((len(entry.name) for entry in entries), default=6)
+        header = (
+            f"{'output':{width}s} {'shape':>12s} {'dtype':>5s} {'bytes':>12s} "
+            + " ".join(f"{representation:>12s}" for representation in Representations)
+        )
+        lines = [header]
+        for entry in entries:
+            lines.append(
+                f"{entry.name:{width}s} {'x'.join(map(str, entry.shape)):>12s} "
+                f"{entry.dtype:>5s} {entry.nbytes:12d} "
+                + " ".join(
+                    f"{entry.estimates[representation]:12d}" for representation in Representations
+                )
+                + ("  shared" if entry.shared else "")
+            )
+        total = self.summary(obj)
+        lines.append(
+            f"{'total':{width}s} {'':>12s} {'':>5s} {total['nbytes']:12d} "
+            + " ".join(f"{total[representation]:12d}" for representation in Representations)
+        )
+        return "\n".join(lines)
+
+
+def memory_report(*objects, all_nodes: bool = False) -> MemoryReport:
+    """Report the memory of the outputs of the nodes of the objects
+
+    The objects are nodes, MetaNodes, graphs or storages. Only the dgf_detector
+    nodes are reported for a graph or a storage unless `all_nodes` is set.
+    """
+    report = MemoryReport()
+    visited = set()
+    for obj in objects:
+        for node in _collect_nodes(obj, all_nodes=all_nodes):
+            if id(node) in visited:
+                continue
+            visited.add(id(node))
+            for output in node.outputs.iter_all():
+                report._add(node, output)
+    return report
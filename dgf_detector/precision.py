@@ -0,0 +1,88 @@
+"""The precision policy of the matrices, computed by the detector nodes.
+
+The nodes, which compute the matrices (`RebinMatrix`, `EnergyResolutionMatrixBC`
+and the `AxisDistortionMatrix*` nodes), take the `precision` argument:
+    - "inputs": the matrix takes the dtype of the inputs (edges, sigma), the
+      computations are done in the same dtype (default)
+    - "double": the matrix is stored and computed in float64
+    - "single": the matrix is stored and computed in float32
+    - "mixed": the matrix is stored in float32, the elements are computed in
+      float64 and rounded once on store
+
+The MetaNodes `Rebin` and `EnergyResolution` pass the policy to their matrix
+nodes. The inputs of the other dtype are converted to the computation dtype
+into the buffers, allocated by the type function. The inputs are 1D, so the
+conversion is negligible compared to the computation of the matrix. The nodes,
+which transform vectors (`RebinSegmentedSum`, `RebinBatched`, `Monotonize`,
+...), keep the dtype of their inputs and follow the policy of the upstream
+nodes.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Literal
+
+from numpy import dtype as numpy_dtype
+from numpy import empty
+
+from dagflow.core.exception import InitializationError
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from numpy.typing import DTypeLike, NDArray
+
+    from dagflow.core.input import Input
+    from dagflow.core.node import Node
+
+
+Precisions = {"inputs", "double", "single", "mixed"}
+PrecisionsType = Literal["inputs", "double", "single", "mixed"]
+
+_storage_dtypes = {"double": "d", "single": "f", "mixed": "f"}
+_compute_dtypes = {"double": "d", "single": "f", "mixed": "d"}
+
+
+def check_precision(precision: str, node: Node | None = None) -> None:
+    if precision not in Precisions:
+        raise InitializationError(
+            f"precision must be in {Precisions}, but given {precision}!", node=node
+        )
+
+
+def storage_dtype(precision: str, dtype: DTypeLike) -> numpy_dtype:
+    """The dtype of the matrix for the policy and the dtype of the inputs"""
+    return numpy_dtype(_storage_dtypes.get(precision, dtype))
+
+
+def compute_dtype(precision: str, dtype: DTypeLike) -> numpy_dtype:
+    """The dtype of the computations for the policy and the dtype of the inputs"""
+    return numpy_dtype(_compute_dtypes.get(precision, dtype))
+
+
+class InputConverter:
+    """Provide the data of the inputs, converted to the computation dtype if needed"""
+
+    __slots__ = ("_buffers",)
+
+    _buffers: dict[int, NDArray]
+
+    def __init__(self):
+        self._buffers = {}
+
+    def allocate(self, inputs: Iterable[Input], dtype: DTypeLike) -> None:
+        """Allocate the buffers for the inputs of the other dtype, called by the type function"""
+        dtype = numpy_dtype(dtype)
+        self._buffers = {
+            id(input): empty(input.dd.shape, dtype=dtype)
+            for input in inputs
+            if input.dd.dtype != dtype
+        }
+
+    def __call__(self, input: Input) -> NDArray:
+        data = input.data
+        buffer = self._buffers.get(id(input))
+        if buffer is None:
+            return data
+        buffer[:] = data
+        return buffer
@@ -0,0 +1,291 @@
+"""Opt-in timing and call-count instrumentation of the dgf_detector nodes.
+
+`NodeProfiler` replaces the evaluation function (`node.function`, one of the
+`_function*` methods, chosen by the type function) of the attached nodes with
+a timing wrapper and restores it on `detach`. The nodes, which are not
+attached, are not affected: with the instrumentation off there is no overhead.
+
+For each node the profiler records the number of calls, the cumulative and the
+last wall time and the total size of the inputs. The time of a node includes
+the evaluation of the tainted upstream nodes, triggered by the node. The
+`self_time` excludes the time of the nested calls of the attached nodes.
+
+The statistics are queried per node or summed per MetaNode (e.g. `Rebin`,
+`EnergyResolution`) or storage. With `trace=True` each call is recorded and
+may be exported as a Chrome trace (JSON), readable by chrome://tracing and
+https://ui.perfetto.dev.
+
+The nodes are attached after the graph is closed: the type function chooses
+the evaluation function and would override the wrapper.
+
+Usage:
+    with NodeProfiler(graph, trace=True) as profiler:
+        for _ in range(100):
+            ...  # change the parameters, evaluate the outputs
+    print(profiler.report())
+    profiler.summary(rebin).time
+    profiler.export_trace("trace.json")
+"""
+
+from __future__ import annotations
+
+from json import dump
+from math import prod
+from os import getpid
+from threading import get_ident
+from time import perf_counter_ns
+from typing import TYPE_CHECKING
+
+from dagflow.core.graph import Graph
+from dagflow.core.meta_node import MetaNode
+from dagflow.core.node import Node
+from multikeydict.nestedmkdict import NestedMKDict
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+
+class NodeTimings:
+    """The timings of a node or the sum of the timings of several nodes (in seconds)"""
+
+    __slots__ = ("name", "calls", "time_ns", "self_time_ns", "last_ns", "input_size")
+
+    name: str
+    calls: int
+    time_ns: int
+    self_time_ns: int
+    last_ns: int
+    input_size: int
+
+    def __init__(self, name: str, input_size: int = 0):
+        self.name = name
+        self.input_size = input_size
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.time_ns = 0
+        self.self_time_ns = 0
+        self.last_ns = 0
+
+    @property
+    def time(self) -> float:
+        return self.time_ns * 1e-9
+
+    @property
+    def self_time(self) -> float:
+        return self.self_time_ns * 1e-9
+
+    @property
+    def last(self) -> float:
+        return self.last_ns * 1e-9
+
+    @property
+    def mean(self) -> float:
+        return self.time / self.calls if self.calls else 0.0
+
+    def _add(self, other: NodeTimings) -> None:
+        self.calls += other.calls
+        self.time_ns += other.time_ns
+        self.self_time_ns += other.self_time_ns
+        self.last_ns += other.last_ns
+        self.input_size += other.input_size
+
+    def __repr__(self) -> str:
+        return (
+            f"NodeTimings({self.name!r}, calls={self.calls}, time={self.time:.6g}, "
+            f"self_time={self.self_time:.6g}, last={self.last:.6g}, input_size={self.input_size})"
+        )
+
+
+def _is_detector_node(node: Node) -> bool:
+    return type(node).__module__.split(".")[0] == "dgf_detector"
+
+
+def _collect_nodes(obj, *, all_nodes: bool = False) -> list[Node]:
+    """Collect the nodes of a node, MetaNode, graph or (node) storage
+
+    All the nodes of a MetaNode are collected. Only the dgf_detector nodes are
+    collected from a graph or a storage unless `all_nodes` is set.
+    """
+    if isinstance(obj, MetaNode):
+        return list(obj._nodes)
+    if isinstance(obj, Node):
+        return [obj]
+    if isinstance(obj, Graph):
+        candidates = obj._nodes
+    elif isinstance(obj, NestedMKDict):
+        candidates = obj.walkvalues()
+    else:
+        raise TypeError(f"Expect a node, MetaNode, graph or storage, but given {type(obj)}")
+
+    nodes = []
+    for candidate in candidates:
+        if isinstance(candidate, MetaNode):
+            nodes.extend(candidate._nodes)
+        elif isinstance(candidate, Node) and (all_nodes or _is_detector_node(candidate)):
+            nodes.append(candidate)
+    return nodes
+
+
+def _input_size(node: Node) -> int:
+    size = 0
+    for input in node.inputs.iter_all():
+        shape = input.dd.shape
+        if shape is not None:
+            size += prod(shape)
+    return size
+
+
+class NodeProfiler:
+    """Record the timings of the nodes, MetaNodes, graphs or storages
+
+    See the module docstring.
+    """
+
+    __slots__ = ("_timings", "_nodes", "_functions", "_wrappers", "_stack", "_events", "_start_ns")
+
+    _timings: dict[int, NodeTimings]
+    _nodes: dict[int, Node]
+    _functions: dict[int, Callable]
+    _wrappers: dict[int, Callable]
+    _stack: list[int]
+    _events: list[tuple[NodeTimings, int, int, int]] | None
+    _start_ns: int
+
+    def __init__(self, *objects, trace: bool = False, all_nodes: bool = False):
+        self._timings = {}
+        self._nodes = {}
+        self._functions = {}
+        self._wrappers = {}
+        self._stack = []
+        self._events = [] if trace else None
+        self._start_ns = perf_counter_ns()
+        self.attach(*objects, all_nodes=all_nodes)
+
+    def __enter__(self) -> NodeProfiler:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.detach()
+
+    @property
+    def attached(self) -> bool:
+        return bool(self._wrappers)
+
+    def attach(self, *objects, all_nodes: bool = False) -> None:
+        """Instrument the nodes of the objects, the attached nodes are skipped"""
+        for obj in objects:
+            for node in _collect_nodes(obj, all_nodes=all_nodes):
+                key = id(node)
+                if key in self._wrappers:
+                    continue
+                timings = self._timings.get(key)
+                if timings is None:
+                    timings = self._timings[key] = NodeTimings(node.name, _input_size(node))
+                self._nodes[key] = node
+                self._functions[key] = node.function
+                self._wrappers[key] = node.function = self._wrap(node.function, timings)
+
+    def detach(self) -> None:
+        """Restore the evaluation functions of the nodes, the timings are kept"""
+        for key, wrapper in self._wrappers.items():
+            node = self._nodes[key]
+            # the type function might have chosen another function meanwhile
+            if node.function is wrapper:
+                node.function = self._functions[key]
+        self._wrappers.clear()
+        self._functions.clear()
+
+    def reset(self) -> None:
+        """Reset the timings and the trace"""
+        for timings in self._timings.values():
+            timings.reset()
+        if self._events is not None:
+            self._events.clear()
+        self._start_ns = perf_counter_ns()
+
+    def _wrap(self, function: Callable, timings: NodeTimings) -> Callable:
+        stack = self._stack
+        events = self._events
+
+        def wrapper(*args, **kwargs):
+            stack.append(0)
+            start = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter_ns() - start
+                nested = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                timings.calls += 1
+                timings.time_ns += elapsed
+                timings.self_time_ns += elapsed - nested
+                timings.last_ns = elapsed
+                if events is not None:
+                    events.append((timings, start, elapsed, get_ident()))
+
+        return wrapper
+
+    def timings(self, obj=None, *, all_nodes: bool = False) -> list[NodeTimings]:
+        """The timings of the attached nodes of the object (of all the attached nodes by default)"""
+        if obj is None:
+            return list(self._timings.values())
+        return [
+            self._timings[id(node)]
+            for node in _collect_nodes(obj, all_nodes=all_nodes)
+            if id(node) in self._timings
+        ]
+
+    def summary(self, obj, *, all_nodes: bool = False) -> NodeTimings:
+        """The timings, summed over the attached nodes of the object (e.g. a MetaNode)
+
+        The nested calls are counted in `time` for each level, `self_time` is
+        the time of the object without double counting.
+        """
+        total = NodeTimings(getattr(obj, "name", type(obj).__name__))
+        for timings in self.timings(obj, all_nodes=all_nodes):
+            total._add(timings)
+        return total
+
+    def report(self, obj=None, *, sort: str = "time") -> str:
+        """A table of the timings, sorted by the attribute `sort` in descending order"""
+        rows = sorted(self.timings(obj), key=lambda timings: getattr(timings, sort), reverse=True)
+        width = max((len(timings.name) for timings in rows), default=4)
+        lines = [
+            f"{'node':{width}s} {'calls':>8s} {'time, s':>10s} {'self, s':>10s} "
+            f"{'last, s':>10s} {'inputs':>10s}"
+        ]
+        lines.extend(
+            f"{timings.name:{width}s} {timings.calls:8d} {timings.time:10.4g} "
+            f"{timings.self_time:10.4g} {timings.last:10.4g} {timings.input_size:10d}"
+            for timings in rows
+        )
+        return "\n".join(lines)
+
+    def trace_events(self) -> list[dict]:
+        """The recorded calls in the Chrome trace event format"""
+        if self._events is None:
+            raise RuntimeError("The trace is not recorded, create the profiler with `trace=True`")
+        pid = getpid()
+        return [
+            {
+                "name": timings.name,
+                "cat": "dgf_detector",
+                "ph": "X",
+                "ts": (start - self._start_ns) * 1e-3,
+                "dur": elapsed * 1e-3,
+                "pid": pid,
+                "tid": tid,
+                "args": {"input_size": timings.input_size},
+            }
+            for timings, start, elapsed, tid in self._events
+        ]
+
+    def export_trace(self, path: str | Path) -> None:
+        """Write the recorded calls as a Chrome/Perfetto trace (JSON)"""
+        with open(path, "w") as f:
+            dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+
@@ -0,0 +1,235 @@
+"""Ahead-of-time compilation of the numba kernels of dgf_detector.
+
+The kernels are decorated with `njit(cache=True)` and are compiled lazily on
+the first call, separately for each set of argument types. `warmup` compiles
+the kernels eagerly for the signatures, declared in `KernelSignatures`, so a
+worker does not compile on the first evaluation of the graph.
+
+The compiled kernels are cached by numba. By default the cache is written to
+the `__pycache__` next to the sources, which is not possible for a read-only
+installation. The cache location is configured either with the environment
+variable `NUMBA_CACHE_DIR` (before numba is imported) or with `set_cache_dir`
+(at any time, the kernels, loaded before, are redirected to the new location).
+
+The prebuilt cache artifacts are produced by `warmup(cache_dir=...)` into an
+empty directory. They are installed into a writable cache directory by
+`install_cache`. The artifacts are valid only for the same installation of
+the package (the same paths and timestamps of the sources), the same version
+of numba and the same CPU, otherwise numba silently recompiles the kernels.
+
+Usage:
+    python -m dgf_detector.warmup [--cache-dir DIR] [--install ARTIFACTS] [--dtype d f]
+"""
+
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from importlib import import_module
+from inspect import signature as inspect_signature
+from os import environ
+from shutil import copytree
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+from numpy import dtype as numpy_dtype
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+    from pathlib import Path
+
+    from numba.core.dispatcher import Dispatcher
+
+# The argument types of the kernels as they are called by the nodes. `{t}` is
+# replaced by the floating point type of the data and `{s}` by the type of the
+# matrices, computed by the nodes, see `dgf_detector.precision`. The trailing
+# optional arguments, omitted by the nodes, are omitted here as well.
+_edges = "{t}[::1]"
+_matrix = "{t}[:, ::1]"
+_storage = "{s}[:, ::1]"
+_segments = "int32[::1]"
+_fractions = "float64[::1]"
+_trace = "int32[:, ::1], float64[::1]"
+
+KernelSignatures: dict[str, dict[str, tuple[str, ...]]] = {
+    "dgf_detector.AxisDistortionMatrix": {
+        "_axisdistortion_numba": (
+            f"({_edges}, {_edges}, {_edges}, {_edges}, {_storage})",
+            f"({_edges}, {_edges}, {_edges}, {_edges}, {_storage}, {_trace})",
+        ),
+        "_axisdistortion_backwards_numba": (
+            f"({_edges}, {_edges}, {_edges}, {_edges}, {_storage})",
+            f"({_edges}, {_edges}, {_edges}, {_edges}, {_storage}, {_trace})",
+        ),
+    },
+    "dgf_detector.AxisDistortionMatrixComposite": {
+        "_compose_pointwise_numba": (
+            f"({_edges}, {_edges}, {_edges}, {_edges}, {_edges}, {_edges})",
+        ),
+    },
+    "dgf_detector.AxisDistortionMatrixLinear": {
+        "_axisdistortion_linear_numba": (
+            f"({_edges}, {_edges}, {_edges}, {_storage})",
+            f"({_edges}, {_edges}, {_edges}, {_storage}, {_trace})",
+        ),
+    },
+    "dgf_detector.AxisDistortionMatrixLinearLegacy": {
+        "_axisdistortion_linear_numba": (f"({_edges}, {_edges}, {_edges}, {_matrix}, float64)",),
+    },
+    "dgf_detector.AxisDistortionMatrixPointwise": {
+        "_axisdistortion_pointwise_numba": (
+            f"({_edges}, {_edges}, {_edges}, {_edges}, {_storage})",
+            f"({_edges}, {_edges}, {_edges}, {_edges}, {_storage}, {_trace})",
+        ),
+    },
+    "dgf_detector.EnergyResolutionMatrixBC": {
+        "_resolution": (f"({_edges}, {_edges}, {_storage}, float64)",),
+    },
+    "dgf_detector.EnergyResolutionSigmaRelABC": {
+        "_rel_sigma": (f"({{t}}, {{t}}, {{t}}, {_edges}, {_edges})",),
+    },
+    "dgf_detector.Monotonize": {
+        "_monotonize_with_x": (f"({_edges}, {_edges}, {_edges}, float64, int64)",),
+        "_monotonize_without_x": (f"({_edges}, {_edges}, float64, int64)",),
+        "_monotonize_rows_with_x": (
+            f"({_edges}, {_matrix}, {_matrix}, int32[::1], float64, int64)",
+        ),
+        "_monotonize_rows_without_x": (f"({_matrix}, {_matrix}, int32[::1], float64, int64)",),
+    },
+    "dgf_detector.edges": {
+        "_edges_are_close_numba": (f"({_edges}, {_edges}, float64, float64)",),
+    },
+    "dgf_detector.RebinMatrix": {
+        "_calc_rebin_matrix_numba": (
+            f"({_edges}, {_edges}, {_storage}, float64, float64, none)",
+            f"({_edges}, {_edges}, none, float64, float64, {_segments})",
+            f"({_edges}, {_edges}, {_storage}, float64, float64, {_segments})",
+        ),
+        "_calc_rebin_fractions_numba": (
+            f"({_edges}, {_edges}, {_segments}, {_fractions}, none, float64, float64)",
+            f"({_edges}, {_edges}, {_segments}, {_fractions}, {_storage}, float64, float64)",
+        ),
+    },
+    "dgf_detector.RebinSegmentedSum": {
+        "_segmented_sum_numba": (
+            f"({_segments}, {_edges}, {_edges}, none)",
+            f"({_segments}, {_edges}, {_edges}, {_fractions})",
+        ),
+        "_segmented_sum_rows_numba": (
+            f"({_segments}, {_matrix}, {_matrix}, none)",
+            f"({_segments}, {_matrix}, {_matrix}, {_fractions})",
+        ),
+        "_segmented_sum_variances_numba": (
+            f"({_segments}, {_matrix}, {_matrix}, none)",
+            f"({_segments}, {_matrix}, {_matrix}, {_fractions})",
+        ),
+        "_block_sum_numba": (
+            f"({_segments}, {_segments}, {_matrix}, {_matrix}, none, none)",
+            f"({_segments}, {_segments}, {_matrix}, {_matrix}, {_fractions}, {_fractions})",
+            f"({_segments}, {_segments}, {_matrix}, {_matrix}, {_fractions}, none)",
+            f"({_segments}, {_segments}, {_matrix}, {_matrix}, none, {_fractions})",
+        ),
+    },
+}
+
+WarmupDtypes = ("d", "f")
+
+
+def _iterate_kernels(modules: Sequence[str] | None = None):
+    for modulename, kernels in KernelSignatures.items():
+        if modules is not None and modulename not in modules:
+            continue
+        module = import_module(modulename)
+        for kernelname, signatures in kernels.items():
+            yield f"{modulename}.{kernelname}", getattr(module, kernelname), signatures
+
+
+def _compile(kernel: Dispatcher, signature: str) -> None:
+    """Compile the kernel for the signature, the omitted arguments take the defaults"""
+    from numba.core.sigutils import normalize_signature
+    from numba.core.types import Omitted
+
+    argtypes, _ = normalize_signature(signature)
+    parameters = tuple(inspect_signature(kernel.py_func).parameters.values())
+    omitted = tuple(Omitted(parameter.default) for parameter in parameters[len(argtypes) :])
+    kernel.compile(argtypes + omitted)
+
+
+def set_cache_dir(cache_dir: str | Path | None) -> None:
+    """Set the directory for the numba cache of the kernels.
+
+    The environment variable `NUMBA_CACHE_DIR` is set as well, so the
+    subprocesses inherit the location. `None` restores the default location.
+    """
+    from numba import config
+
+    if cache_dir is None:
+        config.CACHE_DIR = ""
+        environ.pop("NUMBA_CACHE_DIR", None)
+    else:
+        config.CACHE_DIR = str(cache_dir)
+        environ["NUMBA_CACHE_DIR"] = config.CACHE_DIR
+
+    # the cache location is chosen, when the kernel is created, thus the
+    # kernels, which are already loaded, are redirected explicitly
+    for _, kernel, _ in _iterate_kernels():
+        kernel.enable_caching()
+
+
+def install_cache(artifacts: str | Path, cache_dir: str | Path) -> None:
+    """Copy the prebuilt cache artifacts into the (writable) `cache_dir` and use it"""
+    copytree(artifacts, cache_dir, dirs_exist_ok=True)
+    set_cache_dir(cache_dir)
+
+
+def warmup(
+    dtypes: Sequence[str] = WarmupDtypes,
+    *,
+    cache_dir: str | Path | None = None,
+    modules: Sequence[str] | None = None,
+) -> dict[str, float]:
+    """Compile the kernels for the declared signatures and the `dtypes`.
+
+    With both float64 and float32 in `dtypes`, the matrix kernels are compiled
+    for the "mixed" precision (float64 data, float32 matrix) as well. The
+    kernels, already cached, are loaded from the cache. Returns the time (in
+    seconds), spent for each kernel.
+    """
+    if cache_dir is not None:
+        set_cache_dir(cache_dir)
+
+    typenames = tuple(numpy_dtype(dtype).name for dtype in dtypes)
+    pairs = [(typename, typename) for typename in typenames]
+    if "float64" in typenames and "float32" in typenames:
+        pairs.append(("float64", "float32"))
+    timings = {}
+    for name, kernel, signatures in _iterate_kernels(modules):
+        start = perf_counter()
+        for signature in dict.fromkeys(
+            signature.format(t=t, s=s) for signature in signatures for t, s in pairs
+        ):
+            _compile(kernel, signature)
+        timings[name] = perf_counter() - start
+    return timings
+
+
+def main(args: Sequence[str] | None = None) -> None:
+    parser = ArgumentParser(description="Compile the numba kernels of dgf_detector")
+    parser.add_argument("--cache-dir", help="the directory for the numba cache")
+    parser.add_argument("--install", metavar="ARTIFACTS", help="install the prebuilt cache")
+    parser.add_argument("--dtype", nargs="+", default=WarmupDtypes, help="the dtypes")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print the timings")
+    opts = parser.parse_args(args)
+
+    if opts.install:
+        if not opts.cache_dir:
+            parser.error("--install requires --cache-dir")
+        install_cache(opts.install, opts.cache_dir)
+    timings = warmup(opts.dtype, cache_dir=opts.cache_dir)
+    if opts.verbose:
+        for name, time in timings.items():
+            print(f"{time:8.3f} s  {name}")
+    print(f"Warmup: {len(timings)} kernels in {sum(timings.values()):.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 from typing import Literal
 
-from numpy import allclose, array, finfo
-from pytest import mark
+from numpy import allclose, array, finfo, linspace, sort, sqrt
+from numpy.random import default_rng
+from pytest import mark, raises
 
 from dagflow.core.graph import Graph
 from dagflow.lib.common import Array
@@ -9,6 +10,7 @@ from dagflow.plot.graphviz import savegraph
 from dgf_detector.AxisDistortionMatrix import AxisDistortionMatrix
 from dgf_detector.AxisDistortionMatrixLinear import AxisDistortionMatrixLinear
 from dgf_detector.AxisDistortionMatrixPointwise import AxisDistortionMatrixPointwise
+from dgf_detector.edges import _edges_are_close
 
 
 @mark.parametrize(
@@ -120,6 +122,257 @@ def test_AxisDistortionMatrix(
     )
 
 
+@mark.parametrize("dtype", ("d", "f"))
+@mark.parametrize("scale,offset", ((1.0, 0.0), (1.1, -0.5), (0.9, 0.5), (1.3, 2.0)))
+def test_AxisDistortionMatrix_compute_backwards(dtype: str, scale: float, offset: float):
+    edges = linspace(0.0, 10.0, 11, dtype=dtype)
+    edges_modified = (scale * edges + offset).astype(dtype)
+    edges_backward = ((edges - offset) / scale).astype(dtype)
+
+    with Graph(close_on_exit=True):
+        Edges = Array("Edges", edges, mode="fill")
+        EdgesModified = Array("Edges modified", edges_modified, mode="fill")
+        EdgesBackward = Array("Edges, projected backward", edges_backward, mode="fill")
+
+        mat = AxisDistortionMatrix("LSNL matrix")
+        Edges >> mat.inputs["EdgesOriginal"]
+        Edges >> mat.inputs["EdgesTarget"]
+        EdgesModified >> mat.inputs["EdgesModified"]
+        EdgesBackward >> mat.inputs["EdgesModifiedBackwards"]
+
+        mat_internal = AxisDistortionMatrix("LSNL matrix (internal)", compute_backwards=True)
+        Edges >> mat_internal.inputs["EdgesOriginal"]
+        Edges >> mat_internal.inputs["EdgesTarget"]
+        EdgesModified >> mat_internal.inputs["EdgesModified"]
+
+    assert mat_internal.inputs.get("EdgesModifiedBackwards") is None
+
+    atol = finfo(dtype).resolution * 10
+    assert allclose(mat_internal.get_data(), mat.get_data(), atol=atol, rtol=0)
+    assert allclose(mat_internal.edges_modified_backwards, edges_backward, atol=atol, rtol=0)
+
+
+@mark.parametrize("dtype", ("d", "f"))
+@mark.parametrize("mode", ("exact", "linear", "pointwise"))
+def test_AxisDistortionMatrix_trace(dtype: str, mode: Literal["exact", "linear", "pointwise"]):
+    edges = linspace(0.0, 10.0, 11, dtype=dtype)
+    edges_modified = (1.1 * edges - 0.5).astype(dtype)
+    edges_backward = ((edges + 0.5) / 1.1).astype(dtype)
+
+    mats = []
+    with Graph(close_on_exit=True):
+        Edges = Array("Edges", edges, mode="fill")
+        EdgesModified = Array("Edges modified", edges_modified, mode="fill")
+        EdgesBackward = Array("Edges, projected backward", edges_backward, mode="fill")
+
+        for engine in ("numba", "trace"):
+            match mode:
+                case "linear":
+                    mat = AxisDistortionMatrixLinear("LSNL matrix (linear)", mode=engine)
+                    EdgesModified >> mat.inputs["EdgesModified"]
+                case "exact":
+                    mat = AxisDistortionMatrix("LSNL matrix", mode=engine)
+                    EdgesModified >> mat.inputs["EdgesModified"]
+                    EdgesBackward >> mat.inputs["EdgesModifiedBackwards"]
+                case "pointwise":
+                    mat = AxisDistortionMatrixPointwise("LSNL matrix (pointwise)", mode=engine)
+                    Edges >> mat.inputs["DistortionOriginal"]
+                    EdgesModified >> mat.inputs["DistortionTarget"]
+            Edges >> mat.inputs["EdgesOriginal"]
+            Edges >> mat.inputs["EdgesTarget"]
+            mats.append(mat)
+
+    mat_numba, mat_trace = mats
+    res = mat_trace.get_data()
+    assert (res == mat_numba.get_data()).all()
+    assert mat_numba.trace is None
+
+    steps, weights = mat_trace.trace
+    assert steps.shape == (weights.size, 4)
+    assert weights.size > 0
+    emitted = weights >= 0.0
+    atol = finfo(dtype).resolution * 10
+    assert allclose(weights[emitted].sum(), res.sum(), atol=atol, rtol=0)
+    for (_, column, row, _), weight in zip(steps[emitted], weights[emitted]):
+        assert res[row, column] >= weight - atol
+
+
+@mark.parametrize("dtype", ("d", "f"))
+@mark.parametrize("scale,offset", ((1.0, 0.0), (1.1, -0.5), (0.9, 0.5), (1.3, 2.0)))
+@mark.parametrize("mode", ("exact", "linear", "pointwise"))
+def test_AxisDistortionMatrix_numpy(
+    dtype: str, scale: float, offset: float, mode: Literal["exact", "linear", "pointwise"]
+):
+    edges = linspace(0.0, 10.0, 11, dtype=dtype)
+    edges_modified = (scale * edges + offset).astype(dtype)
+    edges_backward = ((edges - offset) / scale).astype(dtype)
+
+    mats = []
+    with Graph(close_on_exit=True):
+        Edges = Array("Edges", edges, mode="fill")
+        EdgesModified = Array("Edges modified", edges_modified, mode="fill")
+        EdgesBackward = Array("Edges, projected backward", edges_backward, mode="fill")
+
+        for engine in ("numba", "numpy"):
+            match mode:
+                case "linear":
+                    mat = AxisDistortionMatrixLinear("LSNL matrix (linear)", mode=engine)
+                    EdgesModified >> mat.inputs["EdgesModified"]
+                case "exact":
+                    mat = AxisDistortionMatrix("LSNL matrix", mode=engine)
+                    EdgesModified >> mat.inputs["EdgesModified"]
+                    EdgesBackward >> mat.inputs["EdgesModifiedBackwards"]
+                case "pointwise":
+                    mat = AxisDistortionMatrixPointwise("LSNL matrix (pointwise)", mode=engine)
+                    Edges >> mat.inputs["DistortionOriginal"]
+                    EdgesModified >> mat.inputs["DistortionTarget"]
+            Edges >> mat.inputs["EdgesOriginal"]
+            Edges >> mat.inputs["EdgesTarget"]
+            mats.append(mat)
+
+    mat_numba, mat_numpy = mats
+    atol = finfo(dtype).resolution * 10
+    assert allclose(mat_numpy.get_data(), mat_numba.get_data(), atol=atol, rtol=0)
+
+
+@mark.parametrize("mode", ("exact", "backwards", "linear", "pointwise"))
+def test_AxisDistortionMatrix_numpy_random(mode: Literal["exact", "backwards", "linear", "pointwise"]):
+    """The numpy engine reproduces the sweep for random monotonous quadratic
+    distortions. The backward projected edges are perturbed, so they are not
+    consistent with the modified edges."""
+    rng = default_rng(1)
+    for _ in range(100):
+        nbins = int(rng.integers(2, 40))
+        edges = linspace(0.0, 10.0, nbins + 1)
+        a, b, c = rng.uniform(-1.5, 1.5), rng.uniform(0.5, 1.5), rng.uniform(-0.02, 0.02)
+        edges_modified = a + b * edges + c * edges**2
+        discriminant = b**2 - 4.0 * c * (a - edges)
+        if (discriminant < 0.0).any():
+            continue
+        edges_backward = (sqrt(discriminant) - b) / (2.0 * c)
+        noise = rng.normal(0.0, rng.choice((1e-3, 1e-2, 0.1)), nbins + 1)
+        edges_backward = sort(edges_backward + noise)
+        x = sort(rng.uniform(-2.0, 12.0, int(rng.integers(3, 40))))
+
+        mats = []
+        with Graph(close_on_exit=True):
+            Edges = Array("Edges", edges, mode="fill")
+            EdgesModified = Array("Edges modified", edges_modified, mode="fill")
+            EdgesBackward = Array("Edges, projected backward", edges_backward, mode="fill")
+            X = Array("X", x, mode="fill")
+            Y = Array("Y", a + b * x + c * x**2, mode="fill")
+
+            for engine in ("numba", "numpy"):
+                match mode:
+                    case "linear":
+                        mat = AxisDistortionMatrixLinear("LSNL matrix (linear)", mode=engine)
+                        EdgesModified >> mat.inputs["EdgesModified"]
+                    case "exact":
+                        mat = AxisDistortionMatrix("LSNL matrix", mode=engine)
+                        EdgesModified >> mat.inputs["EdgesModified"]
+                        EdgesBackward >> mat.inputs["EdgesModifiedBackwards"]
+                    case "backwards":
+                        mat = AxisDistortionMatrix("LSNL matrix", mode=engine, compute_backwards=True)
+                        EdgesModified >> mat.inputs["EdgesModified"]
+                    case "pointwise":
+                        mat = AxisDistortionMatrixPointwise("LSNL matrix (pointwise)", mode=engine)
+                        X >> mat.inputs["DistortionOriginal"]
+                        Y >> mat.inputs["DistortionTarget"]
+                Edges >> mat.inputs["EdgesOriginal"]
+                Edges >> mat.inputs["EdgesTarget"]
+                mats.append(mat)
+
+        mat_numba, mat_numpy = mats
+        assert allclose(mat_numpy.get_data(), mat_numba.get_data(), atol=1e-12, rtol=0)
+
+
+@mark.parametrize("engine", ("numba", "numpy"))
+@mark.parametrize("consistent", (True, False))
+@mark.parametrize("mode", ("exact", "linear", "pointwise"))
+def test_AxisDistortionMatrix_edges_check(
+    consistent: bool, mode: Literal["exact", "linear", "pointwise"], engine: str, monkeypatch
+):
+    # the edges are compared by the engine of the node
+    other = "numpy" if engine == "numba" else "numba"
+    monkeypatch.setitem(_edges_are_close, other, None)
+
+    edges = linspace(0.0, 10.0, 11)
+    edges_target = edges.copy()
+    if not consistent:
+        edges_target[5] += 1.0e-12
+    edges_modified = 1.1 * edges - 0.5
+    edges_backward = (edges + 0.5) / 1.1
+
+    with Graph(close_on_exit=True):
+        Edges = Array("Edges", edges, mode="fill")
+        EdgesTarget = Array("Edges target", edges_target, mode="fill")
+        EdgesModified = Array("Edges modified", edges_modified, mode="fill")
+        EdgesBackward = Array("Edges, projected backward", edges_backward, mode="fill")
+
+        match mode:
+            case "linear":
+                mat = AxisDistortionMatrixLinear("LSNL matrix (linear)", mode=engine)
+                EdgesModified >> mat.inputs["EdgesModified"]
+            case "exact":
+                mat = AxisDistortionMatrix("LSNL matrix", mode=engine)
+                EdgesModified >> mat.inputs["EdgesModified"]
+                EdgesBackward >> mat.inputs["EdgesModifiedBackwards"]
+            case "pointwise":
+                mat = AxisDistortionMatrixPointwise("LSNL matrix (pointwise)", mode=engine)
+                Edges >> mat.inputs["DistortionOriginal"]
+                EdgesModified >> mat.inputs["DistortionTarget"]
+        Edges >> mat.inputs["EdgesOriginal"]
+        EdgesTarget >> mat.inputs["EdgesTarget"]
+
+    if consistent:
+        assert allclose(mat.get_data().sum(axis=0)[1:-1], 1.0, atol=finfo("d").resolution * 10, rtol=0)
+    else:
+        with raises(RuntimeError):
+            mat.get_data()
+
+
+@mark.parametrize("mode", ("exact", "linear", "pointwise"))
+def test_AxisDistortionMatrix_edges_recheck(mode: Literal["exact", "linear", "pointwise"]):
+    edges = linspace(0.0, 10.0, 11)
+    edges_modified = 1.1 * edges - 0.5
+    edges_backward = (edges + 0.5) / 1.1
+
+    with Graph(close_on_exit=True):
+        Edges = Array("Edges", edges, mode="fill")
+        EdgesTarget = Array("Edges target", edges, mode="fill")
+        EdgesModified = Array("Edges modified", edges_modified, mode="fill")
+        EdgesBackward = Array("Edges, projected backward", edges_backward, mode="fill")
+
+        match mode:
+            case "linear":
+                mat = AxisDistortionMatrixLinear("LSNL matrix (linear)")
+                EdgesModified >> mat.inputs["EdgesModified"]
+            case "exact":
+                mat = AxisDistortionMatrix("LSNL matrix")
+                EdgesModified >> mat.inputs["EdgesModified"]
+                EdgesBackward >> mat.inputs["EdgesModifiedBackwards"]
+            case "pointwise":
+                mat = AxisDistortionMatrixPointwise("LSNL matrix (pointwise)")
+                Edges >> mat.inputs["DistortionOriginal"]
+                EdgesModified >> mat.inputs["DistortionTarget"]
+        Edges >> mat.inputs["EdgesOriginal"]
+        EdgesTarget >> mat.inputs["EdgesTarget"]
+
+    mat.get_data()
+
+    # the distortion does not trigger the check
+    EdgesModified.set(1.05 * edges - 0.25)
+    EdgesBackward.set((edges + 0.25) / 1.05)
+    mat.get_data()
+
+    # the edges are checked again after they are changed
+    edges_target = edges.copy()
+    edges_target[5] += 1.0e-12
+    EdgesTarget.set(edges_target)
+    with raises(RuntimeError):
+        mat.get_data()
+
+
 # fmt: off
 test_sets = {
         "linear": {
@@ -0,0 +1,120 @@
+from numpy import allclose, concatenate, finfo, interp, linspace, sin, unique
+from numpy.typing import NDArray
+from pytest import mark
+
+from dagflow.core.graph import Graph
+from dagflow.lib.common import Array
+from dgf_detector.AxisDistortionMatrixComposite import AxisDistortionMatrixComposite
+from dgf_detector.AxisDistortionMatrixPointwise import AxisDistortionMatrixPointwise
+
+
+@mark.parametrize("scale", (0.9, 1.0, 1.1))
+@mark.parametrize("nsegments", (4, 10, 21))
+@mark.parametrize("dtype", ("d", "f"))
+def test_AxisDistortionMatrixComposite(dtype: str, nsegments: int, scale: float):
+    nbins = 10
+    edges = linspace(0, nbins, nbins + 1, dtype=dtype)
+    # first: a nonlinear curve, second: linear energy scale on a different grid
+    x_first = linspace(edges[0], edges[-1], nsegments + 1, dtype=dtype)
+    y_first = (x_first + 0.02 * x_first**2).astype(dtype)
+    x_second = linspace(-1.0, 13.0, 8, dtype=dtype)
+    y_second = (scale * x_second).astype(dtype)
+    y_composed = (scale * y_first).astype(dtype)
+
+    with Graph(close_on_exit=True):
+        Edges = Array("Edges", edges, mode="fill")
+        DistortionFirst = Array("Distortion 1", x_first, mode="fill")
+        DistortionFirstModified = Array("Distortion 1 modified", y_first, mode="fill")
+        DistortionSecond = Array("Distortion 2", x_second, mode="fill")
+        DistortionSecondModified = Array("Distortion 2 modified", y_second, mode="fill")
+        DistortionComposed = Array("Distortion composed", y_composed, mode="fill")
+
+        composite = AxisDistortionMatrixComposite("LSNL matrix (composite)", ndistortions=2)
+        Edges >> composite.inputs["EdgesOriginal"]
+        Edges >> composite.inputs["EdgesTarget"]
+        DistortionFirst >> composite.inputs["DistortionOriginal_0"]
+        DistortionFirstModified >> composite.inputs["DistortionTarget_0"]
+        DistortionSecond >> composite.inputs["DistortionOriginal_1"]
+        DistortionSecondModified >> composite.inputs["DistortionTarget_1"]
+
+        pointwise = AxisDistortionMatrixPointwise("LSNL matrix (pointwise)")
+        Edges >> pointwise.inputs["EdgesOriginal"]
+        Edges >> pointwise.inputs["EdgesTarget"]
+        DistortionFirst >> pointwise.inputs["DistortionOriginal"]
+        DistortionComposed >> pointwise.inputs["DistortionTarget"]
+
+    res = composite.get_data()
+    expected = pointwise.get_data()
+
+    atol = finfo(dtype).resolution * 10
+    assert allclose(res, expected, atol=atol, rtol=0)
+
+    x_composed, y_composed_obtained = composite.composed_distortion
+    assert (x_composed[1:] > x_composed[:-1]).all()
+    assert allclose(x_composed[[0, -1]], x_first[[0, -1]], atol=0, rtol=0)
+    assert allclose(y_composed_obtained[[0, -1]], y_composed[[0, -1]], atol=atol, rtol=0)
+
+    out_edges = composite.outputs[0].dd.axes_edges
+    assert out_edges[0] is out_edges[1]
+    assert out_edges[0] is Edges.outputs[0]
+
+
+def compose(curves: list[tuple[NDArray, NDArray]]) -> tuple[NDArray, NDArray]:
+    """Compose the piecewise linear curves on the union of their break points.
+
+    The range of each curve should cover the values of the previous ones.
+    """
+    x, y = curves[0]
+    for i, (x_next, _) in enumerate(curves[1:], 1):
+        inside = (x_next > y[0]) & (x_next < y[-1])
+        x = unique(concatenate((x, interp(x_next[inside], y, x))))
+        y = evaluate(x, curves[: i + 1])
+    return x, y
+
+
+def evaluate(x: NDArray, curves: list[tuple[NDArray, NDArray]]) -> NDArray:
+    for x_curve, y_curve in curves:
+        x = interp(x, x_curve, y_curve)
+    return x
+
+
+@mark.parametrize("ndistortions", (1, 2, 3, 4))
+def test_AxisDistortionMatrixComposite_nonlinear(ndistortions: int):
+    nbins = 20
+    edges = linspace(0.0, 10.0, nbins + 1)
+    # the nonlinear monotonous curves on different grids, each covering the range of the previous
+    curves = []
+    for i in range(ndistortions):
+        x = linspace(-2.0 * (i + 1), 10.0 + 3.0 * (i + 1), 7 + 4 * i)
+        curves.append((x, x + 0.3 * sin(x * (1.0 + 0.5 * i)) + 0.01 * x**2))
+    x_composed, y_composed = compose(curves)
+
+    with Graph(close_on_exit=True):
+        Edges = Array("Edges", edges, mode="fill")
+        composite = AxisDistortionMatrixComposite(
+            "LSNL matrix (composite)", ndistortions=ndistortions
+        )
+        Edges >> composite.inputs["EdgesOriginal"]
+        Edges >> composite.inputs["EdgesTarget"]
+        for i, (x, y) in enumerate(curves):
+            Array(f"Distortion {i}", x, mode="fill") >> composite.inputs[f"DistortionOriginal_{i}"]
+            Array(f"Distortion {i} modified", y, mode="fill") >> composite.inputs[
+                f"DistortionTarget_{i}"
+            ]
+
+        pointwise = AxisDistortionMatrixPointwise("LSNL matrix (pointwise)")
+        Edges >> pointwise.inputs["EdgesOriginal"]
+        Edges >> pointwise.inputs["EdgesTarget"]
+        Array("Distortion composed", x_composed, mode="fill") >> pointwise.inputs[
+            "DistortionOriginal"
+        ]
+        Array("Distortion composed modified", y_composed, mode="fill") >> pointwise.inputs[
+            "DistortionTarget"
+        ]
+
+    res = composite.get_data()
+    assert res.any()
+    assert allclose(res, pointwise.get_data(), atol=1e-13, rtol=0)
+
+    x_obtained, y_obtained = composite.composed_distortion
+    assert allclose(evaluate(x_obtained, curves), y_obtained, atol=1e-12, rtol=0)
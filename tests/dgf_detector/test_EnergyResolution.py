@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 
 from matplotlib import pyplot as plt
-from numpy import allclose, arange, digitize, fabs, finfo, geomspace, ndarray, zeros
+from numpy import allclose, arange, digitize, empty, fabs, finfo, geomspace, ndarray, sort, zeros
+from numpy.random import default_rng
 from pytest import mark
 
 from dagflow.core.graph import Graph
@@ -9,10 +10,12 @@ from dagflow.lib.common import Array
 from dagflow.plot.graphviz import savegraph
 
 from dgf_detector.EnergyResolution import EnergyResolution
+from dgf_detector.EnergyResolutionMatrixBC import _resolution, _resolution_numpy
 
 parnames = ("a_nonuniform", "b_stat", "c_noise")
 
 
+@mark.parametrize("mode", ["numba", "numpy"])
 @mark.parametrize("input_binning", ["equal", "variable"])
 @mark.parametrize(
     "Energy_set",
@@ -22,7 +25,7 @@ parnames = ("a_nonuniform", "b_stat", "c_noise")
         [[6.025, 7.025, 8.025, 8.825]],
     ],
 )
-def test_EnergyResolutionMatrixBC_v01(input_binning, debug_graph, Energy_set, testname):
+def test_EnergyResolutionMatrixBC_v01(input_binning, mode, debug_graph, Energy_set, testname):
     def singularities(values, Edges):
         indices = digitize(values, Edges) - 1
         phist = zeros(Edges.size - 1)
@@ -50,7 +53,7 @@ def test_EnergyResolutionMatrixBC_v01(input_binning, debug_graph, Energy_set, te
         for i, energies in enumerate(Energy_set):
             phist_in = singularities(energies, Edges_in)
             Array(f"Energy_{i}", phist_in, edges=[edges.outputs["array"]], mode="fill")
-            eres = EnergyResolution()
+            eres = EnergyResolution(mode=mode)
             for name, inp in zip(parnames, (a, b, c)):
                 inp >> eres.inputs[name]
             edges >> eres.inputs["Edges"]
@@ -77,6 +80,49 @@ def test_EnergyResolutionMatrixBC_v01(input_binning, debug_graph, Energy_set, te
         plt.close()
 
 
+@mark.parametrize("mode", ["numba", "numpy"])
+@mark.parametrize("precision", ["single", "mixed"])
+def test_EnergyResolutionMatrixBC_precision(mode, precision):
+    Edges_in = geomspace(1.0, 12.0, 200)
+    with Graph(close_on_exit=True):
+        edges = Array("Edges", Edges_in, mode="fill")
+        a, b, c = tuple(
+            Array(name, [val], mark=name) for name, val in zip(parnames, (0.016, 0.081, 0.026))
+        )
+        ereses = []
+        for eres_precision in ("double", precision):
+            eres = EnergyResolution(mode=mode, precision=eres_precision)
+            for name, inp in zip(parnames, (a, b, c)):
+                inp >> eres.inputs[name]
+            edges >> eres.inputs["Edges"]
+            edges >> eres.inputs["EdgesOut"]
+            ereses.append(eres)
+
+    mat_double, mat = (eres.outputs["SmearMatrix"].data for eres in ereses)
+    assert mat_double.dtype == "d"
+    assert mat.dtype == "f"
+    # the mixed precision only rounds the elements, computed in float64
+    factor = 1.0 if precision == "mixed" else 100.0
+    assert fabs(mat - mat_double).max() <= factor * finfo("f").eps * mat_double.max()
+
+
+@mark.parametrize("seed", (1, 2, 3))
+@mark.parametrize("min_events", (1e-10, 1e-4))
+def test_EnergyResolutionMatrixBC_numpy_irregular(seed: int, min_events: float):
+    # the random irregular binning: wide bins far from the peak may be above the threshold
+    edges = sort(default_rng(seed).uniform(0.5, 12.0, 401))
+    centers = (edges[1:] + edges[:-1]) * 0.5
+    rel_sigma = (0.016**2 + 0.081**2 / centers + (0.026 / centers) ** 2) ** 0.5
+
+    mat_numba = empty((centers.size, centers.size))
+    mat_numpy = empty((centers.size, centers.size))
+    _resolution(rel_sigma, edges, mat_numba, min_events)
+    _resolution_numpy(rel_sigma, edges, mat_numpy, min_events)
+
+    assert ((mat_numba != 0) == (mat_numpy != 0)).all()
+    assert allclose(mat_numpy, mat_numba, atol=1e-14 * mat_numba.max(), rtol=0)
+
+
 def check_smearing_projection(mat: ndarray, *, check_assert: bool = True) -> None:
     threshold = 1.0e-8
     ones = mat.sum(axis=0)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 from numpy import allclose, finfo, linspace
+from pytest import mark
 
 from dagflow.core.graph import Graph
 from dagflow.lib.common import Array
@@ -10,7 +11,8 @@ from dagflow.plot.plot import plot_auto
 from dgf_detector.EnergyResolutionSigmaRelABC import EnergyResolutionSigmaRelABC
 
 
-def test_EnergyResolutionSigmaRelABC_v01(debug_graph, testname):
+@mark.parametrize("mode", ["numba", "numpy"])
+def test_EnergyResolutionSigmaRelABC_v01(mode, debug_graph, testname):
     weights = [0.016, 0.081, 0.026]
     Energy = linspace(1.0, 8.0, 200)
     parnames = ("a_nonuniform", "b_stat", "c_noise")
@@ -19,7 +21,7 @@ def test_EnergyResolutionSigmaRelABC_v01(debug_graph, testname):
             Array(name, [val], mark=name) for name, val in zip(parnames, weights)
         )
         energy = Array("E", Energy, mark="Energy")
-        sigma = EnergyResolutionSigmaRelABC("EnergyResolutionSigmaRelABC")
+        sigma = EnergyResolutionSigmaRelABC("EnergyResolutionSigmaRelABC", mode=mode)
         # binding
         for name, inp in zip(parnames, (a, b, c)):
             inp >> sigma(name)
@@ -4,7 +4,7 @@
 from typing import Literal
 
 from matplotlib import pyplot as plt
-from numpy import allclose, fabs, finfo, linspace, log
+from numpy import allclose, fabs, finfo, linspace, log, sin, vstack
 from pytest import mark
 
 from dagflow.core.graph import Graph
@@ -13,6 +13,7 @@ from dagflow.plot.graphviz import savegraph
 from dgf_detector.Monotonize import Monotonize
 
 
+@mark.parametrize("mode", ["numba", "numpy"])
 @mark.parametrize("direction", [+1, -1])
 @mark.parametrize("gradient", [0, 0.5])
 @mark.parametrize("start", [0, 0.5])
@@ -22,6 +23,7 @@ def test_monotonize(
     gradient: float | int,
     start: float | int,
     positive: bool,
+    mode: str,
     debug_graph,
     testname,
 ):
@@ -46,11 +48,11 @@ def test_monotonize(
     with Graph(close_on_exit=True, debug=debug_graph) as graph:
         X = Array("x", x, mode="fill")
         Y = Array("y", y, mode="fill")
-        m = Monotonize(name="monotonize", index_fraction=frac, gradient=gradient)
+        m = Monotonize(name="monotonize", index_fraction=frac, gradient=gradient, mode=mode)
         X >> m("x")
         Y >> m("y")
         # Using monotonize node again does not change data
-        m2 = Monotonize(name="monotonize", index_fraction=frac, gradient=gradient)
+        m2 = Monotonize(name="monotonize", index_fraction=frac, gradient=gradient, mode=mode)
         X >> m2("x")
         m.outputs["result"] >> m2("y")
 
@@ -84,3 +86,42 @@ def test_monotonize(
     plt.close()
 
     savegraph(graph, f"output/{testname}.png")
+
+
+@mark.parametrize("mode", ["numba", "numpy"])
+@mark.parametrize("with_x", [False, True])
+@mark.parametrize("gradient", [0, 0.5])
+def test_monotonize_2d(with_x: bool, gradient: float, mode: str):
+    x = linspace(0.0, 10, 101)[1:]
+    y = log(x)
+    rows = vstack((y, -y, y + 0.1 * sin(5 * x), (x - 5.0) ** 2))
+    frac = 0.5
+
+    with Graph(close_on_exit=True):
+        X = Array("x", x, mode="fill")
+        Y = Array("y", rows, mode="fill")
+        m = Monotonize(
+            name="monotonize", with_x=with_x, index_fraction=frac, gradient=gradient, mode=mode
+        )
+        if with_x:
+            X >> m("x")
+        Y >> m("y")
+        ms = []
+        for i, row in enumerate(rows):
+            Yi = Array(f"y_{i}", row, mode="fill")
+            mi = Monotonize(name=f"monotonize_{i}", with_x=with_x, index_fraction=frac, gradient=gradient)
+            if with_x:
+                X >> mi("x")
+            Yi >> mi("y")
+            ms.append(mi)
+
+    result = m.outputs["result"].data
+    nmodified = m.outputs["nmodified"].data
+    assert result.shape == rows.shape
+    for i, mi in enumerate(ms):
+        assert (result[i] == mi.outputs["result"].data).all()
+        assert nmodified[i] == mi.outputs["nmodified"].data[0]
+    # already monotonous rows are not modified
+    assert (nmodified[:2] == 0).all()
+    assert (result[:2] == rows[:2]).all()
+    assert (nmodified[2:] > 0).all()
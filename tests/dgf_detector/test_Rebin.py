@@ -1,5 +1,5 @@
 from matplotlib import pyplot as plt
-from numpy import allclose, finfo, linspace, matmul
+from numpy import allclose, array, diag, finfo, linspace, matmul, outer, stack, zeros
 from numpy.typing import NDArray
 from pytest import mark, raises
 
@@ -8,7 +8,9 @@ from dagflow.lib.common import Array
 from dagflow.plot.graphviz import savegraph
 from dagflow.plot.plot import closefig, plot_array_1d_hist, savefig
 
+from dgf_detector.edges import _edges_are_close
 from dgf_detector.Rebin import Rebin
+from dgf_detector.RebinBatched import RebinBatched
 from dgf_detector.RebinMatrix import RebinMatrix
 
 
@@ -24,7 +26,7 @@ def partial_sum(y_old: NDArray, stride: int) -> list:
 @mark.parametrize("dtype", ("d", "f"))
 @mark.parametrize("start", (0, 1))
 @mark.parametrize("stride", (2, 4))
-@mark.parametrize("mode", ("python", "numba"))
+@mark.parametrize("mode", ("python", "numba", "numpy"))
 @mark.parametrize("nclones", (0, 2))
 def test_Rebin(testname: str, start: int, stride: int, dtype: str, mode: str, nclones: int):
     n = 21
@@ -100,6 +102,231 @@ def test_Rebin(testname: str, start: int, stride: int, dtype: str, mode: str, nc
     savegraph(graph, f"output/{testname}-graph.png")
 
 
+@mark.parametrize("dtype", ("d", "f"))
+@mark.parametrize("start", (0, 1))
+@mark.parametrize("stride", (2, 3))
+@mark.parametrize("mode", ("python", "numba", "numpy"))
+@mark.parametrize("with_matrix", (False, True))
+def test_Rebin_segments(start: int, stride: int, dtype: str, mode: str, with_matrix: bool):
+    n = 21
+    edges_old = linspace(0.0, 2.0, n, dtype=dtype)
+    edges_new = edges_old[start::stride]
+    y_old_list = [linspace(3.0, 0.0, n - 1, dtype=dtype), linspace(2.0, 0.0, n - 1, dtype=dtype)]
+
+    atol = finfo(dtype).resolution * 10
+    with Graph(close_on_exit=True):
+        EdgesOld = Array("edges_old", edges_old, mode="fill")
+        EdgesNew = Array("edges_new", edges_new, mode="fill")
+        Y = Array("Y", y_old_list[0], mode="fill")
+        Y2 = Array("Y2", y_old_list[1], mode="fill")
+        metanode = Rebin(mode=mode, method="segments", with_matrix=with_matrix, atol=atol)
+
+        EdgesOld >> metanode.inputs["edges_old"]
+        EdgesNew >> metanode.inputs["edges_new"]
+
+        Y >> metanode()
+        Y2 >> metanode()
+
+    segments = metanode.outputs["segments"].data
+    assert segments[0] == start
+    assert (segments[1:] - segments[:-1] == stride).all()
+    if with_matrix:
+        mat = metanode.outputs["matrix"].data
+    else:
+        assert metanode.outputs.get("matrix") is None
+
+    for i, y_old in enumerate(y_old_list):
+        y_new = metanode.outputs[i].data
+        assert y_new.dtype == y_old.dtype
+        y_check = partial_sum(y_old[start:], stride)
+        assert allclose(y_check[: len(y_new)], y_new, atol=atol, rtol=0)
+        if with_matrix:
+            assert allclose(matmul(mat, y_old), y_new, atol=atol, rtol=0)
+
+
+@mark.parametrize("dtype", ("d", "f"))
+@mark.parametrize("method", ("matrix", "segments"))
+@mark.parametrize("mode", ("python", "numba", "numpy"))
+def test_RebinBatched(dtype: str, method: str, mode: str):
+    n, stride, nvectors = 21, 4, 5
+    edges_old = linspace(0.0, 2.0, n, dtype=dtype)
+    edges_new = edges_old[::stride]
+    y_old_list = [linspace(3.0 + i, 0.0, n - 1, dtype=dtype) for i in range(nvectors)]
+
+    atol = finfo(dtype).resolution * 10
+    with Graph(close_on_exit=True):
+        EdgesOld = Array("edges_old", edges_old, mode="fill")
+        EdgesNew = Array("edges_new", edges_new, mode="fill")
+        mat = RebinMatrix("Rebin Matrix", mode=mode, atol=atol, with_segments=True)
+        batch = RebinBatched("Rebin batch", nvectors=nvectors, method=method, mode=mode)
+        EdgesOld >> mat("edges_old")
+        EdgesNew >> mat("edges_new")
+        mat.outputs[method] >> batch.inputs[method]
+        for i, y_old in enumerate(y_old_list):
+            Array(f"Y{i}", y_old, mode="fill") >> batch.inputs[f"vector_{i}"]
+
+    for i, y_old in enumerate(y_old_list):
+        y_new = batch.outputs[f"result_{i}"].data
+        assert y_new.dtype == y_old.dtype
+        assert allclose(partial_sum(y_old, stride), y_new, atol=atol * 10, rtol=0)
+        assert y_new.base is batch.outputs["result_0"].data.base
+
+
+@mark.parametrize("method", ("matrix", "segments"))
+def test_Rebin_replicate_batched(method: str):
+    n, stride = 21, 4
+    edges_old = linspace(0.0, 2.0, n)
+    keys = (("A", "x"), ("A", "y"), ("B", "x"))
+    y_old = {key: linspace(3.0 + i, 0.0, n - 1) for i, key in enumerate(keys)}
+
+    def build(batched: bool, method: str):
+        with Graph(close_on_exit=True):
+            _, storage = Rebin.replicate(
+                path="detector.rebin",
+                replicate_outputs=keys,
+                method=method,
+                batched=batched,
+            )
+            inputs = storage["inputs", "detector", "rebin"]
+            Array("edges_old", edges_old, mode="fill") >> inputs["rebin_matrix", "edges_old"]
+            Array("edges_new", edges_old[::stride], mode="fill") >> inputs[
+                "rebin_matrix", "edges_new"
+            ]
+            vectors = {}
+            for key in keys:
+                vectors[key] = Array(".".join(key), y_old[key], mode="fill")
+                vectors[key] >> inputs[("vector_matrix_product",) + key]
+        outputs = storage["outputs", "detector", "rebin", "vector_matrix_product"]
+        return vectors, {key: outputs[key] for key in keys}
+
+    vectors, results = build(True, method)
+    _, checks = build(False, "matrix")
+    for key in keys:
+        assert allclose(results[key].data, checks[key].data, atol=1e-14, rtol=0)
+
+    # the change of a vector updates only its result
+    before = {key: results[key].data.copy() for key in keys}
+    changed = keys[1]
+    vectors[changed].outputs["array"].set(2.0 * y_old[changed])
+    for key in keys:
+        data = results[key].data
+        if key == changed:
+            assert allclose(data, 2.0 * before[key], atol=1e-14, rtol=0)
+        else:
+            assert allclose(data, before[key], atol=0, rtol=0)
+
+
+def overlap_matrix(edges_old: NDArray, edges_new: NDArray) -> NDArray:
+    mat = zeros((edges_new.size - 1, edges_old.size - 1))
+    for inew in range(edges_new.size - 1):
+        for iold in range(edges_old.size - 1):
+            left = max(edges_new[inew], edges_old[iold])
+            right = min(edges_new[inew + 1], edges_old[iold + 1])
+            if right > left:
+                mat[inew, iold] = (right - left) / (edges_old[iold + 1] - edges_old[iold])
+    return mat
+
+
+@mark.parametrize(
+    "edges_new",
+    (
+        linspace(0.0, 2.0, 8),
+        linspace(0.15, 1.73, 5),
+        linspace(0.0, 2.0, 41),
+        array([0.2, 0.25, 1.0, 1.01]),
+    ),
+)
+@mark.parametrize("method", ("matrix", "segments"))
+@mark.parametrize("mode", ("python", "numba", "numpy"))
+def test_Rebin_fractional(edges_new: NDArray, method: str, mode: str):
+    edges_old = linspace(0.0, 2.0, 21)
+    y_old = linspace(3.0, 0.0, edges_old.size - 1)
+    with Graph(close_on_exit=True):
+        EdgesOld = Array("edges_old", edges_old, mode="fill")
+        EdgesNew = Array("edges_new", edges_new, mode="fill")
+        Y = Array("Y", y_old, mode="fill")
+        metanode = Rebin(mode=mode, method=method, fractional=True, with_matrix=True)
+
+        EdgesOld >> metanode.inputs["edges_old"]
+        EdgesNew >> metanode.inputs["edges_new"]
+        Y >> metanode()
+
+    mat_check = overlap_matrix(edges_old, edges_new)
+    assert allclose(metanode.outputs["matrix"].data, mat_check, atol=1e-14, rtol=0)
+    assert allclose(metanode.outputs[0].data, matmul(mat_check, y_old), atol=1e-14, rtol=0)
+
+
+@mark.parametrize("dtype", ("d", "f"))
+@mark.parametrize("precision", ("inputs", "double", "single", "mixed"))
+@mark.parametrize("mode", ("python", "numba", "numpy"))
+def test_RebinMatrix_precision(dtype: str, precision: str, mode: str):
+    edges_old = linspace(0.0, 2.0, 21, dtype=dtype)
+    edges_new = linspace(0.15, 1.73, 5, dtype=dtype)
+    with Graph(close_on_exit=True):
+        EdgesOld = Array("edges_old", edges_old, mode="fill")
+        EdgesNew = Array("edges_new", edges_new, mode="fill")
+        mat = RebinMatrix("Rebin Matrix", mode=mode, precision=precision, fractional=True)
+        EdgesOld >> mat("edges_old")
+        EdgesNew >> mat("edges_new")
+
+    matrix = mat.outputs["matrix"].data
+    dtype_expected = {"inputs": dtype, "double": "d"}.get(precision, "f")
+    assert matrix.dtype == dtype_expected
+    assert mat.outputs["fractions"].data.dtype == "d"
+    atol = finfo(dtype_expected).resolution * 10
+    mat_check = overlap_matrix(edges_old.astype("d"), edges_new.astype("d"))
+    assert allclose(matrix, mat_check, atol=atol, rtol=0)
+
+
+@mark.parametrize("edges_new", (linspace(0.0, 2.0, 6), linspace(0.15, 1.73, 5)))
+@mark.parametrize("axis", (None, 0, 1))
+@mark.parametrize("mode", ("python", "numba", "numpy"))
+def test_Rebin_2d(edges_new: NDArray, axis: int | None, mode: str):
+    edges_old = linspace(0.0, 2.0, 21)
+    y_old = linspace(3.0, 0.0, edges_old.size - 1)
+    covariance = outer(y_old, y_old) + diag(y_old)
+    with Graph(close_on_exit=True):
+        EdgesOld = Array("edges_old", edges_old, mode="fill")
+        EdgesNew = Array("edges_new", edges_new, mode="fill")
+        V = Array("V", covariance, mode="fill")
+        metanode = Rebin(mode=mode, method="segments", fractional=True, axis=axis)
+
+        EdgesOld >> metanode.inputs["edges_old"]
+        EdgesNew >> metanode.inputs["edges_new"]
+        V >> metanode()
+
+    mat = overlap_matrix(edges_old, edges_new)
+    if axis is None:
+        check = mat @ covariance @ mat.T
+    elif axis == 0:
+        check = mat @ covariance
+    else:
+        check = covariance @ mat.T
+    assert allclose(metanode.outputs[0].data, check, atol=1e-13, rtol=0)
+
+
+@mark.parametrize("edges_new", (linspace(0.0, 2.0, 6), linspace(0.15, 1.73, 5)))
+@mark.parametrize("mode", ("python", "numba", "numpy"))
+def test_Rebin_variances(edges_new: NDArray, mode: str):
+    edges_old = linspace(0.0, 2.0, 21)
+    y_old = linspace(3.0, 1.0, edges_old.size - 1)
+    stacked = stack((y_old, 0.1 * y_old))
+    with Graph(close_on_exit=True):
+        EdgesOld = Array("edges_old", edges_old, mode="fill")
+        EdgesNew = Array("edges_new", edges_new, mode="fill")
+        Y = Array("Y", stacked, mode="fill")
+        metanode = Rebin(mode=mode, method="segments", fractional=True, variances=True)
+
+        EdgesOld >> metanode.inputs["edges_old"]
+        EdgesNew >> metanode.inputs["edges_new"]
+        Y >> metanode()
+
+    mat = overlap_matrix(edges_old, edges_new)
+    values, variances = metanode.outputs[0].data
+    assert allclose(values, mat @ stacked[0], atol=1e-14, rtol=0)
+    assert allclose(variances, (mat**2) @ stacked[1], atol=1e-14, rtol=0)
+
+
 @mark.parametrize(
     "edges_new",
     (
@@ -109,7 +336,7 @@ def test_Rebin(testname: str, start: int, stride: int, dtype: str, mode: str, nc
         linspace(0.0, 2.0, 10),
     ),
 )
-@mark.parametrize("mode", ("python", "numba"))
+@mark.parametrize("mode", ("python", "numba", "numpy"))
 def test_RebinMatrix_wrong_edges_new(edges_new, mode):
     edges_old = linspace(0.0, 2.0, 21)
     with Graph(close_on_exit=True):
@@ -122,7 +349,53 @@ def test_RebinMatrix_wrong_edges_new(edges_new, mode):
         mat.get_data()
 
 
-@mark.parametrize("mode", ("python", "numba"))
+@mark.parametrize("fractional", (False, True))
+@mark.parametrize("mode", ("python", "numba", "numpy"))
+def test_RebinMatrix_clones_checked(mode: str, fractional: bool, monkeypatch):
+    edges_are_close = _edges_are_close[mode]
+    calls = []
+
+    def edges_are_close_counted(*args):
+        calls.append(args)
+        return edges_are_close(*args)
+
+    monkeypatch.setitem(_edges_are_close, mode, edges_are_close_counted)
+
+    edges_old = linspace(0.0, 2.0, 21)
+    with Graph(close_on_exit=True):
+        EdgesOld = Array("edges_old", edges_old, mode="fill")
+        EdgesNew = Array("edges_new", edges_old[::2], mode="fill")
+        EdgesClone = Array("edges_clone", edges_old, mode="fill")
+        mat = RebinMatrix("Rebin Matrix", mode=mode, fractional=fractional)
+        EdgesOld >> mat("edges_old")
+        EdgesNew >> mat("edges_new")
+        EdgesClone >> mat
+
+    mat.get_data()
+    assert len(calls) == 1
+
+    # the change of the new edges does not affect the clones: the check is skipped
+    EdgesNew.outputs["array"].set(edges_old[:11])
+    assert allclose(mat.get_data()[:, :10], diag(zeros(10) + 1.0), atol=0, rtol=0)
+    assert len(calls) == 1
+
+    # the clones are checked again after the clone or the old edges are changed
+    EdgesClone.outputs["array"].set(edges_old)
+    mat.get_data()
+    assert len(calls) == 2
+
+    EdgesOld.outputs["array"].set(edges_old)
+    mat.get_data()
+    assert len(calls) == 3
+
+    edges_clone = edges_old.copy()
+    edges_clone[3] += 0.01
+    EdgesClone.outputs["array"].set(edges_clone)
+    with raises(RuntimeError):
+        mat.get_data()
+
+
+@mark.parametrize("mode", ("python", "numba", "numpy"))
 def test_RebinMatrix_wrong_edges_new(mode):
     edges_old = linspace(0.0, 2.0, 21)
     edges_new = edges_old[0::2]
@@ -0,0 +1,133 @@
+from numpy import allclose, exp, float32, linspace
+from pytest import mark
+
+from dagflow.core.graph import Graph
+from dagflow.lib.common import Array
+
+from dgf_detector.AxisDistortionMatrixPointwise import AxisDistortionMatrixPointwise
+from dgf_detector.bundles.refine_lsnl_data import RefineGraph
+from dgf_detector.RefineCurve import RefineCurve
+
+
+@mark.parametrize("refine_times", (1, 4))
+@mark.parametrize("savgol_filter_smoothen", (None, (5, 2)))
+def test_RefineCurve(refine_times: int, savgol_filter_smoothen: tuple[int, int] | None):
+    x = linspace(0.5, 12.0, 60)
+    nominal = 1.0 + 0.05 * exp(-x / 3.0)
+    curves = [nominal + 0.01 * i * exp(-x / 5.0) for i in range(1, 4)]
+    settings = dict(
+        refine_times=refine_times,
+        newmin=0.0,
+        newmax=13.0,
+        savgol_filter_smoothen=savgol_filter_smoothen,
+    )
+
+    with Graph(close_on_exit=True):
+        X = Array("x", x, mode="store")
+        Nominal = Array("nominal", nominal, mode="fill")
+        refine = RefineCurve("refine", **settings)
+        X >> refine.inputs["x"]
+        Nominal >> refine.inputs["nominal"]
+        for i, curve in enumerate(curves):
+            Array(f"curve_{i}", curve, mode="fill") >> refine()
+
+    refiner = RefineGraph(x, **settings)
+    nominal_fine = refiner.process(nominal, nominal)
+    assert allclose(refine.outputs["xfine"].data, refiner.xfine_extended, atol=0, rtol=0)
+    assert allclose(refine.outputs["nominal"].data, nominal_fine, atol=1e-13, rtol=0)
+    for i, curve in enumerate(curves):
+        check = refiner.process(curve, nominal_fine)
+        assert allclose(refine.outputs[i].data, check, atol=1e-13, rtol=0)
+
+
+def test_RefineCurve_x_changed():
+    x = linspace(0.5, 12.0, 60)
+    nominal = 1.0 + 0.05 * exp(-x / 3.0)
+    curve = nominal + 0.01 * exp(-x / 5.0)
+    settings = dict(refine_times=4, newmin=0.0, newmax=13.0)
+
+    with Graph(close_on_exit=True):
+        X = Array("x", x, mode="store")
+        Nominal = Array("nominal", nominal, mode="fill")
+        refine = RefineCurve("refine", **settings)
+        X >> refine.inputs["x"]
+        Nominal >> refine.inputs["nominal"]
+        Array("curve", curve, mode="fill") >> refine()
+
+    # the operators are built on evaluation
+    assert refine.refiner is None
+    refine.outputs[0].data
+    refiner = refine.refiner
+    assert refiner is not None
+
+    # the same values of x: the operators are kept
+    X.outputs["array"].set(x.copy())
+    refine.outputs[0].data
+    assert refine.refiner is refiner
+
+    # the other values of x: the operators are rebuilt
+    x2 = x + 1.0e-3
+    X.outputs["array"].set(x2)
+    result = refine.outputs[0].data
+    assert refine.refiner is not refiner
+
+    check = RefineGraph(x2, **settings)
+    assert allclose(refine.outputs["xfine"].data, check.xfine_extended, atol=0, rtol=0)
+    nominal_fine = check.process(nominal, nominal)
+    assert allclose(result, check.process(curve, nominal_fine), atol=1e-13, rtol=0)
+
+
+def test_RefineCurve_taint():
+    x = linspace(0.5, 12.0, 60)
+    edges = linspace(0.0, 12.0, 121)
+    settings = dict(refine_times=4, newmin=0.0, newmax=13.0)
+
+    def build(nominal):
+        with Graph(close_on_exit=True):
+            X = Array("x", x, mode="store")
+            Nominal = Array("nominal", nominal, mode="fill")
+            Edges = Array("edges", edges, mode="fill")
+            refine = RefineCurve("refine", **settings)
+            X >> refine.inputs["x"]
+            Nominal >> refine.inputs["nominal"]
+            lsnl = AxisDistortionMatrixPointwise("lsnl")
+            Edges >> lsnl.inputs["EdgesOriginal"]
+            Edges >> lsnl.inputs["EdgesTarget"]
+            refine.outputs["xfine"] >> lsnl.inputs["DistortionOriginal"]
+            refine.outputs["nominal"] >> lsnl.inputs["DistortionTarget"]
+        return Nominal, lsnl
+
+    nominal = 1.0 - 0.05 * exp(-x / 3.0)
+    nominal2 = 1.0 - 0.07 * exp(-x / 3.0)
+    Nominal, lsnl = build(nominal)
+    matrix = lsnl.get_data().copy()
+
+    # the children of the keyword outputs are tainted
+    Nominal.outputs["array"].set(nominal2)
+    assert lsnl.tainted
+    matrix2 = lsnl.get_data()
+    assert not allclose(matrix2, matrix, atol=1e-6, rtol=0)
+    assert allclose(matrix2, build(nominal2)[1].get_data(), atol=0, rtol=0)
+
+
+def test_RefineCurve_dtype():
+    x = linspace(0.5, 12.0, 60, dtype="f")
+    nominal = (1.0 + 0.05 * exp(-x / 3.0)).astype("f")
+    curve = (nominal + 0.01 * exp(-x / 5.0)).astype("f")
+    settings = dict(refine_times=4, newmin=0.0, newmax=13.0)
+
+    with Graph(close_on_exit=True):
+        X = Array("x", x, mode="store")
+        Nominal = Array("nominal", nominal, mode="fill")
+        refine = RefineCurve("refine", **settings)
+        X >> refine.inputs["x"]
+        Nominal >> refine.inputs["nominal"]
+        Array("curve", curve, mode="fill") >> refine()
+
+    for output in refine.outputs.iter_all():
+        assert output.data.dtype == float32
+
+    refiner = RefineGraph(x.astype("d"), **settings)
+    nominal_d = nominal.astype("d")
+    check = refiner.process(curve.astype("d"), refiner.process(nominal_d, nominal_d))
+    assert allclose(refine.outputs[0].data, check, atol=1e-6, rtol=0)
@@ -0,0 +1,34 @@
+from os import environ, pathsep
+from os.path import dirname
+from subprocess import run
+from sys import executable
+
+from pytest import mark
+
+import dgf_detector
+
+_script = """
+import sys
+import dgf_detector
+import dgf_detector.bundles.refine_lsnl_data
+loaded = {{name.split(".")[0] for name in sys.modules}}
+assert not loaded & {{"numba", "scipy"}}, loaded
+assert not [name for name in sys.modules if name.startswith("dgf_detector.") and "bundles" not in name]
+assert dgf_detector.{name}.__name__ == "{name}"
+assert "numba" in sys.modules
+"""
+
+
+@mark.parametrize("name", ("RebinMatrix", "EnergyResolution"))
+def test_import_lazy(name: str):
+    root = dirname(dirname(dgf_detector.__file__))
+    env = dict(environ, PYTHONPATH=pathsep.join((root, environ.get("PYTHONPATH", ""))))
+    run((executable, "-c", _script.format(name=name)), env=env, check=True)
+
+
+def test_import_attributes():
+    from dgf_detector import RebinMatrix
+    from dgf_detector.RebinMatrix import RebinMatrix as RebinMatrixNode
+
+    assert RebinMatrix is RebinMatrixNode
+    assert set(dgf_detector.__all__) <= set(dir(dgf_detector))
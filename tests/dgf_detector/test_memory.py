@@ -0,0 +1,41 @@
+from numpy import linspace
+
+from dagflow.core.graph import Graph
+from dagflow.lib.common import Array
+
+from dgf_detector.memory import memory_report
+from dgf_detector.RebinBatched import RebinBatched
+from dgf_detector.RebinMatrix import RebinMatrix
+
+
+def test_memory_report():
+    n, nvectors = 21, 3
+    edges_old = linspace(0.0, 2.0, n)
+    with Graph(close_on_exit=True) as graph:
+        EdgesOld = Array("edges_old", edges_old, mode="fill")
+        EdgesNew = Array("edges_new", edges_old[::4], mode="fill")
+        mat = RebinMatrix("Rebin Matrix", with_segments=True)
+        batch = RebinBatched("Rebin batch", nvectors=nvectors, method="matrix")
+        EdgesOld >> mat("edges_old")
+        EdgesNew >> mat("edges_new")
+        mat.outputs["matrix"] >> batch.inputs["matrix"]
+        for i in range(nvectors):
+            Array(f"Y{i}", linspace(1.0, 0.0, n - 1), mode="fill") >> batch.inputs[f"vector_{i}"]
+    batch.outputs["result_0"].data
+
+    report = memory_report(graph)
+    entries = {entry.name: entry for entry in report.entries}
+    matrix = entries["Rebin Matrix.matrix"]
+    assert matrix.nbytes == 5 * 20 * 8
+    assert not matrix.shared
+    assert matrix.estimates["float32"] == matrix.nbytes // 2
+    assert matrix.estimates["sparse"] == 20 * (8 + 4) + 6 * 4
+
+    # the results of the batch are views on a common buffer, counted once
+    results = [entries[f"Rebin batch.result_{i}"] for i in range(nvectors)]
+    assert all(entry.shared for entry in results)
+    summary = report.summary(batch)
+    assert summary["nbytes"] == nvectors * 5 * 8
+    assert summary["float32"] == summary["nbytes"] // 2
+    assert report.summary()["nbytes"] == summary["nbytes"] + report.summary(mat)["nbytes"]
+    assert "shared" in report.format(batch)
@@ -0,0 +1,54 @@
+from json import load
+
+from numpy import linspace
+
+from dagflow.core.graph import Graph
+from dagflow.lib.common import Array
+
+from dgf_detector.profiling import NodeProfiler
+from dgf_detector.Rebin import Rebin
+
+
+def test_NodeProfiler(tmp_path):
+    edges_old = linspace(0.0, 2.0, 21)
+    with Graph(close_on_exit=True) as graph:
+        EdgesOld = Array("edges_old", edges_old, mode="fill")
+        EdgesNew = Array("edges_new", edges_old[::2], mode="fill")
+        Y = Array("Y", linspace(3.0, 0.0, 20), mode="fill")
+        metanode = Rebin(mode="numba")
+
+        EdgesOld >> metanode.inputs["edges_old"]
+        EdgesNew >> metanode.inputs["edges_new"]
+        Y >> metanode()
+
+    (matrix,) = metanode._RebinMatrixList
+    function = matrix.function
+    with NodeProfiler(graph, trace=True) as profiler:
+        # only the dgf_detector nodes are attached for a graph
+        assert [timings.name for timings in profiler.timings()] == [matrix.name]
+        profiler.attach(metanode)
+        metanode.outputs[0].data
+        Y.outputs["array"].set(linspace(2.0, 0.0, 20))
+        metanode.outputs[0].data
+    assert matrix.function is function
+
+    (timings,) = profiler.timings(matrix)
+    assert timings.calls == 1
+    assert timings.input_size == 21 + 11
+    assert 0.0 < timings.last <= timings.time
+
+    summary = profiler.summary(metanode)
+    assert summary.calls == 3
+    assert summary.self_time <= summary.time
+    assert matrix.name in profiler.report(metanode)
+
+    # no calls are recorded after detaching
+    Y.outputs["array"].set(linspace(1.0, 0.0, 20))
+    metanode.outputs[0].data
+    assert profiler.summary(metanode).calls == 3
+
+    profiler.export_trace(tmp_path / "trace.json")
+    with open(tmp_path / "trace.json") as f:
+        events = load(f)["traceEvents"]
+    assert len(events) == 3
+    assert all(event["ph"] == "X" and event["dur"] >= 0.0 for event in events)
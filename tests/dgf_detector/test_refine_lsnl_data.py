@@ -0,0 +1,231 @@
+from numpy import (
+    allclose,
+    arange,
+    array_equal,
+    asarray,
+    exp,
+    fabs,
+    interp,
+    linspace,
+    memmap,
+    stack,
+)
+from numpy.random import default_rng
+from numpy.typing import NDArray
+from pytest import mark
+
+from multikeydict.nestedmkdict import NestedMKDict
+
+from dgf_detector.bundles.cross_check_refine_lsnl_data import cross_check_refine_lsnl_data
+from dgf_detector.bundles.refine_lsnl_data import (
+    LazyRefinedCurve,
+    RefineGraph,
+    _cache_key,
+    clean_refine_cache,
+    refine_lsnl_data,
+)
+
+settings = dict(refine_times=4, newmin=0.0, newmax=13.0)
+
+
+def make_storage() -> NestedMKDict:
+    x = linspace(0.5, 12.0, 60)
+    nominal = 1.0 + 0.05 * exp(-x / 3.0)
+    storage = NestedMKDict({"x": x, "nominal": nominal}, sep=".")
+    for i in range(1, 4):
+        storage[f"pull{i}"] = nominal + 0.01 * i * exp(-x / 5.0)
+    return storage
+
+
+def refine(cache_dir=None, **kwargs) -> NestedMKDict:
+    storage = make_storage()
+    refine_lsnl_data(storage, xname="x", nominalname="nominal", cache_dir=cache_dir, **kwargs)
+    return storage
+
+
+def assert_same(storage: NestedMKDict, check: NestedMKDict):
+    for key, array in check.walkitems():
+        assert allclose(storage[key], array, atol=0, rtol=0)
+
+
+@mark.parametrize("refine_times", (1, 4))
+@mark.parametrize("savgol_filter_smoothen", (None, (5, 2)))
+def test_refine_lsnl_data_operators(
+    refine_times: int, savgol_filter_smoothen: tuple[int, int] | None
+):
+    kwargs = dict(
+        settings, refine_times=refine_times, savgol_filter_smoothen=savgol_filter_smoothen
+    )
+    storage = refine(**kwargs)
+
+    # the curves, refined one by one, the nominal first
+    coarse = make_storage()
+    refiner = RefineGraph(coarse["x"], **kwargs)
+    nominal = refiner.process(coarse["nominal"], coarse["nominal"])
+    assert allclose(storage["x"], refiner.xfine_extended, atol=0, rtol=0)
+    assert allclose(storage["nominal"], nominal, atol=1e-13, rtol=0)
+    for key, ycoarse in coarse.walkitems():
+        if key in (("x",), ("nominal",)):
+            continue
+        assert allclose(storage[key], refiner.process(ycoarse, nominal), atol=1e-13, rtol=0)
+
+
+@mark.parametrize("refine_tolerance", (1.0e-4, 1.0e-6))
+def test_RefineGraph_adaptive(refine_tolerance: float):
+    from scipy.interpolate import make_interp_spline
+
+    coarse = make_storage()
+    x = coarse["x"]
+    yreference = stack([y for key, y in coarse.walkitems() if key != ("x",)])
+    # `refine_times` is large enough not to limit the number of the fine intervals
+    refine_times = 100
+    refiner = RefineGraph(
+        x,
+        refine_times=refine_times,
+        newmin=0.0,
+        newmax=13.0,
+        refine_tolerance=refine_tolerance,
+        yreference=yreference,
+        grid_only=True,
+    )
+    xfine = refiner.xfine_bound
+    assert xfine[0] == x[0] and xfine[-1] == x[-1]
+    assert xfine.size < (x.size - 1) * refine_times + 1
+
+    # the linear interpolation between the fine points is within the tolerance
+    spline = make_interp_spline(x, yreference * x, k=3, axis=1)
+    xdense = linspace(x[0], x[-1], 20000)
+    yfine = spline(xfine)
+    for ydense, yfinei in zip(spline(xdense), yfine):
+        assert fabs(interp(xdense, xfine, yfinei) - ydense).max() <= refine_tolerance
+
+
+def test_RefineGraph_adaptive_defaults():
+    coarse = make_storage()
+    x = coarse["x"]
+    yreference = stack([y for key, y in coarse.walkitems() if key != ("x",)])
+    fixed = RefineGraph(x, **settings)
+    default = RefineGraph(x, **settings, yreference=yreference)
+    assert array_equal(default.xfine_extended, fixed.xfine_extended)
+
+    # a tight tolerance splits each interval `refine_times` times
+    adaptive = RefineGraph(x, **settings, refine_tolerance=1.0e-15, yreference=yreference)
+    assert allclose(adaptive.xfine_extended, fixed.xfine_extended, atol=1.0e-14, rtol=0)
+    assert allclose(adaptive.operator, fixed.operator, atol=1.0e-12, rtol=0)
+
+
+def test_refine_lsnl_data_lazy(tmp_path):
+    check = refine(**settings)
+    storage = refine(tmp_path, lazy=True, **settings)
+
+    # the lazy results are not written to the cache
+    assert not list(tmp_path.iterdir())
+
+    curves = {key: curve for key, curve in storage.walkitems() if key != ("x",)}
+    assert all(isinstance(curve, LazyRefinedCurve) for curve in curves.values())
+    assert not any(curve.refined for curve in curves.values())
+    assert allclose(storage["x"], check["x"], atol=0, rtol=0)
+
+    for key, curve in curves.items():
+        assert curve.shape == check[key].shape
+        value = curve.value
+        assert curve.refined
+        # the value is memoized
+        assert curve.value is value
+        assert asarray(curve) is value
+        assert allclose(value, check[key], atol=1e-13, rtol=0)
+
+
+def test_refine_lsnl_data_cache(tmp_path):
+    check = refine(**settings)
+
+    # miss: the results are computed and written
+    storage = refine(tmp_path, **settings)
+    assert not any(isinstance(array, memmap) for _, array in storage.walkitems())
+    assert_same(storage, check)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # hit: the results are memory mapped
+    storage = refine(tmp_path, **settings)
+    assert all(isinstance(array, memmap) for _, array in storage.walkitems())
+    assert_same(storage, check)
+
+    # other settings: the other entry
+    storage = refine(tmp_path, **dict(settings, refine_times=2))
+    assert not any(isinstance(array, memmap) for _, array in storage.walkitems())
+    assert len(list(tmp_path.iterdir())) == 2
+
+    assert clean_refine_cache(tmp_path) == 0
+    assert clean_refine_cache(tmp_path, max_age=-1.0) == 2
+    assert not list(tmp_path.iterdir())
+
+
+def test_refine_lsnl_data_cache_key():
+    storage = make_storage()
+    yreference = default_rng(1).uniform(size=(4, 1000))
+    key = _cache_key(storage, "x", "nominal", dict(settings, yreference=yreference))
+
+    # the change of an array setting, hidden by the truncated repr()
+    yreference2 = yreference.copy()
+    yreference2[2, 500] += 1.0e-6
+    assert repr(yreference2) == repr(yreference)
+    assert _cache_key(storage, "x", "nominal", dict(settings, yreference=yreference2)) != key
+    assert _cache_key(storage, "x", "nominal", dict(settings, yreference=yreference.copy())) == key
+
+    assert _cache_key(storage, "x", "nominal", dict(settings, refine_times=2)) != key
+    storage["pull1"][10] += 1.0e-12
+    assert _cache_key(storage, "x", "nominal", dict(settings, yreference=yreference)) != key
+
+
+def test_refine_lsnl_data_cache_corrupt(tmp_path):
+    check = refine(**settings)
+    refine(tmp_path, **settings)
+    (entry,) = tmp_path.iterdir()
+
+    # damage the data of an array, keeping the header valid
+    path = entry / "1.npy"
+    data = bytearray(path.read_bytes())
+    data[-3] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    # the entry is removed, the results are computed and written again
+    storage = refine(tmp_path, **settings)
+    assert not any(isinstance(array, memmap) for _, array in storage.walkitems())
+    assert_same(storage, check)
+
+    storage = refine(tmp_path, **settings)
+    assert all(isinstance(array, memmap) for _, array in storage.walkitems())
+    assert_same(storage, check)
+
+
+def assert_cross_check(xcheck: NDArray, **kwargs):
+    """The linear interpolation of the curves, one by one, the nominal first"""
+    from scipy.interpolate import interp1d
+
+    coarse = make_storage()
+    checks = {}
+    for key, y in coarse.walkitems():
+        if key == ("x",):
+            continue
+        fcn = interp1d(coarse["x"], y, kind="linear", bounds_error=False, fill_value="extrapolate")
+        checks[key] = fcn(xcheck) * xcheck
+    for key, check in checks.items():
+        if key != ("nominal",):
+            check -= checks[("nominal",)]
+
+    storage = make_storage()
+    cross_check_refine_lsnl_data(storage, xname="x", nominalname="nominal", **kwargs)
+    assert allclose(storage["x"], xcheck, atol=0, rtol=0)
+    for key, check in checks.items():
+        assert allclose(storage[key], check, atol=1e-13, rtol=0)
+
+
+def test_cross_check_refine_lsnl_data():
+    # the default grid
+    assert_cross_check(arange(0.0, 12.0000001, 0.05), newmin=0.0, newmax=13.0)
+
+
+def test_cross_check_refine_lsnl_data_grid():
+    xfine = linspace(0.3, 13.0, 77)
+    assert_cross_check(xfine, newmin=0.0, newmax=13.0, xfine=xfine)
+    assert_cross_check(arange(0.5, 10.0000001, 0.1), newmin=0.0, newmax=13.0, step=0.1, xrange=(0.5, 10.0))
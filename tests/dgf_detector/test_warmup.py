@@ -0,0 +1,25 @@
+from os import listdir
+
+from numpy import empty, linspace
+
+from dgf_detector.EnergyResolutionSigmaRelABC import _rel_sigma
+from dgf_detector.warmup import KernelSignatures, set_cache_dir, warmup
+
+
+def test_warmup(tmp_path):
+    module = "dgf_detector.EnergyResolutionSigmaRelABC"
+    try:
+        timings = warmup(("d", "f"), cache_dir=tmp_path, modules=(module,))
+    finally:
+        set_cache_dir(None)
+
+    assert tuple(timings) == tuple(f"{module}.{name}" for name in KernelSignatures[module])
+    assert listdir(tmp_path)
+
+    # the nodes call the kernels with the declared signatures: no further compilation
+    nsignatures = len(_rel_sigma.signatures)
+    assert nsignatures >= 2
+    for dtype in ("d", "f"):
+        energy = linspace(1.0, 10.0, 10, dtype=dtype)
+        _rel_sigma(energy[0], energy[1], energy[2], energy, empty(10, dtype=dtype))
+    assert len(_rel_sigma.signatures) == nsignatures